@@ -30,8 +30,12 @@ def install_pyinstaller():
         return False
 
 
-def build_executable():
-    """Build the executable using PyInstaller"""
+def build_executable(onedir=False):
+    """Build the executable using PyInstaller
+
+    A one-file executable unpacks itself to a temporary directory on every
+    start; ``onedir`` builds a directory instead, which starts much faster.
+    """
     if not check_pyinstaller():
         if not install_pyinstaller():
             print("Cannot proceed without PyInstaller")
@@ -51,7 +55,7 @@ def build_executable():
         cmd = [
             sys.executable, "-m", "PyInstaller",
             "--name", "ConnectionMonitor",
-            "--onefile",
+            "--onedir" if onedir else "--onefile",
             "--console",
             "--add-data", "connection_monitor:connection_monitor",
             # Hidden imports for all dependencies
@@ -78,7 +82,7 @@ def build_executable():
         # Check if dist directory exists
         if os.path.exists("dist"):
             exe_name = "ConnectionMonitor.exe" if sys.platform == "win32" else "ConnectionMonitor"
-            exe_path = os.path.join("dist", exe_name)
+            exe_path = os.path.join("dist", "ConnectionMonitor", exe_name) if onedir else os.path.join("dist", exe_name)
             if os.path.exists(exe_path):
                 print(f"\nExecutable created at: {os.path.abspath(exe_path)}")
                 print(f"File size: {os.path.getsize(exe_path) / 1024 / 1024:.2f} MB")
@@ -106,12 +110,13 @@ def main():
     script_dir = os.path.dirname(os.path.abspath(__file__))
     os.chdir(script_dir)
     
-    # Build executable
-    if build_executable():
+    # Build executable; --onedir trades the single file for a fast start
+    if build_executable(onedir="--onedir" in sys.argv):
         print("\nBuild process completed!")
         print("\nTo run the executable:")
         print("  dist\\ConnectionMonitor.exe              (for interface selection)")
         print("  dist\\ConnectionMonitor.exe --console    (for console interface only)")
+        print("  dist\\ConnectionMonitor.exe --interface web (or console/wx, without the menu)")
     else:
         print("\nBuild process failed!")
         sys.exit(1)
@@ -0,0 +1,190 @@
+"""
+Per-connection and per-process throughput
+
+Backends that can read kernel socket counters (the netlink backend, from
+``tcp_info``) set :attr:`Connection.counters`. :class:`BandwidthTracker`
+turns them into rates by differencing consecutive ticks; the previous
+counters and the rates live in flat ``array`` buffers, one fixed-width slot
+per connection, so tracking 100k sockets costs a few megabytes rather than
+a Python object each.
+
+Processes whose sockets carry no counters (other backends or platforms) fall
+back to the process's ``io_counters`` character counts, which include socket
+reads and writes but also file I/O, so they are an upper bound. Those are
+system calls, so they are sampled by :meth:`BandwidthTracker.resolve` in a
+worker thread and :meth:`BandwidthTracker.apply` only reads the samples.
+"""
+
+import heapq
+import time
+from array import array
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+import psutil
+
+from connection_monitor.collector import Connection, Snapshot
+
+# Order of Connection.counters and of each slot in the tracker's arrays
+FIELDS = ("tx_bytes", "rx_bytes", "tx_packets", "rx_packets")
+WIDTH = len(FIELDS)
+
+# pid -> (process name, rx bytes/s, tx bytes/s)
+ProcessRates = Dict[int, Tuple[str, float, float]]
+# (monotonic time, read chars, written chars) of one io_counters sample
+IoSample = Tuple[float, int, int]
+
+
+def total_rate(conn: Connection) -> float:
+    return conn.rx_rate + conn.tx_rate
+
+
+def top(connections: Iterable[Connection], n: int, key: Callable[[Connection], float] = total_rate) -> List[Connection]:
+    """The ``n`` busiest connections, largest first, in O(len * log n)."""
+    return heapq.nlargest(n, connections, key=key)
+
+
+def format_rate(value: float) -> str:
+    """Bytes per second in a short human form: ``0``, ``512``, ``1.5K``, ``12M``."""
+    for unit in ("", "K", "M", "G"):
+        if value < 1000 or unit == "G":
+            break
+        value /= 1000
+    if not unit:
+        return str(round(value))
+    return f"{value:.1f}{unit}" if value < 10 else f"{value:.0f}{unit}"
+
+
+class BandwidthTracker:
+    """Enricher that sets the ``*_rate``/``*_pps`` fields of every connection.
+
+    Rates are averaged over the time between the two snapshots. A connection
+    seen for the first time has no rate yet; slots of closed connections are
+    reused by new ones, so the arrays only grow to the peak connection count.
+    """
+
+    def __init__(self, process_fallback: bool = True) -> None:
+        self.process_fallback = process_fallback
+        self.timestamp: Optional[float] = None
+        self.slots: Dict[Hashable, int] = {}
+        self.previous = array("Q")
+        self.rates = array("d")
+        self.free: List[int] = []
+        self.processes: ProcessRates = {}
+        # pid -> (previous, latest) io_counters samples, written by resolve
+        self._io: Dict[int, Tuple[Optional[IoSample], IoSample]] = {}
+
+    def apply(self, snapshot: Snapshot) -> Set[Hashable]:
+        elapsed = snapshot.timestamp - self.timestamp if self.timestamp is not None else 0.0
+        self.timestamp = snapshot.timestamp
+        previous, rates = self.previous, self.rates
+        slots: Dict[Hashable, int] = {}
+        processes: Dict[int, List[Any]] = {}
+        uncounted: Dict[int, str] = {}
+        for conn in snapshot:
+            counters = conn.counters
+            if counters is None:
+                if conn.pid:
+                    uncounted[conn.pid] = conn.process or ""
+                continue
+            key = conn.key
+            slot = self.slots.pop(key, None)
+            if slot is None:
+                slot = self._allocate()
+                base = slot * WIDTH
+                for i in range(WIDTH):
+                    previous[base + i] = counters[i]
+                    rates[base + i] = 0.0
+            else:
+                base = slot * WIDTH
+                for i in range(WIDTH):
+                    step = counters[i] - previous[base + i]
+                    # a shrinking counter means the 5-tuple was reused by a new socket
+                    rates[base + i] = step / elapsed if step > 0 and elapsed > 0 else 0.0
+                    previous[base + i] = counters[i]
+            slots[key] = slot
+            conn.tx_rate, conn.rx_rate, conn.tx_pps, conn.rx_pps = rates[base : base + WIDTH]
+            if conn.pid:
+                totals = processes.setdefault(conn.pid, [conn.process or "", 0.0, 0.0])
+                totals[1] += conn.rx_rate
+                totals[2] += conn.tx_rate
+        # whatever was not seen this tick has closed
+        self.free.extend(self.slots.values())
+        self.slots = slots
+        process_rates: ProcessRates = {pid: tuple(totals) for pid, totals in processes.items()}
+        missing: Set[Hashable] = set()
+        if self.process_fallback:
+            missing.update(pid for pid in uncounted if pid not in process_rates)
+            self._io_rates(process_rates, uncounted)
+        # replaced, never mutated, so other threads can read it without a lock
+        self.processes = process_rates
+        # the fallback's processes are sampled again for the next snapshot
+        return missing
+
+    async def resolve(self, keys: Set[Hashable]) -> None:
+        """Sample ``io_counters`` of the processes ``keys`` in a worker thread."""
+        import asyncio
+
+        await asyncio.get_running_loop().run_in_executor(None, self._sample_io, keys)
+
+    def top_processes(self, n: int) -> List[Tuple[int, str, float, float]]:
+        """``(pid, name, rx, tx)`` of the ``n`` processes moving the most bytes, largest first."""
+        busiest = heapq.nlargest(n, self.processes.items(), key=lambda item: item[1][1] + item[1][2])
+        return [(pid, name, rx, tx) for pid, (name, rx, tx) in busiest]
+
+    def stats(self) -> Dict[str, int]:
+        return {"tracked": len(self.slots), "free": len(self.free), "processes": len(self.processes)}
+
+    def _allocate(self) -> int:
+        if self.free:
+            return self.free.pop()
+        self.previous.extend([0] * WIDTH)
+        self.rates.extend([0.0] * WIDTH)
+        return len(self.rates) // WIDTH - 1
+
+    def _io_rates(self, rates: ProcessRates, pids: Dict[int, str]) -> None:
+        """Rates of ``pids`` without socket counters from their last two ``io_counters`` samples."""
+        samples = self._io
+        for pid, name in pids.items():
+            if pid in rates:
+                continue
+            before, latest = samples.get(pid, (None, None))
+            if before is None or latest is None or latest[0] <= before[0]:
+                continue
+            elapsed = latest[0] - before[0]
+            rates[pid] = (name, max(latest[1] - before[1], 0) / elapsed, max(latest[2] - before[2], 0) / elapsed)
+        if any(pid not in pids for pid in samples):
+            # forget processes whose sockets are gone or now have counters
+            self._io = {pid: pair for pid, pair in samples.items() if pid in pids}
+
+    def _sample_io(self, pids: Iterable[Any]) -> None:
+        for pid in pids:
+            try:
+                io = psutil.Process(pid).io_counters()
+            except (psutil.Error, AttributeError, OSError):
+                continue
+            # read_chars/write_chars (Linux) count every read()/write(), sockets included
+            sample = (
+                time.monotonic(),
+                getattr(io, "read_chars", io.read_bytes),
+                getattr(io, "write_chars", io.write_bytes),
+            )
+            previous = self._io.get(pid)
+            self._io[pid] = (previous[1] if previous is not None else None, sample)
+
+
+def find_tracker(enrichers: Sequence[object]) -> Optional[BandwidthTracker]:
+    for enricher in enrichers:
+        if isinstance(enricher, BandwidthTracker):
+            return enricher
+    return None
+
+
+def busiest(connections: Iterable[Connection], tracker: Optional[BandwidthTracker], limit: int = 10) -> Dict[str, Any]:
+    """The ``limit`` busiest connections and processes, as served by the ``/api/bandwidth`` endpoints."""
+    processes = tracker.top_processes(limit) if tracker is not None else []
+    return {
+        "connections": [conn.as_row() for conn in top(connections, limit)],
+        "processes": [
+            {"pid": pid, "process": name, "rx_rate": round(rx), "tx_rate": round(tx)} for pid, name, rx, tx in processes
+        ],
+    }
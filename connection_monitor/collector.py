@@ -0,0 +1,323 @@
+"""
+Shared connection collection engine used by the console, web and wx monitors
+"""
+
+import socket
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import psutil
+
+from connection_monitor.process_cache import ProcessCache
+
+PROTO_NAMES: Dict[int, str] = {socket.SOCK_STREAM: "tcp", socket.SOCK_DGRAM: "udp"}
+
+# Names accepted by create_backend and the monitors' --backend option.
+BACKENDS = ("psutil", "proc", "netlink", "auto")
+
+
+class Connection:
+    """A single reportable connection.
+
+    Addresses are kept as raw ip/port fields; the ``ip:port`` strings the UIs
+    display are only built on demand.
+    """
+
+    __slots__ = (
+        "pid",
+        "process",
+        "family",
+        "type",
+        "laddr_ip",
+        "laddr_port",
+        "raddr_ip",
+        "raddr_port",
+        "status",
+        "hostname",
+        "country",
+        "asn",
+        "as_org",
+        "counters",
+        "tx_rate",
+        "rx_rate",
+        "tx_pps",
+        "rx_pps",
+    )
+
+    def __init__(
+        self,
+        pid: Optional[int],
+        process: Optional[str],
+        family: int,
+        type: int,
+        laddr_ip: str,
+        laddr_port: int,
+        raddr_ip: str,
+        raddr_port: int,
+        status: str,
+    ) -> None:
+        self.pid = pid
+        self.process = process
+        self.family = family
+        self.type = type
+        self.laddr_ip = laddr_ip
+        self.laddr_port = laddr_port
+        self.raddr_ip = raddr_ip
+        self.raddr_port = raddr_port
+        self.status = status
+        # filled in by enrichment (reverse DNS, GeoIP) when enabled
+        self.hostname: Optional[str] = None
+        self.country = ""
+        self.asn = 0
+        self.as_org = ""
+        # cumulative (tx bytes, rx bytes, tx packets, rx packets) when the
+        # backend can read them, and the per-second rates derived from them
+        self.counters: Optional[Tuple[int, int, int, int]] = None
+        self.tx_rate = 0.0
+        self.rx_rate = 0.0
+        self.tx_pps = 0.0
+        self.rx_pps = 0.0
+
+    @property
+    def local(self) -> str:
+        return f"{self.laddr_ip}:{self.laddr_port}"
+
+    @property
+    def remote(self) -> str:
+        return f"{self.raddr_ip}:{self.raddr_port}"
+
+    @property
+    def remote_name(self) -> str:
+        """``host:port`` once reverse DNS has named the remote address, else :attr:`remote`."""
+        if self.hostname:
+            return f"{self.hostname}:{self.raddr_port}"
+        return self.remote
+
+    @property
+    def asn_text(self) -> str:
+        return f"AS{self.asn}" if self.asn else ""
+
+    @property
+    def key(self) -> Tuple[int, str, int, str, int, Optional[int]]:
+        """Identity of the connection across ticks: the 5-tuple plus owning pid."""
+        return (self.type, self.laddr_ip, self.laddr_port, self.raddr_ip, self.raddr_port, self.pid)
+
+    @property
+    def pid_text(self) -> str:
+        return str(self.pid) if self.pid else "N/A"
+
+    @property
+    def proto(self) -> str:
+        return PROTO_NAMES.get(self.type, "?")
+
+    def differs(self, other: "Connection") -> bool:
+        """True if a displayed field outside :attr:`key` differs from ``other``."""
+        return self.status != other.status or self.process != other.process or self.hostname != other.hostname
+
+    def rates_differ(self, other: "Connection") -> bool:
+        """True if the displayed (whole bytes per second) rates differ from ``other``'s."""
+        return round(self.rx_rate) != round(other.rx_rate) or round(self.tx_rate) != round(other.tx_rate)
+
+    def matches(self, text: str) -> bool:
+        """Case-insensitive substring match on any displayed column; ``text`` must be lower case."""
+        return (
+            text in (self.process or "").lower()
+            or text in self.pid_text
+            or text in self.local
+            or text in self.remote
+            or text in (self.hostname or "").lower()
+            or text in self.country.lower()
+            or text in self.asn_text.lower()
+            or text in self.as_org.lower()
+            or text in self.status.lower()
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the row in the shape the front-ends have always displayed."""
+        return {
+            "process": self.process,
+            "pid": self.pid_text,
+            "local": self.local,
+            "remote": self.remote,
+            "status": self.status,
+        }
+
+    def as_row(self) -> Dict[str, Any]:
+        """:meth:`as_dict` plus the enrichment fields, as served to web clients and the API."""
+        row = self.as_dict()
+        row.update(hostname=self.hostname, country=self.country, asn=self.asn, as_org=self.as_org)
+        row.update(self.rates())
+        return row
+
+    def rates(self) -> Dict[str, float]:
+        """Throughput fields as sent to clients: whole bytes and tenths of packets per second."""
+        return {
+            "rx_rate": round(self.rx_rate),
+            "tx_rate": round(self.tx_rate),
+            "rx_pps": round(self.rx_pps, 1),
+            "tx_pps": round(self.tx_pps, 1),
+        }
+
+    def __repr__(self) -> str:
+        return f"Connection({self.process!r}, {self.pid_text}, {self.local} -> {self.remote}, {self.status})"
+
+
+# Sort keys for the displayed columns, shared by the interactive front-ends.
+SORT_KEYS = {
+    "process": lambda conn: (conn.process or "").lower(),
+    "pid": lambda conn: conn.pid or 0,
+    "local": lambda conn: (conn.laddr_ip, conn.laddr_port),
+    "remote": lambda conn: (conn.raddr_ip, conn.raddr_port),
+    "status": lambda conn: conn.status,
+    "country": lambda conn: conn.country,
+    "asn": lambda conn: conn.asn,
+    "rx": lambda conn: conn.rx_rate,
+    "tx": lambda conn: conn.tx_rate,
+}
+# Columns whose first sort is largest first
+DESCENDING_KEYS = frozenset({"rx", "tx"})
+
+
+class Snapshot:
+    """All reportable connections seen during one collection tick."""
+
+    __slots__ = ("connections", "timestamp", "limited")
+
+    def __init__(self, connections: List[Connection], timestamp: float, limited: bool = False) -> None:
+        self.connections = connections
+        self.timestamp = timestamp
+        # True when the system-wide listing was denied and only per-process
+        # connections could be gathered.
+        self.limited = limited
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    def __iter__(self) -> Iterator[Connection]:
+        return iter(self.connections)
+
+
+def is_reportable(status: str, raddr: Any) -> bool:
+    """The filter every monitor applies: skip unconnected and listening sockets."""
+    return status != "NONE" and bool(raddr)
+
+
+def _from_psutil(conn: Any, pid: Optional[int], process: Optional[str]) -> Connection:
+    return Connection(
+        pid,
+        process,
+        conn.family,
+        conn.type,
+        conn.laddr.ip,
+        conn.laddr.port,
+        conn.raddr.ip,
+        conn.raddr.port,
+        conn.status,
+    )
+
+
+class PsutilBackend:
+    """Collect connections through ``psutil.net_connections``."""
+
+    name = "psutil"
+
+    def __init__(self, process_cache: Optional[ProcessCache] = None) -> None:
+        self.process_cache = process_cache
+        # sockets listed by the last collect, reportable or not
+        self.scanned = 0
+
+    def collect(self) -> Tuple[List[Connection], bool]:
+        """Return ``(connections, limited)``.
+
+        Rows gathered system-wide carry ``process=None``; the collector fills
+        in names afterwards.
+        """
+        connections = []
+        self.scanned = 0
+        try:
+            for conn in psutil.net_connections(kind="inet"):
+                self.scanned += 1
+                if not is_reportable(conn.status, conn.raddr):
+                    continue
+                connections.append(_from_psutil(conn, conn.pid, None))
+        except (psutil.AccessDenied, PermissionError):
+            return self._collect_per_process(), True
+        return connections, False
+
+    def _collect_per_process(self) -> List[Connection]:
+        connections = []
+        for proc in psutil.process_iter(["pid", "name", "create_time"]):
+            if self.process_cache is not None:
+                self.process_cache.observe(proc.info["pid"], proc.info["create_time"])
+            try:
+                for conn in proc.connections(kind="inet"):
+                    self.scanned += 1
+                    if not is_reportable(conn.status, conn.raddr):
+                        continue
+                    connections.append(_from_psutil(conn, proc.info["pid"], proc.info["name"]))
+            except (psutil.AccessDenied, psutil.NoSuchProcess):
+                continue
+        return connections
+
+
+def create_backend(name: str = "psutil", process_cache: Optional[ProcessCache] = None) -> Any:
+    """Return the collection backend called ``name``.
+
+    Platform specific backends fall back to psutil when they are not
+    available on this host; ``auto`` picks the fastest one that is.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}, expected one of: {', '.join(BACKENDS)}")
+    if name in ("netlink", "auto"):
+        from connection_monitor.netlink import NetlinkBackend
+
+        if NetlinkBackend.available():
+            return NetlinkBackend(process_cache)
+    if name in ("proc", "auto"):
+        from connection_monitor.procnet import ProcNetBackend
+
+        if ProcNetBackend.available():
+            return ProcNetBackend()
+    return PsutilBackend(process_cache)
+
+
+class ConnectionCollector:
+    """Produce a :class:`Snapshot` per call from the configured backend.
+
+    ``backend`` is either a backend name (see :data:`BACKENDS`) or an object
+    with a ``collect()`` method returning ``(connections, limited)``. With
+    ``resolve_names`` off, connections whose backend did not name the process
+    keep ``process=None`` for an enrichment stage to fill in later.
+    """
+
+    def __init__(
+        self,
+        backend: Any = None,
+        process_cache: Optional[ProcessCache] = None,
+        resolve_names: bool = True,
+    ) -> None:
+        self.process_cache = process_cache or ProcessCache()
+        self.resolve_names = resolve_names
+        if backend is None or isinstance(backend, str):
+            backend = create_backend(backend or "psutil", self.process_cache)
+        self.backend = backend
+        # what the last collect went through: sockets listed and processes owning the reported ones
+        self.scanned: Dict[str, int] = {}
+
+    def get_process_name(self, pid: int) -> str:
+        return self.process_cache.name(pid)
+
+    def collect(self) -> Snapshot:
+        self.process_cache.begin_tick()
+        connections, limited = self.backend.collect()
+        for conn in connections:
+            if conn.process is None:
+                if not conn.pid:
+                    conn.process = "System"
+                elif self.resolve_names:
+                    conn.process = self.get_process_name(conn.pid)
+        self.scanned = {
+            "sockets": getattr(self.backend, "scanned", len(connections)),
+            "processes": len({conn.pid for conn in connections if conn.pid}),
+        }
+        return Snapshot(connections, time.time(), limited)
@@ -1,143 +1,395 @@
 #!/usr/bin/env python3
-import psutil
-import time
-import os
-import sys
+import shutil
 from datetime import datetime
 import threading
-from collections import defaultdict
+import heapq
+from typing import Callable, List, Optional, Tuple
+
+from connection_monitor.bandwidth import format_rate
+from connection_monitor.alerts import AlertEngine, load_rules
+from connection_monitor.collector import DESCENDING_KEYS, SORT_KEYS, Connection, ConnectionCollector
+from connection_monitor.console_render import ScreenRenderer
+from connection_monitor.diff import Delta, DiffEngine
+from connection_monitor.export import open_exporter
+from connection_monitor.groups import DIMENSIONS, Group, GroupCounts, group_label, parse_dimensions
+from connection_monitor.history import open_history
+from connection_monitor.instrumentation import Instruments, open_profiler
+from connection_monitor.pipeline import Enrichment, build_enrichers
+from connection_monitor.scheduler import Scheduler
+
+
+WIDTH = 124
+# Lines of each frame that are not connection rows (header, footer, prompt)
+CHROME_LINES = 15
 
 
 class ConsoleNetworkMonitor:
-    def __init__(self):
+    def __init__(
+        self,
+        backend=None,
+        interval=2.0,
+        cpu_budget=None,
+        history=None,
+        resolve=False,
+        geoip=None,
+        export=None,
+        export_rotate=None,
+        alerts=None,
+        profile=None,
+        profile_ticks=None,
+        retention_days=None,
+    ):
         self.monitoring = False
         self.connections_data = []
-        
+        self.collector = ConnectionCollector(backend)
+        self.diff = DiffEngine()
+        self.last_delta = None
+        self.history = open_history(history, retention_days)
+        if self.history:
+            self.diff.listeners.append(self.history.record)
+        # Streaming file export; the writer thread never holds up a tick
+        self.exporter = open_exporter(export, export_rotate) if export else None
+        if self.exporter:
+            self.diff.listeners.append(self.exporter.record)
+        # Alert rules; the footer shows the latest alert, so logging over the screen is turned off
+        self.alerts = AlertEngine(load_rules(alerts), {"log": lambda alert: None}) if alerts else None
+        if self.alerts:
+            self.diff.listeners.append(self.alerts.record)
+        # Cached enrichment (GeoIP, reverse DNS) applied to each snapshot; lookups run in the background
+        self.enrichment = Enrichment(build_enrichers(resolve, geoip))
+        if self.enrichment.enrichers:
+            self.enrichment.start()
+        self.limited = False
+        self.renderer = ScreenRenderer()
+        # What the monitor itself costs, for the footer; --profile runs the first ticks under cProfile
+        self.instruments = Instruments(self.collector, self.enrichment.enrichers)
+        self.profiler = open_profiler(profile, profile_ticks)
+        self.scheduler_options = {"interval": interval, "cpu_budget": cpu_budget, "profiler": self.profiler}
+        self.scheduler = Scheduler(**self.scheduler_options)
+
+        # View state; changing it re-renders the last snapshot without refetching
+        self.page = 0
+        self.sort_column = None
+        self.sort_ascending = True
+        self.filter_text = ""
+        self.groups: Optional[GroupCounts] = None  # while the group-by view is shown
+        self.group_page: List[Group] = []  # groups listed on the current page, for drill-down
+        self.drill: Optional[Tuple[GroupCounts, Group]] = None  # group whose members are shown
+
     def clear_screen(self):
-        os.system('clear' if os.name == 'posix' else 'cls')
-        
-    def get_process_name(self, pid):
-        try:
-            process = psutil.Process(pid)
-            return process.name()
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            return "Unknown"
-    
+        self.renderer.invalidate()
+
     def get_connections(self):
-        connections = []
-        try:
-            for conn in psutil.net_connections(kind='inet'):
-                if conn.status == 'NONE' or not conn.raddr:
-                    continue
-                    
-                process_name = self.get_process_name(conn.pid) if conn.pid else "System"
-                
-                local_addr = f"{conn.laddr.ip}:{conn.laddr.port}"
-                remote_addr = f"{conn.raddr.ip}:{conn.raddr.port}" if conn.raddr else "N/A"
-                
-                connections.append({
-                    'process': process_name,
-                    'pid': str(conn.pid) if conn.pid else "N/A",
-                    'local': local_addr,
-                    'remote': remote_addr,
-                    'status': conn.status
-                })
-        except (psutil.AccessDenied, PermissionError) as e:
-            # Try to get at least some connections without root
-            print(f"\nNote: Running without root privileges. Some connections may not be visible.")
-            print("For full access, run with: sudo python main.py\n")
-            
-            for proc in psutil.process_iter(['pid', 'name']):
-                try:
-                    for conn in proc.connections(kind='inet'):
-                        if conn.status == 'NONE' or not conn.raddr:
-                            continue
-                            
-                        local_addr = f"{conn.laddr.ip}:{conn.laddr.port}"
-                        remote_addr = f"{conn.raddr.ip}:{conn.raddr.port}"
-                        
-                        connections.append({
-                            'process': proc.info['name'],
-                            'pid': str(proc.info['pid']),
-                            'local': local_addr,
-                            'remote': remote_addr,
-                            'status': conn.status
-                        })
-                except (psutil.AccessDenied, psutil.NoSuchProcess):
-                    continue
-                    
+        snapshot = self.instruments.timed("collect", self.collector.collect)
+        self.instruments.timed("enrich", self.enrichment.apply, snapshot)
+        self.limited = snapshot.limited
+        self.last_delta = self.instruments.timed("diff", self.diff.update, snapshot)
+        return snapshot.connections
+
+    def refresh(self) -> None:
+        self.connections_data = self.get_connections()
+        self.display_connections()
+
+    def page_size(self) -> int:
+        rows = shutil.get_terminal_size((WIDTH, 24)).lines - CHROME_LINES
+        return max(rows, 5)
+
+    def filtered_connections(self) -> List[Connection]:
+        connections = self.connections_data
+        if self.drill:
+            groups, group = self.drill
+            current = self.diff.current
+            connections = [current[key] for key in groups.member_keys(group) if key in current]
+        if self.filter_text:
+            connections = [conn for conn in connections if conn.matches(self.filter_text)]
         return connections
-    
-    def display_connections(self):
-        self.clear_screen()
-        
-        print("=" * 100)
-        print(f"CONNECTION MONITOR - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print("=" * 100)
-        print(f"{'Process':<25} {'PID':<8} {'Local Address':<22} {'Remote Address':<22} {'Status':<12}")
-        print("-" * 100)
-        
-        connections = self.get_connections()
-        self.connections_data = connections
-        
+
+    def group_by(self, names: Tuple[str, ...]) -> None:
+        """Show counts grouped by ``names``, kept up to date from each tick's delta."""
+        groups = GroupCounts(names)
+        delta = self.diff.last_delta
+        if delta is not None:
+            groups.reset(delta.snapshot, delta.snapshot)
+        self.diff.listeners = [*self.diff.listeners, groups.record]
+        self.groups = groups
+        self.release_groups()
+
+    def release_groups(self) -> None:
+        """Stop maintaining group counts nothing is showing any more."""
+        in_use = [self.groups, self.drill[0] if self.drill else None]
+
+        def wanted(listener: Callable[[Delta], None]) -> bool:
+            owner = getattr(listener, "__self__", None)
+            return not isinstance(owner, GroupCounts) or owner in in_use
+
+        self.diff.listeners = [listener for listener in self.diff.listeners if wanted(listener)]
+
+    def ordered(self, connections: List[Connection], limit: int) -> List[Connection]:
+        """The first ``limit`` of ``connections`` in display order."""
+        if not self.sort_column:
+            return connections[:limit]
+        key = SORT_KEYS[self.sort_column]
+        if limit < len(connections):
+            # a heap over the pages up to the current one instead of sorting everything
+            select = heapq.nsmallest if self.sort_ascending else heapq.nlargest
+            return select(limit, connections, key=key)
+        return sorted(connections, key=key, reverse=not self.sort_ascending)
+
+    def build_group_rows(self, groups: GroupCounts, page_size: int) -> List[str]:
+        """Group table lines for the current page, largest groups first."""
+        pages = max(1, (len(groups.counts) + page_size - 1) // page_size)
+        self.page = min(self.page, pages - 1)
+        start = self.page * page_size
+        self.group_page = [group for group, _ in groups.top(start + page_size)[start:]]
+        lines = [f"{'#':>4} {'Count':>8}  {' / '.join(groups.by)}", "-" * WIDTH]
+        for number, group in enumerate(self.group_page, 1):
+            lines.append(f"{number:>4} {groups.counts.get(group, 0):>8}  {group_label(group)[: WIDTH - 15]}")
+        if not self.group_page:
+            lines.append("No active connections found.")
+        lines.append("-" * WIDTH)
+        lines.append(
+            f"Groups: {len(groups.counts)} | Page {self.page + 1}/{pages} | [D] <#> to list a group's connections"
+        )
+        return lines
+
+    def build_frame(self) -> List[str]:
+        if self.groups is not None:
+            return self.frame_header() + self.build_group_rows(self.groups, self.page_size()) + self.frame_footer()
+        connections = self.filtered_connections()
+        page_size = self.page_size()
+        pages = max(1, (len(connections) + page_size - 1) // page_size)
+        self.page = min(self.page, pages - 1)
+        start = self.page * page_size
+        page_rows = self.ordered(connections, start + page_size)[start:]
+
+        lines = self.frame_header()
+        lines.append(
+            f"{'Process':<25} {'PID':<8} {'Local Address':<22} {'Remote Address':<22} {'Status':<12} {'CC':<2} {'ASN':<9} {'Rx/s':>7} {'Tx/s':>7}"
+        )
+        lines.append("-" * WIDTH)
+
         if not connections:
-            print("\nNo active connections found.")
+            lines.append("No active connections found.")
+        else:
+            for conn in page_rows:
+                lines.append(
+                    f"{(conn.process or '(resolving)')[:25]:<25} {conn.pid_text:<8} {conn.local:<22} {conn.remote_name[:22]:<22} {conn.status:<12} {conn.country:<2} {conn.asn_text:<9} {format_rate(conn.rx_rate):>7} {format_rate(conn.tx_rate):>7}"
+                )
+
+        lines.append("-" * WIDTH)
+        view = f"Showing {start + 1 if page_rows else 0}-{start + len(page_rows)} of {len(connections)} | Page {self.page + 1}/{pages}"
+        if self.filter_text:
+            view += f" | Filter: {self.filter_text!r}"
+        if self.sort_column:
+            view += f" | Sort: {self.sort_column} {'asc' if self.sort_ascending else 'desc'}"
+        if self.drill:
+            view += f" | Group: {group_label(self.drill[1])}"
+        lines.append(f"Total connections: {len(self.connections_data)} | {view}")
+        return lines + self.frame_footer()
+
+    def frame_header(self) -> List[str]:
+        lines = [
+            "=" * WIDTH,
+            f"CONNECTION MONITOR - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+            "=" * WIDTH,
+        ]
+        if self.limited:
+            lines.append(
+                "Note: Running without root privileges. Some connections may not be visible. "
+                "For full access, run with: sudo python main.py"
+            )
+        else:
+            lines.append("")
+        return lines
+
+    def frame_footer(self) -> List[str]:
+        lines = []
+        delta = self.last_delta
+        if delta is not None:
+            line = f"Opened: {len(delta.opened)} | Closed: {len(delta.closed)} | Changed: {len(delta.changed)}"
+            if self.alerts and self.alerts.recent:
+                alert = self.alerts.recent[-1]
+                line += f" | Alerts: {self.alerts.fired}, last {alert['rule']}: {alert['message']}"
+            lines.append(line[:WIDTH])
+        tick = self.scheduler.last
+        if tick is not None:
+            lines.append(
+                f"Last tick: {tick.duration * 1000:.1f} ms ({tick.cpu * 1000:.1f} ms CPU) | Next update in {tick.interval:.1f}s"
+            )
+            lines.append(f"Self: {self.instruments.summary()}"[:WIDTH])
+        else:
+            lines.extend(["", ""])
+        lines.append(
+            "Commands: [R]efresh | [N]ext/[P]rev page | [O] <column> sort | [/] <text> filter | "
+            "[G] <fields> group | [S]top | [Q]uit"
+        )
+        lines.append(f"Sort: {', '.join(SORT_KEYS)} | Group: {', '.join(DIMENSIONS)}, network/N")
+        return lines
+
+    def display_connections(self):
+        with self.instruments.stages.time("render"):
+            self.renderer.render(self.build_frame())
+
+    def handle_view_command(self, command: str) -> bool:
+        """Apply a paging/sort/filter command; returns False if it is not one."""
+        if command == "n":
+            self.page += 1
+        elif command == "p":
+            self.page = max(0, self.page - 1)
+        elif command.startswith("o"):
+            if not self.sort_by(command[1:].strip()):
+                return False
+        elif command.startswith("/"):
+            self.filter_text = command[1:].strip()
+            self.page = 0
+        elif command.startswith("g"):
+            # "g process,state" groups; "g" alone goes back to the connection list
+            if not self.show_groups(command[1:].strip()):
+                return False
+        elif command.startswith("d"):
+            # "d 3" lists the members of group 3 on the page; "d" alone shows everything again
+            if not self.drill_down(command[1:].strip()):
+                return False
+        else:
+            return False
+        self.display_connections()
+        return True
+
+    def sort_by(self, column: str) -> bool:
+        """Sort on ``column``, or flip the order if it already is the sort column."""
+        if column not in SORT_KEYS:
+            return False
+        if column == self.sort_column:
+            self.sort_ascending = not self.sort_ascending
+        else:
+            self.sort_column = column
+            self.sort_ascending = column not in DESCENDING_KEYS
+        return True
+
+    def show_groups(self, names: str) -> bool:
+        """Group by the comma separated ``names``; none goes back to the connection list."""
+        if names:
+            try:
+                self.group_by(parse_dimensions(names))
+            except ValueError:
+                return False
+        else:
+            self.groups = None
+            self.release_groups()
+        self.page = 0
+        return True
+
+    def drill_down(self, number: str) -> bool:
+        """List the members of group ``number`` on the page; none shows everything again."""
+        if not number:
+            self.drill = None
+        elif self.groups is None or not number.isdigit() or not 1 <= int(number) <= len(self.group_page):
+            return False
         else:
-            for conn in connections:
-                print(f"{conn['process']:<25} {conn['pid']:<8} {conn['local']:<22} {conn['remote']:<22} {conn['status']:<12}")
-                
-        print("-" * 100)
-        print(f"Total connections: {len(connections)}")
-        print("\nCommands: [R]efresh | [S]top monitoring | [Q]uit")
-        
+            self.drill = (self.groups, self.group_page[int(number) - 1])
+            self.groups = None
+        self.release_groups()
+        self.page = 0
+        return True
+
+    def tick(self) -> Optional[Delta]:
+        self.refresh()
+        return self.last_delta
+
     def monitor_loop(self):
-        while self.monitoring:
-            self.display_connections()
-            time.sleep(2)
-            
+        self.scheduler.run(self.tick)
+
     def start(self):
         self.monitoring = True
-        
+        self.scheduler = Scheduler(**self.scheduler_options)
+
         # Start monitoring in a thread
         monitor_thread = threading.Thread(target=self.monitor_loop, daemon=True)
         monitor_thread.start()
-        
+
         # Handle user input
         try:
             while self.monitoring:
-                user_input = input().lower()
-                if user_input == 'q':
+                user_input = input().strip().lower()
+                if user_input == "q":
                     break
-                elif user_input == 's':
+                elif user_input == "s":
                     self.monitoring = False
+                    self.scheduler.stop()
                     print("\nMonitoring stopped. Press Enter to continue...")
                     input()
                     break
-                elif user_input == 'r':
+                elif user_input == "r":
+                    self.scheduler.wake()
+                elif not self.handle_view_command(user_input):
+                    # redraw to wipe the echoed input
                     self.display_connections()
         except KeyboardInterrupt:
             pass
-            
+        self.shutdown()
+
+    def shutdown(self) -> None:
         self.monitoring = False
+        self.scheduler.stop()
+        self.enrichment.stop()
+        if self.profiler:
+            self.profiler.finish()
+        if self.history:
+            self.history.close()
+        if self.exporter:
+            self.exporter.close()
+        if self.alerts:
+            self.alerts.close()
         print("\nExiting...")
 
 
-def main():
+def main(
+    backend=None,
+    interval=2.0,
+    cpu_budget=None,
+    history=None,
+    resolve=False,
+    geoip=None,
+    export=None,
+    export_rotate=None,
+    alerts=None,
+    profile=None,
+    profile_ticks=None,
+    retention_days=None,
+):
     print("Connection Monitor")
     print("-" * 50)
     print("\nThis tool monitors network connections on your system.")
     print("\nCommands:")
     print("  - Press Enter to start monitoring")
     print("  - Press 'R' + Enter to refresh")
+    print("  - Press 'N' / 'P' + Enter for the next / previous page")
+    print("  - Type 'O <column>' + Enter to sort (again to reverse)")
+    print("  - Type '/<text>' + Enter to filter, '/' alone to clear")
+    print("  - Type 'G <fields>' + Enter to group (e.g. 'G process,state'), 'G' alone to ungroup")
+    print("  - Type 'D <number>' + Enter to list a group's connections, 'D' alone to list all")
     print("  - Press 'S' + Enter to stop monitoring")
     print("  - Press 'Q' + Enter or Ctrl+C to quit")
     print("\nPress Enter to start...")
-    
+
     input()
-    
-    monitor = ConsoleNetworkMonitor()
+
+    monitor = ConsoleNetworkMonitor(
+        backend,
+        interval,
+        cpu_budget,
+        history,
+        resolve,
+        geoip,
+        export,
+        export_rotate,
+        alerts,
+        profile,
+        profile_ticks,
+        retention_days,
+    )
     monitor.start()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,66 @@
+"""
+Differential ANSI screen renderer for the console monitor
+"""
+
+import os
+import shutil
+import sys
+import threading
+from typing import List, Optional, TextIO
+
+CLEAR_SCREEN = "\x1b[H\x1b[2J"
+CLEAR_LINE = "\x1b[K"
+CLEAR_BELOW = "\x1b[J"
+
+
+def move_to(row: int) -> str:
+    return f"\x1b[{row};1H"
+
+
+class ScreenRenderer:
+    """Paint frames of text lines, rewriting only the lines that changed.
+
+    Each frame is assembled into one string and written with a single
+    ``write`` + ``flush``, so the terminal never sees a half-drawn screen.
+    Lines are clipped to the terminal width (or ``width``): a wrapped line
+    would push the rows below it down and the repaint, which addresses rows
+    by position, would land on the wrong ones.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, width: Optional[int] = None) -> None:
+        self.stream = stream or sys.stdout
+        self.width = width
+        self.previous: List[str] = []
+        self._columns = 0
+        self.lock = threading.Lock()
+        if os.name == "nt":  # pragma: no cover
+            # enables VT escape processing in the Windows console once
+            os.system("")  # noqa: S605, S607
+
+    def invalidate(self) -> None:
+        """Force a full repaint on the next frame (e.g. after other output)."""
+        with self.lock:
+            self.previous = []
+
+    def columns(self) -> int:
+        return self.width or shutil.get_terminal_size().columns
+
+    def render(self, lines: List[str]) -> None:
+        columns = self.columns()
+        lines = [line[:columns] for line in lines]
+        with self.lock:
+            if columns != self._columns:
+                # the terminal was resized and may have rewrapped what was on screen
+                self._columns = columns
+                self.previous = []
+            previous = self.previous
+            out = [] if previous else [CLEAR_SCREEN]
+            for row, line in enumerate(lines):
+                if row >= len(previous) or previous[row] != line:
+                    out.append(move_to(row + 1) + line + CLEAR_LINE)
+            # drop leftovers from a longer previous frame and any echoed input,
+            # then park the cursor on the prompt line
+            out.append(move_to(len(lines) + 1) + CLEAR_BELOW)
+            self.stream.write("".join(out))
+            self.stream.flush()
+            self.previous = list(lines)
@@ -0,0 +1,470 @@
+"""
+Headless collector for running under systemd or in a container
+
+The daemon has no interactive prompt and no UI: it polls connections on the
+shared :class:`~connection_monitor.scheduler.Scheduler`, appends events to a
+:class:`~connection_monitor.history.HistoryStore` and optionally serves a
+small read-only JSON API (connections, history, busiest talkers) and a
+Prometheus ``/metrics`` endpoint from the standard library HTTP server.
+
+Settings come from an INI file with a ``[daemon]`` section::
+
+    [daemon]
+    backend = auto
+    interval = 2.0
+    cpu_budget = 0.05
+    history = /var/lib/connection-monitor/history.db
+    retention_days = 30
+    api_host = 127.0.0.1
+    api_port = 9110
+    resolve = false
+    geoip = /var/lib/connection-monitor/ip2asn-combined.tsv
+    export = /var/lib/connection-monitor/export/connections.ndjson.zst
+    export_rotate = 256MB,1d
+    alerts = /etc/connection-monitor/alerts.ini
+    profile = /tmp/connection-monitor.prof
+    profile_ticks = 30
+
+``alerts`` names a rules file (see :mod:`connection_monitor.alerts`); alerts
+go to the log or a webhook and the latest are served at ``/api/alerts``.
+``profile`` writes cProfile statistics for the first ``profile_ticks`` ticks;
+the daemon's own cost (stage timings, caches, RSS, CPU) is under ``self`` in
+``/healthz``.
+
+``SIGHUP`` re-reads the file (and the alert rules) and applies it without dropping the diff state;
+``SIGTERM`` (and ``SIGINT``) stop collecting, flush the history store and exit.
+"""
+
+import configparser
+import json
+import logging
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from connection_monitor.alerts import AlertEngine, load_rules
+from connection_monitor.bandwidth import BandwidthTracker, busiest, find_tracker
+from connection_monitor.collector import ConnectionCollector, Snapshot
+from connection_monitor.diff import Delta, DiffEngine
+from connection_monitor.export import Exporter, open_exporter, parse_rotation
+from connection_monitor.history import HistoryStore, open_history, query_args
+from connection_monitor.instrumentation import Instruments, TickProfiler, open_profiler
+from connection_monitor.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from connection_monitor.metrics import ConnectionMetrics
+from connection_monitor.pipeline import Enricher, Enrichment, build_enrichers, close_enrichers
+from connection_monitor.process_cache import ProcessCache
+from connection_monitor.query import IndexCache, Query, parse_query
+from connection_monitor.scheduler import Scheduler
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS: Dict[str, Any] = {
+    "backend": "auto",
+    "interval": 2.0,
+    "cpu_budget": None,
+    "history": None,
+    "retention_days": 30.0,
+    "api_host": "127.0.0.1",
+    "api_port": None,
+    "resolve": False,
+    "geoip": None,
+    "export": None,
+    "export_rotate": None,
+    "alerts": None,
+    "profile": None,
+    "profile_ticks": 30,
+}
+
+FLOAT_OPTIONS = ("interval", "cpu_budget", "retention_days")
+INT_OPTIONS = ("api_port", "profile_ticks")
+BOOLEANS = configparser.ConfigParser.BOOLEAN_STATES
+
+# the settings each rebuildable part of a running daemon depends on (see Daemon.apply)
+PARTS: Dict[str, Tuple[str, ...]] = {
+    "collector": ("backend",),
+    "history": ("history", "retention_days"),
+    "exporter": ("export", "export_rotate"),
+    "alerts": ("alerts",),
+    "enrichers": ("resolve", "geoip"),
+    "profiler": ("profile", "profile_ticks"),
+    "api": ("api_host", "api_port"),
+}
+
+
+def load_config(path: Optional[str], overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Read the ``[daemon]`` section of ``path`` over :data:`DEFAULTS`.
+
+    ``overrides`` (typically command line options) win over the file; ``None``
+    values in it are ignored. Raises ValueError for unknown or malformed keys.
+    """
+    config = dict(DEFAULTS)
+    if path:
+        config.update(read_section(path))
+    for key, value in (overrides or {}).items():
+        if value is not None:
+            config[key] = value
+    return coerce(config)
+
+
+def read_section(path: str) -> Dict[str, Any]:
+    """The ``[daemon]`` options set in ``path``; empty values read as None."""
+    parser = configparser.ConfigParser()
+    with open(path) as f:
+        parser.read_file(f)
+    if not parser.has_section("daemon"):
+        return {}
+    options = {}
+    for key, value in parser.items("daemon"):
+        if key not in DEFAULTS:
+            raise ValueError(f"Unknown option {key!r} in {path}")
+        options[key] = value.strip() or None
+    return options
+
+
+def coerce(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert the options read as strings to their types, in place."""
+    for key in FLOAT_OPTIONS:
+        if config[key] is not None:
+            config[key] = float(config[key])
+    for key in INT_OPTIONS:
+        if config[key] is not None:
+            config[key] = int(config[key])
+    if isinstance(config["resolve"], str):
+        if config["resolve"].lower() not in BOOLEANS:
+            raise ValueError(f"resolve must be a boolean, not {config['resolve']!r}")
+        config["resolve"] = BOOLEANS[config["resolve"].lower()]
+    parse_rotation(config["export_rotate"])
+    return config
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """Read-only JSON endpoints; ``server.daemon`` is the running :class:`Daemon`."""
+
+    server: "ApiServer"
+
+    ROUTES: ClassVar[Dict[str, str]] = {
+        "/api/connections": "get_connections",
+        "/api/history": "get_history",
+        "/api/alerts": "get_alerts",
+        "/api/bandwidth": "get_bandwidth",
+        "/metrics": "get_metrics",
+        "/healthz": "get_health",
+    }
+
+    def do_GET(self) -> None:  # noqa: N802
+        url = urlsplit(self.path)
+        route = self.ROUTES.get(url.path)
+        if route is None:
+            self.send_json(404, {"error": "not found"})
+            return
+        getattr(self, route)(self.server.daemon, dict(parse_qsl(url.query)))
+
+    def get_connections(self, daemon: "Daemon", params: Dict[str, str]) -> None:
+        try:
+            page = daemon.search(parse_query(params))
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        self.send_json(200, page)
+
+    def get_history(self, daemon: "Daemon", params: Dict[str, str]) -> None:
+        if daemon.history is None:
+            self.send_json(404, {"error": "history is not enabled"})
+            return
+        try:
+            kwargs = query_args(params)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        events = daemon.history.query(**kwargs)
+        self.send_json(200, {"start": kwargs["start"], "end": kwargs["end"], "events": events})
+
+    def get_alerts(self, daemon: "Daemon", params: Dict[str, str]) -> None:
+        if daemon.alerts is None:
+            self.send_json(404, {"error": "alerting is not enabled"})
+            return
+        self.send_json(200, {"alerts": list(daemon.alerts.recent), **daemon.alerts.stats()})
+
+    def get_bandwidth(self, daemon: "Daemon", params: Dict[str, str]) -> None:
+        try:
+            limit = int(params.get("limit", 10))
+        except ValueError:
+            self.send_json(400, {"error": "limit must be an integer"})
+            return
+        delta = daemon.diff.last_delta
+        connections = list(delta.snapshot) if delta is not None else []
+        self.send_json(200, busiest(connections, daemon.bandwidth, max(1, min(limit, 1000))))
+
+    def get_metrics(self, daemon: "Daemon", params: Dict[str, str]) -> None:
+        self.send_body(200, daemon.render_metrics().encode(), METRICS_CONTENT_TYPE)
+
+    def get_health(self, daemon: "Daemon", params: Dict[str, str]) -> None:
+        self.send_json(200, daemon.status())
+
+    def send_json(self, code: int, body: Any) -> None:
+        self.send_body(code, json.dumps(body).encode(), "application/json")
+
+    def send_body(self, code: int, data: bytes, content_type: str) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        logger.debug("api: " + format, *args)
+
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], daemon: "Daemon", bind_and_activate: bool = True) -> None:
+        super().__init__(address, ApiHandler, bind_and_activate)
+        self.daemon = daemon
+
+
+class Daemon:
+    """Collect until told to stop, persisting events and serving the API.
+
+    Memory stays flat over long runs: the only per-connection state is the
+    diff engine's current map, process names live in a bounded LRU and the
+    history store drops events rather than queueing without limit.
+    """
+
+    def __init__(self, config_path: Optional[str] = None, overrides: Optional[Dict[str, Any]] = None) -> None:
+        self.config_path = config_path
+        self.overrides = overrides or {}
+        self.config: Dict[str, Any] = {}
+        self.process_cache = ProcessCache()
+        self.collector: Optional[ConnectionCollector] = None
+        self.diff = DiffEngine()
+        self.metrics = ConnectionMetrics()
+        self.diff.listeners.append(self.metrics.record)
+        self.history: Optional[HistoryStore] = None
+        self.exporter: Optional[Exporter] = None
+        self.alerts: Optional[AlertEngine] = None
+        self.index = IndexCache()
+        self.enrichment = Enrichment()
+        self.enrichment.start()
+        self.instruments = Instruments()
+        self.profiler: Optional[TickProfiler] = None
+        self.api: Optional[ApiServer] = None
+        self.scheduler: Optional[Scheduler] = None
+        self._stopping = False
+        self._reload = False
+        self.apply(load_config(config_path, self.overrides))
+
+    def apply(self, config: Dict[str, Any]) -> None:
+        """Switch to ``config``, rebuilding only the parts whose settings changed.
+
+        The alert rules are always re-read. Every new part is built before
+        any is swapped in, so a bad rules file, database or export path
+        leaves the running configuration as it was; the parts replaced are
+        closed once the new ones are in place.
+        """
+        parts = self._build(config)
+        if "api" in parts:
+            self._move_api(parts.pop("api"), parts)
+        if "enrichers" in parts:
+            self.enrichment.replace(parts.pop("enrichers"))
+        if self.profiler is not None and "profiler" in parts:
+            self.profiler.finish()
+        retired = {name: getattr(self, name) for name in parts}
+        for name, part in parts.items():
+            setattr(self, name, part)
+        listeners: List[Callable[[Delta], None]] = [self.metrics.record]
+        listeners += [part.record for part in (self.history, self.exporter, self.alerts) if part is not None]
+        self.diff.listeners = listeners
+        self.instruments.collector = self.collector
+        self.instruments.enrichers = self.enrichment.enrichers
+        self.config = config
+        self._discard(retired)
+        self._announce(parts)
+
+    def _build(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """New parts for the settings of :data:`PARTS` that differ from the running ones."""
+        parts: Dict[str, Any] = {}
+        try:
+            for name, keys in PARTS.items():
+                if name == "alerts" or any(config[key] != self.config.get(key) for key in keys):
+                    parts[name] = getattr(self, f"_build_{name}")(config)
+        except BaseException:
+            self._discard(parts)
+            raise
+        return parts
+
+    def _build_collector(self, config: Dict[str, Any]) -> ConnectionCollector:
+        return ConnectionCollector(config["backend"], process_cache=self.process_cache)
+
+    def _build_history(self, config: Dict[str, Any]) -> Optional[HistoryStore]:
+        return open_history(config["history"], config["retention_days"])
+
+    def _build_exporter(self, config: Dict[str, Any]) -> Optional[Exporter]:
+        return open_exporter(config["export"], config["export_rotate"]) if config["export"] else None
+
+    def _build_alerts(self, config: Dict[str, Any]) -> Optional[AlertEngine]:
+        return AlertEngine(load_rules(config["alerts"])) if config["alerts"] else None
+
+    def _build_enrichers(self, config: Dict[str, Any]) -> List[Enricher]:
+        return build_enrichers(config["resolve"], config["geoip"])
+
+    def _build_profiler(self, config: Dict[str, Any]) -> Optional[TickProfiler]:
+        return open_profiler(config["profile"], config["profile_ticks"])
+
+    def _build_api(self, config: Dict[str, Any]) -> Optional[ApiServer]:
+        if config["api_port"] is None:
+            return None
+        return ApiServer((config["api_host"], config["api_port"]), self, bind_and_activate=False)
+
+    def _discard(self, parts: Dict[str, Any]) -> None:
+        """Close parts that were replaced or never swapped in (profilers are finished by the caller)."""
+        for name, part in parts.items():
+            if part is None or name in ("collector", "profiler"):
+                continue
+            if name == "enrichers":
+                close_enrichers(part)
+            elif name == "api":
+                part.server_close()
+            else:
+                part.close()
+
+    def _move_api(self, api: Optional[ApiServer], parts: Dict[str, Any]) -> None:
+        """Serve the API from ``api`` instead of the running server.
+
+        Binding is the one step that can only fail once the old server has
+        stopped (it may hold the port), so it comes first: if the new address
+        cannot be bound the old one is served again and the other new
+        ``parts`` are discarded before the error is raised.
+        """
+        self._stop_api()
+        if api is None:
+            return
+        try:
+            self._serve(api)
+        except OSError:
+            self._discard(parts)
+            if self.config.get("api_port") is not None:
+                self._serve(ApiServer((self.config["api_host"], self.config["api_port"]), self, False))
+            raise
+
+    def _serve(self, api: ApiServer) -> None:
+        try:
+            api.server_bind()
+            api.server_activate()
+        except OSError:
+            api.server_close()
+            raise
+        self.api = api
+        threading.Thread(target=api.serve_forever, name="api", daemon=True).start()
+        logger.info("serving the API on %s:%s", *api.server_address[:2])
+
+    def _announce(self, parts: Dict[str, Any]) -> None:
+        if "collector" in parts:
+            logger.info("collecting with the %s backend", parts["collector"].backend.name)
+        if parts.get("history") is not None:
+            logger.info("recording history to %s", self.config["history"])
+        if parts.get("alerts") is not None:
+            logger.info("evaluating %d alert rules from %s", len(parts["alerts"].rules), self.config["alerts"])
+
+    def reload(self) -> None:
+        """Re-read the config file; a broken file keeps the running config."""
+        try:
+            self.apply(load_config(self.config_path, self.overrides))
+        except (OSError, ValueError, configparser.Error) as e:
+            logger.error("not reloading, bad config: %s", e)
+            return
+        logger.info("configuration reloaded")
+
+    @property
+    def bandwidth(self) -> Optional[BandwidthTracker]:
+        return find_tracker(self.enrichment.enrichers)
+
+    def tick(self) -> Delta:
+        assert self.collector is not None
+        snapshot = self.instruments.timed("collect", self.collector.collect)
+        self.instruments.timed("enrich", self.enrichment.apply, snapshot)
+        return self.instruments.timed("diff", self.diff.update, snapshot)
+
+    def search(self, query: Query) -> Dict[str, Any]:
+        """One page of the latest snapshot's connections matching ``query``."""
+        delta = self.diff.last_delta
+        snapshot = delta.snapshot if delta is not None else Snapshot([], 0.0)
+        page = self.index.get(snapshot).search(query)
+        page["timestamp"] = snapshot.timestamp
+        return page
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self.diff.current),
+            "tick": self.scheduler.stats() if self.scheduler is not None else {},
+            "process_cache": self.process_cache.stats(),
+            "history_dropped": self.history.dropped if self.history is not None else 0,
+            "export": self.exporter.stats() if self.exporter is not None else {},
+            "alerts": self.alerts.stats() if self.alerts is not None else {},
+            "self": self.instruments.stats(caches=True),
+        }
+
+    def render_metrics(self) -> str:
+        dropped = {"history": self.history.dropped} if self.history is not None else {}
+        if self.exporter is not None:
+            dropped["export"] = self.exporter.dropped
+        return self.metrics.render(self.scheduler, self.process_cache.stats(), dropped, self.bandwidth)
+
+    def request_reload(self, *_: Any) -> None:
+        self._reload = True
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+    def request_stop(self, *_: Any) -> None:
+        self._stopping = True
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+    def run(self) -> None:
+        """Collect in the calling (main) thread until SIGTERM/SIGINT."""
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self.request_reload)
+        try:
+            while not self._stopping:
+                # a reload stops the scheduler; the next one picks up the new settings
+                self.scheduler = Scheduler(
+                    interval=self.config["interval"], cpu_budget=self.config["cpu_budget"], profiler=self.profiler
+                )
+                self.scheduler.run(self.tick)
+                if self._reload and not self._stopping:
+                    self._reload = False
+                    self.reload()
+        finally:
+            self.shutdown()
+
+    def shutdown(self) -> None:
+        self._stop_api()
+        self.enrichment.stop()
+        self.enrichment.replace([])
+        if self.profiler is not None:
+            self.profiler.finish()
+        if self.history is not None:
+            self.history.close()
+            self.history = None
+        if self.exporter is not None:
+            self.exporter.close()
+            self.exporter = None
+        if self.alerts is not None:
+            self.alerts.close()
+            self.alerts = None
+        logger.info("stopped")
+
+    def _stop_api(self) -> None:
+        if self.api is not None:
+            self.api.shutdown()
+            self.api.server_close()
+            self.api = None
+
+
+def main(config: Optional[str] = None, **overrides: Any) -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    Daemon(config, overrides).run()
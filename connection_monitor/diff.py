@@ -0,0 +1,88 @@
+"""
+Delta engine turning consecutive snapshots into opened/closed/changed events
+"""
+
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from connection_monitor.collector import Connection, Snapshot
+
+
+class Delta:
+    """Events between two consecutive snapshots.
+
+    ``changed`` holds ``(previous, current)`` pairs for connections whose
+    status moved, e.g. ESTABLISHED -> CLOSE_WAIT, or whose enrichment (such
+    as a late process name) arrived. An ``initial`` delta is the
+    first after a (re)start: its ``opened`` is everything already present, so
+    consumers keeping running totals should start over from it.
+    """
+
+    __slots__ = ("snapshot", "opened", "closed", "changed", "initial")
+
+    def __init__(
+        self,
+        snapshot: Snapshot,
+        opened: List[Connection],
+        closed: List[Connection],
+        changed: List[Tuple[Connection, Connection]],
+        initial: bool = False,
+    ) -> None:
+        self.snapshot = snapshot
+        self.opened = opened
+        self.closed = closed
+        self.changed = changed
+        self.initial = initial
+
+    @property
+    def churn(self) -> int:
+        return len(self.opened) + len(self.closed) + len(self.changed)
+
+    def __bool__(self) -> bool:
+        return bool(self.opened or self.closed or self.changed)
+
+    def __repr__(self) -> str:
+        return f"Delta(+{len(self.opened)} -{len(self.closed)} ~{len(self.changed)})"
+
+
+class DiffEngine:
+    """Keep the previous snapshot keyed by :attr:`Connection.key` and diff against it.
+
+    Both sides are hashed, so each update is O(n) in the number of connections.
+    The first update reports every connection as opened.
+
+    Callables in ``listeners`` receive every delta, e.g. to persist events
+    without rescanning snapshots. They run on the collecting thread and must
+    not block. Once updates are running, change the listeners by assigning a
+    new list rather than mutating this one, so an update in progress keeps
+    iterating over the list it started with.
+    """
+
+    def __init__(self) -> None:
+        self.current: Dict[Hashable, Connection] = {}
+        self.last_delta: Optional[Delta] = None
+        self.listeners: List[Callable[[Delta], None]] = []
+
+    def update(self, snapshot: Snapshot) -> Delta:
+        previous = self.current
+        current: Dict[Hashable, Connection] = {conn.key: conn for conn in snapshot}
+
+        opened = []
+        changed = []
+        for key, conn in current.items():
+            before = previous.get(key)
+            if before is None:
+                opened.append(conn)
+            elif before.differs(conn):
+                changed.append((before, conn))
+        closed = [conn for key, conn in previous.items() if key not in current]
+
+        self.current = current
+        delta = self.last_delta = Delta(snapshot, opened, closed, changed, initial=self.last_delta is None)
+        for listener in self.listeners:
+            listener(delta)
+        return delta
+
+    def reset(self) -> None:
+        """Forget the previous snapshot so the next update starts from scratch."""
+        self.current = {}
+        self.last_delta = None
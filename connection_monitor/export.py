@@ -0,0 +1,375 @@
+"""
+Streaming export of connection events and snapshots to files
+
+An :class:`Exporter` is a delta listener like
+:class:`~connection_monitor.history.HistoryStore`: each delta becomes a batch
+of rows queued for a writer thread, and a full queue drops the batch (counted
+in :attr:`Exporter.dropped`) rather than stall the monitor loop. Rows are
+the opened/closed/changed events plus, on the first tick and every
+``snapshot_every`` seconds, one ``snapshot`` row per live connection, so any
+file can be read on its own.
+
+Files are NDJSON, CSV or Parquet. NDJSON and CSV go through a buffered file,
+optionally gzip or zstd compressed as a stream; Parquet compresses its column
+chunks itself and writes a row group per ``row_group_size`` rows. A new file
+is started once the current one reaches ``max_bytes`` or ``max_age``
+seconds; each is named after the export path and the time it was opened,
+``connections.ndjson.gz`` -> ``connections-20240501T120000.ndjson.gz``.
+"""
+
+import csv
+import gzip
+import importlib.util
+import io
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from connection_monitor.collector import Connection
+from connection_monitor.diff import Delta
+
+# optional dependency; importing pyarrow takes a few hundred milliseconds, so
+# it is only imported once a Parquet file is opened
+HAVE_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "csv", "parquet")
+COMPRESSIONS = ("gzip", "zstd")
+FORMAT_SUFFIXES = {".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv", ".parquet": "parquet"}
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".zst": "zstd"}
+
+COLUMNS = (
+    "ts",
+    "kind",
+    "pid",
+    "process",
+    "proto",
+    "local_ip",
+    "local_port",
+    "remote_ip",
+    "remote_port",
+    "status",
+    "hostname",
+    "country",
+    "asn",
+    "rx_rate",
+    "tx_rate",
+)
+
+Row = Tuple[Any, ...]
+
+
+def export_row(ts: float, kind: str, conn: Connection) -> Row:
+    return (
+        ts,
+        kind,
+        conn.pid,
+        conn.process,
+        conn.proto,
+        conn.laddr_ip,
+        conn.laddr_port,
+        conn.raddr_ip,
+        conn.raddr_port,
+        conn.status,
+        conn.hostname or None,
+        conn.country or None,
+        conn.asn or None,
+        round(conn.rx_rate, 1),
+        round(conn.tx_rate, 1),
+    )
+
+
+def parse_rotation(value: Optional[str]) -> Tuple[Optional[int], Optional[float]]:
+    """``"100MB"``, ``"1h"`` or both (``"100MB,1h"``) -> ``(max_bytes, max_age)``.
+
+    Sizes take ``B``, ``KB``, ``MB`` or ``GB``; ages ``s``, ``m``, ``h`` or
+    ``d``. Raises ValueError for anything else.
+    """
+    max_bytes: Optional[int] = None
+    max_age: Optional[float] = None
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([KMG]?B|[smhd])", part, re.IGNORECASE)
+        if match is None:
+            raise ValueError(f"Invalid rotation {part!r}, expected a size like 100MB or an age like 1h")
+        number, unit = float(match.group(1)), match.group(2)
+        if unit[-1] in "bB":
+            max_bytes = int(number * 1000 ** "BKMG".index(unit[0].upper()))
+        else:
+            max_age = number * {"s": 1, "m": 60, "h": 3600, "d": 86400}[unit.lower()]
+    return max_bytes, max_age
+
+
+def split_suffixes(path: str) -> Tuple[str, str]:
+    """``"out/conn.csv.gz"`` -> ``("out/conn", ".csv.gz")``: the known export suffixes, split off."""
+    stem, suffixes = path, ""
+    while True:
+        root, suffix = os.path.splitext(stem)
+        if suffix.lower() not in FORMAT_SUFFIXES and suffix.lower() not in COMPRESSION_SUFFIXES:
+            return stem, suffixes
+        stem, suffixes = root, suffix + suffixes
+
+
+class LineFile:
+    """An NDJSON or CSV file, optionally compressed as one stream."""
+
+    def __init__(self, path: str, format: str, compression: Optional[str]) -> None:  # noqa: A002
+        self.format = format
+        self.raw = open(path, "wb", buffering=1 << 20)  # noqa: SIM115
+        self.stream: Any = self.raw
+        if compression == "gzip":
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode="wb", compresslevel=6)
+        elif compression == "zstd":
+            self.stream = zstandard.ZstdCompressor(level=3).stream_writer(self.raw, closefd=False)
+        if format == "csv":
+            self._write_text(",".join(COLUMNS) + "\r\n")
+
+    @property
+    def size(self) -> int:
+        # compressed bytes reach the file in blocks, so this trails a little
+        return self.raw.tell()
+
+    def write(self, rows: List[Row]) -> None:
+        if self.format == "ndjson":
+            self._write_text("".join(json.dumps(dict(zip(COLUMNS, row)), separators=(",", ":")) + "\n" for row in rows))
+        else:
+            text = io.StringIO()
+            csv.writer(text).writerows(rows)
+            self._write_text(text.getvalue())
+
+    def flush(self) -> None:
+        self.stream.flush()
+        self.raw.flush()
+
+    def close(self) -> None:
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.raw.close()
+
+    def _write_text(self, text: str) -> None:
+        self.stream.write(text.encode())
+
+
+class ParquetFile:
+    """A Parquet file written a row group at a time.
+
+    A Parquet file is only readable once its footer is written on close, so
+    rows are held until a row group is full instead of being flushed.
+    """
+
+    def __init__(self, path: str, compression: Optional[str], row_group_size: int = 50000) -> None:
+        self.path = path
+        self.row_group_size = row_group_size
+        self.pending: List[Row] = []
+        import pyarrow.parquet
+
+        self.writer = pyarrow.parquet.ParquetWriter(path, parquet_schema(), compression=compression or "snappy")
+
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+    def write(self, rows: List[Row]) -> None:
+        self.pending.extend(rows)
+        if len(self.pending) >= self.row_group_size:
+            self._write_row_group()
+
+    def flush(self) -> None:
+        """Nothing to do: see the class docstring."""
+
+    def close(self) -> None:
+        self._write_row_group()
+        self.writer.close()
+
+    def _write_row_group(self) -> None:
+        if self.pending:
+            import pyarrow
+
+            columns = list(zip(*self.pending))
+            self.writer.write_table(pyarrow.table(dict(zip(COLUMNS, columns)), schema=parquet_schema()))
+            self.pending = []
+
+
+def parquet_schema() -> Any:
+    import pyarrow
+
+    text, integer, real = pyarrow.string(), pyarrow.int64(), pyarrow.float64()
+    types = (real, text, integer, text, text, text, integer, text, integer, text, text, text, integer, real, real)
+    return pyarrow.schema(list(zip(COLUMNS, types)))
+
+
+class Exporter:
+    """Append events (and periodic snapshots) to rotating files from a writer thread.
+
+    ``format`` and ``compression`` default to what the suffixes of ``path``
+    say (``.ndjson``/``.jsonl``, ``.csv``, ``.parquet``; ``.gz``, ``.zst``).
+    Raises ValueError for an unknown format or a missing optional package.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        format: Optional[str] = None,  # noqa: A002
+        compression: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+        max_age: Optional[float] = None,
+        snapshot_every: Optional[float] = 60.0,
+        flush_interval: float = 1.0,
+        max_pending: int = 1000,
+        row_group_size: int = 50000,
+    ) -> None:
+        self.stem, suffixes = split_suffixes(path)
+        suffix_list = re.findall(r"\.[^.]+", suffixes.lower())
+        format = format or next((FORMAT_SUFFIXES[s] for s in suffix_list if s in FORMAT_SUFFIXES), "ndjson")
+        if compression is None:
+            compression = next((COMPRESSION_SUFFIXES[s] for s in suffix_list if s in COMPRESSION_SUFFIXES), None)
+        if format not in FORMATS:
+            raise ValueError(f"Unknown export format {format!r}, expected one of: {', '.join(FORMATS)}")
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression!r}, expected one of: {', '.join(COMPRESSIONS)}")
+        if format == "parquet" and not HAVE_PYARROW:
+            raise ValueError("The parquet export format requires the 'pyarrow' package")
+        if compression == "zstd" and format != "parquet" and zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+        self.format = format
+        self.compression = compression
+        self.suffixes = suffixes or self._default_suffixes()
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.snapshot_every = snapshot_every
+        self.flush_interval = flush_interval
+        self.row_group_size = row_group_size
+        self.dropped = 0
+        self.written = 0
+        self.files = 0  # opened so far
+        self.path: Optional[str] = None  # the file being written
+        self._last_snapshot: Optional[float] = None
+        self._file: Optional[Union[LineFile, ParquetFile]] = None
+        self._opened = 0.0
+        self._queue: "queue.Queue[Optional[Union[str, List[Row]]]]" = queue.Queue(max_pending)
+        self._flushed = threading.Event()
+        self._writer = threading.Thread(target=self._write_loop, name="exporter", daemon=True)
+        self._writer.start()
+
+    def _default_suffixes(self) -> str:
+        suffix = {"ndjson": ".ndjson", "csv": ".csv", "parquet": ".parquet"}[self.format]
+        if self.format != "parquet" and self.compression:
+            suffix += {"gzip": ".gz", "zstd": ".zst"}[self.compression]
+        return suffix
+
+    def record(self, delta: Delta) -> None:
+        """Queue the rows of ``delta``; never blocks."""
+        ts = delta.snapshot.timestamp
+        rows = [export_row(ts, "opened", conn) for conn in delta.opened]
+        rows.extend(export_row(ts, "closed", conn) for conn in delta.closed)
+        rows.extend(export_row(ts, "changed", new) for _, new in delta.changed)
+        if self.snapshot_every is not None and (
+            delta.initial or self._last_snapshot is None or ts - self._last_snapshot >= self.snapshot_every
+        ):
+            self._last_snapshot = ts
+            rows.extend(export_row(ts, "snapshot", conn) for conn in delta.snapshot)
+        if rows:
+            try:
+                self._queue.put_nowait(rows)
+            except queue.Full:
+                # the disk cannot keep up; drop rather than stall collection
+                self.dropped += len(rows)
+
+    def flush(self, timeout: float = 10.0) -> None:
+        """Block until everything queued so far is handed to the current file."""
+        self._flushed.clear()
+        self._queue.put("flush")
+        self._flushed.wait(timeout)
+
+    def close(self) -> None:
+        self.flush()
+        self._queue.put(None)
+        self._writer.join(5)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"written": self.written, "dropped": self.dropped, "files": self.files, "pending": self._queue.qsize()}
+
+    def _write_loop(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = "idle"
+            try:
+                if item is None:
+                    self._close_file()
+                    return
+                if isinstance(item, list):
+                    self._write(item)
+                    continue
+                # "flush", or a quiet interval: push buffered rows out and honour max_age
+                if self._file is not None:
+                    self._file.flush()
+                    if self._due():
+                        self._close_file()
+            except (OSError, ValueError):
+                logger.exception("export write failed")
+            finally:
+                if item == "flush":
+                    self._flushed.set()
+
+    def _write(self, rows: List[Row]) -> None:
+        if self._file is not None and self._due():
+            self._close_file()
+        if self._file is None:
+            self._open_file()
+        assert self._file is not None
+        try:
+            self._file.write(rows)
+        except (OSError, ValueError):
+            self.dropped += len(rows)
+            raise
+        self.written += len(rows)
+
+    def _due(self) -> bool:
+        assert self._file is not None
+        if self.max_age is not None and time.monotonic() - self._opened >= self.max_age:
+            return True
+        return self.max_bytes is not None and self._file.size >= self.max_bytes
+
+    def _open_file(self) -> None:
+        base = f"{self.stem}-{time.strftime('%Y%m%dT%H%M%S')}"
+        path, sequence = base + self.suffixes, 1
+        while os.path.exists(path):
+            # rotated more than once within a second
+            path, sequence = f"{base}-{sequence}{self.suffixes}", sequence + 1
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.format == "parquet":
+            self._file = ParquetFile(path, self.compression, self.row_group_size)
+        else:
+            self._file = LineFile(path, self.format, self.compression)
+        self._opened = time.monotonic()
+        self.files += 1
+        self.path = path
+        logger.info("exporting to %s", path)
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            file, self._file = self._file, None
+            file.close()
+
+
+def open_exporter(path: str, rotate: Optional[str] = None) -> Exporter:
+    """An :class:`Exporter` for the ``--export``/``--export-rotate`` options."""
+    max_bytes, max_age = parse_rotation(rotate)
+    return Exporter(path, max_bytes=max_bytes, max_age=max_age)
@@ -0,0 +1,262 @@
+"""
+Offline country/ASN lookup for remote addresses
+
+Two database formats are supported:
+
+* a range table compiled from an ip2asn-style CSV/TSV file
+  (``range_start, range_end, AS_number, country_code, AS_description``) into
+  a flat file of sorted fixed-width records, searched in place through
+  ``mmap`` so the database is never loaded into the heap;
+* MaxMind MMDB files (GeoLite2-Country/City/ASN), read with the optional
+  ``maxminddb`` package in its mmap mode.
+
+:class:`GeoEnricher` caches results per IP and is applied like any other
+enricher; lookups are cheap enough to run synchronously.
+"""
+
+import csv
+import ipaddress
+import mmap
+import os
+import struct
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from connection_monitor.collector import Snapshot
+
+try:
+    import maxminddb
+except ImportError:  # optional dependency
+    maxminddb = None
+
+MAGIC = b"CMGEO\x00\x01\x00"
+# magic, v4 record count, v6 record count, v4 offset, v6 offset, strings offset
+HEADER = struct.Struct("!8sQQQQQ")
+# start, end, ASN, AS name offset, country
+V4_RECORD = struct.Struct("!IIII2s2x")
+V6_RECORD = struct.Struct("!16s16sII2s2x")
+
+
+class GeoInfo:
+    __slots__ = ("country", "asn", "as_org")
+
+    def __init__(self, country: str = "", asn: int = 0, as_org: str = "") -> None:
+        self.country = country
+        self.asn = asn
+        self.as_org = as_org
+
+    def merge(self, other: Optional["GeoInfo"]) -> "GeoInfo":
+        """Fill empty fields from ``other`` (e.g. a country DB plus an ASN DB)."""
+        if other is not None:
+            self.country = self.country or other.country
+            if not self.asn:
+                self.asn, self.as_org = other.asn, other.as_org
+        return self
+
+    def __repr__(self) -> str:
+        return f"GeoInfo({self.country!r}, AS{self.asn}, {self.as_org!r})"
+
+
+def read_ranges(path: str) -> Iterable[Tuple[str, str, int, str, str]]:
+    """Yield ``(start, end, asn, country, as_org)`` from an ip2asn CSV or TSV file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        first = f.readline()
+        f.seek(0)
+        for row in csv.reader(f, delimiter="\t" if "\t" in first else ","):
+            if len(row) < 4 or row[0].startswith("#") or not row[2].strip().isdigit():
+                continue  # header, comment or malformed line
+            country = row[3].strip().upper()
+            if country in ("NONE", "ZZ"):
+                country = ""
+            yield row[0].strip(), row[1].strip(), int(row[2]), country, row[4].strip() if len(row) > 4 else ""
+
+
+def compile_ranges(source: str, target: str) -> int:
+    """Compile the CSV/TSV range file ``source`` into the binary table ``target``.
+
+    Returns the number of ranges written. Ranges without an ASN or country
+    are skipped.
+    """
+    v4: List[Tuple[int, int, int, str, str]] = []
+    v6: List[Tuple[int, int, int, str, str]] = []
+    for start, end, asn, country, as_org in read_ranges(source):
+        if not asn and not country:
+            continue
+        low, high = ipaddress.ip_address(start), ipaddress.ip_address(end)
+        (v4 if low.version == 4 else v6).append((int(low), int(high), asn, country, as_org))
+    v4.sort()
+    v6.sort()
+
+    strings = bytearray(b"\x00")
+    offsets: Dict[str, int] = {"": 0}
+
+    def intern(name: str) -> int:
+        if name not in offsets:
+            offsets[name] = len(strings)
+            strings.extend(name.encode("utf-8") + b"\x00")
+        return offsets[name]
+
+    v4_offset = HEADER.size
+    v6_offset = v4_offset + len(v4) * V4_RECORD.size
+    strings_offset = v6_offset + len(v6) * V6_RECORD.size
+    body = bytearray()
+    for first, last, asn, country, as_org in v4:
+        body += V4_RECORD.pack(first, last, asn, intern(as_org), country.encode("ascii"))
+    for first, last, asn, country, as_org in v6:
+        body += V6_RECORD.pack(
+            first.to_bytes(16, "big"), last.to_bytes(16, "big"), asn, intern(as_org), country.encode("ascii")
+        )
+    tmp = f"{target}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(v4), len(v6), v4_offset, v6_offset, strings_offset))
+        f.write(body)
+        f.write(strings)
+    os.replace(tmp, target)
+    return len(v4) + len(v6)
+
+
+class RangeTable:
+    """Binary search over a compiled range file, mapped read-only into memory."""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.v4_count, self.v6_count, self.v4_offset, self.v6_offset, self.strings_offset = HEADER.unpack_from(
+            self.map
+        )
+        if magic != MAGIC:
+            self.map.close()
+            raise ValueError(f"{path} is not a compiled GeoIP range table")
+
+    def close(self) -> None:
+        self.map.close()
+
+    def lookup(self, ip: str) -> Optional[GeoInfo]:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        # IPv4 records store the address as an integer, IPv6 ones as 16 packed bytes
+        key: Union[int, bytes]
+        if address.version == 4:
+            record, base, count, key = V4_RECORD, self.v4_offset, self.v4_count, int(address)
+        else:
+            record, base, count, key = V6_RECORD, self.v6_offset, self.v6_count, address.packed
+
+        # rightmost range starting at or before the address
+        low, high = 0, count
+        while low < high:
+            mid = (low + high) // 2
+            if record.unpack_from(self.map, base + mid * record.size)[0] <= key:
+                low = mid + 1
+            else:
+                high = mid
+        if not low:
+            return None
+        start, end, asn, name_offset, country = record.unpack_from(self.map, base + (low - 1) * record.size)
+        if key > end:
+            return None
+        # ranges without a country (ASN only) store NUL padding
+        return GeoInfo(country.rstrip(b"\0").decode("ascii"), asn, self._string(name_offset))
+
+    def _string(self, offset: int) -> str:
+        start = self.strings_offset + offset
+        return self.map[start : self.map.find(b"\x00", start)].decode("utf-8")
+
+
+class MmdbTable:
+    """MaxMind database (country, city or ASN edition) through ``maxminddb``."""
+
+    def __init__(self, path: str) -> None:
+        if maxminddb is None:
+            raise ValueError("Reading .mmdb files requires the 'maxminddb' package")
+        self.reader = maxminddb.open_database(path, maxminddb.MODE_MMAP)
+
+    def close(self) -> None:
+        self.reader.close()
+
+    def lookup(self, ip: str) -> Optional[GeoInfo]:
+        try:
+            record: Any = self.reader.get(ip)
+        except ValueError:
+            return None
+        if not record:
+            return None
+        country = (record.get("country") or record.get("registered_country") or {}).get("iso_code", "")
+        return GeoInfo(
+            country, record.get("autonomous_system_number", 0), record.get("autonomous_system_organization", "")
+        )
+
+
+def open_table(path: str) -> Any:
+    """Open ``path`` by type: ``.mmdb``, a CSV/TSV source (compiled next to it on first use) or a compiled table."""
+    if path.endswith(".mmdb"):
+        return MmdbTable(path)
+    if path.endswith((".csv", ".tsv")):
+        compiled = path + ".cmgeo"
+        if not os.path.exists(compiled) or os.path.getmtime(compiled) < os.path.getmtime(path):
+            compile_ranges(path, compiled)
+        path = compiled
+    return RangeTable(path)
+
+
+class GeoEnricher:
+    """Annotate connections with country and ASN from one or more tables.
+
+    Tables are consulted in order and their answers merged, so a country
+    database and an ASN database can be combined. Results (including "not
+    found") are cached per IP in an LRU of ``maxsize`` entries.
+    """
+
+    def __init__(self, tables: Sequence[Any], maxsize: int = 65536) -> None:
+        self.tables = list(tables)
+        self.maxsize = maxsize
+        self._cache: "OrderedDict[str, Optional[GeoInfo]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_paths(cls, paths: Iterable[str]) -> "GeoEnricher":
+        return cls([open_table(path) for path in paths])
+
+    def lookup(self, ip: str) -> Optional[GeoInfo]:
+        if ip in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(ip)
+            return self._cache[ip]
+        self.misses += 1
+        info = None
+        for table in self.tables:
+            found = table.lookup(ip)
+            if found is not None:
+                info = found if info is None else info.merge(found)
+        self._cache[ip] = info
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return info
+
+    def apply(self, snapshot: Snapshot) -> Set[Hashable]:
+        for conn in snapshot:
+            if conn.raddr_ip:
+                info = self.lookup(conn.raddr_ip)
+                if info is not None:
+                    conn.country, conn.asn, conn.as_org = info.country, info.asn, info.as_org
+        return set()
+
+    async def resolve(self, keys: Set[Hashable]) -> None:
+        """Nothing to do: :meth:`apply` never leaves misses."""
+
+    def close(self) -> None:
+        for table in self.tables:
+            table.close()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,147 @@
+"""
+Group-by views: connection counts per process, remote host, network, port or state
+
+:class:`GroupCounts` is a delta listener like
+:class:`~connection_monitor.metrics.ConnectionMetrics`: opened, closed and
+changed events adjust the counts and member sets of the affected groups, so
+showing "nginx, ESTABLISHED, 10.0.0.0/8: 1240" never walks the connection
+rows. Each group remembers its members' keys for drill-down.
+"""
+
+import heapq
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+from connection_monitor.collector import Connection, Snapshot
+from connection_monitor.diff import Delta
+from connection_monitor.query import network_of
+
+Group = Tuple[Any, ...]
+
+
+# dimension name -> (label of a connection, query argument selecting the label)
+DIMENSIONS: Dict[str, Tuple[Callable[[Connection], Any], str]] = {
+    "process": (lambda conn: conn.process or "unknown", "process"),
+    "remote": (lambda conn: conn.raddr_ip, "cidr"),
+    "network": (lambda conn: network_of(conn.raddr_ip), "cidr"),
+    "port": (lambda conn: conn.raddr_port, "rport"),
+    "state": (lambda conn: conn.status, "state"),
+}
+
+
+def dimension(name: str) -> Tuple[Callable[[Connection], Any], str]:
+    """Look up a dimension; ``network/N`` groups IPv4 addresses by /N instead of /24."""
+    if name.startswith("network/"):
+        try:
+            prefix = int(name[len("network/") :])
+        except ValueError:
+            prefix = -1
+        if not 0 <= prefix <= 32:
+            raise ValueError(f"Invalid network prefix in {name!r}")
+        return (lambda conn: network_of(conn.raddr_ip, prefix)), "cidr"
+    if name not in DIMENSIONS:
+        raise ValueError(f"Unknown group-by {name!r}, expected one of: {', '.join(DIMENSIONS)} or network/N")
+    return DIMENSIONS[name]
+
+
+def parse_dimensions(value: str) -> Tuple[str, ...]:
+    """``"process,state"`` -> ``("process", "state")``; raises ValueError for unknown names."""
+    names = tuple(name.strip().lower() for name in value.split(",") if name.strip())
+    if not names:
+        raise ValueError("Nothing to group by")
+    for name in names:
+        dimension(name)
+    return names
+
+
+class GroupCounts:
+    """Live connection counts grouped by the dimensions in ``by``."""
+
+    def __init__(self, by: Sequence[str]) -> None:
+        self.by = tuple(by)
+        dimensions = [dimension(name) for name in self.by]
+        self.labels = [label for label, _ in dimensions]
+        self.arguments = [argument for _, argument in dimensions]
+        self.counts: Counter = Counter()
+        self.members: Dict[Group, Set[Hashable]] = {}
+        self.seeded_from: Optional[Snapshot] = None
+        self.lock = threading.Lock()
+
+    def group_of(self, conn: Connection) -> Group:
+        return tuple(label(conn) for label in self.labels)
+
+    def reset(self, connections: Iterable[Connection], snapshot: Optional[Snapshot] = None) -> None:
+        """Count ``connections`` from scratch; a later delta for ``snapshot`` itself is then ignored."""
+        with self.lock:
+            self.counts.clear()
+            self.members.clear()
+            for conn in connections:
+                self._add(conn)
+            self.seeded_from = snapshot
+
+    def record(self, delta: Delta) -> None:
+        with self.lock:
+            if delta.snapshot is self.seeded_from:
+                return
+            if delta.initial:
+                self.counts.clear()
+                self.members.clear()
+            for conn in delta.opened:
+                self._add(conn)
+            for conn in delta.closed:
+                self._remove(conn)
+            for old, new in delta.changed:
+                self._remove(old)
+                self._add(new)
+
+    def _add(self, conn: Connection) -> None:
+        group = self.group_of(conn)
+        self.counts[group] += 1
+        self.members.setdefault(group, set()).add(conn.key)
+
+    def _remove(self, conn: Connection) -> None:
+        group = self.group_of(conn)
+        members = self.members.get(group)
+        if members is None or conn.key not in members:
+            return
+        members.discard(conn.key)
+        self.counts[group] -= 1
+        if not members:
+            # keep the tables as small as the live group set
+            del self.members[group]
+            del self.counts[group]
+
+    def top(self, n: int) -> List[Tuple[Group, int]]:
+        """The ``n`` largest groups, largest first (ties by group)."""
+        with self.lock:
+            return heapq.nsmallest(n, self.counts.items(), key=lambda item: (-item[1], str(item[0])))
+
+    def member_keys(self, group: Group) -> Set[Hashable]:
+        with self.lock:
+            return set(self.members.get(tuple(group), ()))
+
+    def query_args(self, group: Group) -> Dict[str, str]:
+        """Query arguments (see :func:`connection_monitor.query.parse_query`) selecting ``group``'s members."""
+        args: Dict[str, str] = {}
+        for argument, value in zip(self.arguments, group):
+            if argument == "cidr" and "/" not in args.get(argument, "/"):
+                continue  # a single remote address is narrower than its network
+            args[argument] = str(value)
+        return args
+
+    def rows(self, n: int) -> Dict[str, Any]:
+        """The ``n`` largest groups as served to web clients, each with the query to drill into it."""
+        with self.lock:
+            total = len(self.counts)
+        return {
+            "by": list(self.by),
+            "groups": total,
+            "rows": [
+                {"group": list(group), "count": count, "query": self.query_args(group)} for group, count in self.top(n)
+            ],
+        }
+
+
+def group_label(group: Group) -> str:
+    return ", ".join(str(value) for value in group)
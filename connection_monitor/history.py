@@ -0,0 +1,387 @@
+"""
+Persistent connection history in SQLite
+
+Opened/closed/changed events are appended to an ``events`` table and a
+summary row per periodic snapshot goes to ``snapshots``. The same events
+keep one row per connection lifetime in ``connections`` (opened, closed and
+the latest process and status), so a time window also finds connections
+that opened before it and were still open during it. Writes are queued and
+flushed in batches by a background thread, so recording never blocks the
+monitor loop on disk I/O.
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing, suppress
+from itertools import groupby
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from connection_monitor.collector import Connection
+from connection_monitor.diff import Delta
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    pid INTEGER,
+    process TEXT,
+    proto TEXT,
+    local_ip TEXT,
+    local_port INTEGER,
+    remote_ip TEXT,
+    remote_port INTEGER,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_remote ON events (remote_ip, ts);
+CREATE INDEX IF NOT EXISTS events_port ON events (remote_port, ts);
+CREATE INDEX IF NOT EXISTS events_process ON events (process, ts);
+CREATE TABLE IF NOT EXISTS snapshots (
+    ts REAL NOT NULL,
+    total INTEGER NOT NULL,
+    limited INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_ts ON snapshots (ts);
+CREATE TABLE IF NOT EXISTS connections (
+    opened REAL NOT NULL,
+    closed REAL,
+    pid INTEGER,
+    process TEXT,
+    proto TEXT,
+    local_ip TEXT,
+    local_port INTEGER,
+    remote_ip TEXT,
+    remote_port INTEGER,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS connections_remote ON connections (remote_ip, opened);
+CREATE INDEX IF NOT EXISTS connections_process ON connections (process, opened);
+CREATE INDEX IF NOT EXISTS connections_closed ON connections (closed);
+CREATE INDEX IF NOT EXISTS connections_live ON connections (local_port, remote_ip, remote_port) WHERE closed IS NULL;
+"""
+
+EVENT_COLUMNS = (
+    "ts",
+    "kind",
+    "pid",
+    "process",
+    "proto",
+    "local_ip",
+    "local_port",
+    "remote_ip",
+    "remote_port",
+    "status",
+)
+
+# a connection's row in ``connections`` while it is open, by the event columns after ts and kind
+MATCH_OPEN = "closed IS NULL AND pid IS ? AND proto IS ? AND local_ip IS ? AND local_port IS ? AND remote_ip IS ? AND remote_port IS ?"
+INTERVALS = {
+    "opened": "INSERT INTO connections VALUES (?, NULL, ?, ?, ?, ?, ?, ?, ?, ?)",
+    "closed": f"UPDATE connections SET closed = ? WHERE {MATCH_OPEN}",  # noqa: S608
+    "changed": f"UPDATE connections SET process = ?, status = ? WHERE {MATCH_OPEN}",  # noqa: S608
+}
+# close what a restarted diff reports afresh, as of the last time anything was recorded
+CLOSE_ALL = (
+    "UPDATE connections SET closed = COALESCE(?, (SELECT MAX(ts) FROM (SELECT MAX(ts) AS ts FROM events "
+    "UNION ALL SELECT MAX(ts) FROM snapshots))) WHERE closed IS NULL"
+)
+
+logger = logging.getLogger(__name__)
+
+Row = Tuple[Any, ...]
+
+
+def event_row(ts: float, kind: str, conn: Connection) -> Row:
+    return (
+        ts,
+        kind,
+        conn.pid,
+        conn.process,
+        conn.proto,
+        conn.laddr_ip,
+        conn.laddr_port,
+        conn.raddr_ip,
+        conn.raddr_port,
+        conn.status,
+    )
+
+
+def interval_params(event: Row) -> Row:
+    """Parameters of the :data:`INTERVALS` statement for ``event``."""
+    ts, kind, pid, process, proto, local_ip, local_port, remote_ip, remote_port, status = event
+    key = (pid, proto, local_ip, local_port, remote_ip, remote_port)
+    if kind == "opened":
+        return (ts, *event[2:])
+    if kind == "closed":
+        return (ts, *key)
+    return (process, status, *key)
+
+
+def interval_step(item: Tuple[str, Row]) -> Tuple[str, str]:
+    """Group key of a queued item: resets apart, events by kind."""
+    kind, row = item
+    return kind, row[1] if kind == "event" else ""
+
+
+def query_args(args: Mapping[str, str], max_limit: int = 10000) -> Dict[str, Any]:
+    """Turn HTTP query parameters into :meth:`HistoryStore.query` arguments.
+
+    ``end`` defaults to now and ``start`` to an hour before ``end``; raises
+    ValueError on malformed numbers. ``limit`` is clamped to 1..``max_limit``.
+    """
+    end = float(args.get("end", time.time()))
+    return {
+        "start": float(args.get("start", end - 3600)),
+        "end": end,
+        "remote_ip": args.get("remote_ip"),
+        "remote_port": int(args["remote_port"]) if "remote_port" in args else None,
+        "process": args.get("process"),
+        "kind": args.get("kind"),
+        "limit": max(1, min(int(args.get("limit", 1000)), max_limit)),
+    }
+
+
+def open_history(path: Optional[str], retention_days: Optional[float] = None) -> Optional["HistoryStore"]:
+    """A :class:`HistoryStore` for the command line options, or None without a path.
+
+    ``retention_days`` defaults to the store's 30 days; 0 keeps everything.
+    """
+    if not path:
+        return None
+    if retention_days is None:
+        return HistoryStore(path)
+    return HistoryStore(path, retention=float(retention_days) * 86400 or None)
+
+
+class HistoryStore:
+    """Append-only event store with time-range queries.
+
+    ``path`` must be a file: queries use their own read connections.
+
+    ``retention`` (seconds) bounds how much history is kept; old rows are
+    pruned by :meth:`compact`, which the writer thread runs every
+    ``compact_every`` seconds. ``snapshot_every`` controls how often a summary
+    row is written even when nothing changed.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        retention: Optional[float] = 30 * 86400,
+        batch_size: int = 1000,
+        flush_interval: float = 1.0,
+        snapshot_every: float = 60.0,
+        compact_every: float = 3600.0,
+        max_pending: int = 100000,
+    ) -> None:
+        self.path = path
+        self.retention = retention
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.compact_every = compact_every
+        self.dropped = 0
+        self._last_snapshot = 0.0
+        self._last_ts: Optional[float] = None
+        self._queue: "queue.Queue[Optional[Tuple[str, Row]]]" = queue.Queue(max_pending)
+        self._flushed = threading.Event()
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._conn.executescript(SCHEMA)
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def record(self, delta: Delta) -> None:
+        """Queue the events of ``delta`` (and a periodic snapshot summary)."""
+        ts = delta.snapshot.timestamp
+        if delta.initial:
+            # the diff (re)started: connections still open in the store are not known to be open any more
+            self._put(("reset", (self._last_ts,)))
+        self._last_ts = ts
+        rows = [event_row(ts, "opened", conn) for conn in delta.opened]
+        rows.extend(event_row(ts, "closed", conn) for conn in delta.closed)
+        rows.extend(event_row(ts, "changed", new) for _, new in delta.changed)
+        for row in rows:
+            self._put(("event", row))
+        if ts - self._last_snapshot >= self.snapshot_every:
+            self._last_snapshot = ts
+            self._put(("snapshot", (ts, len(delta.snapshot), int(delta.snapshot.limited))))
+
+    def _put(self, item: Tuple[str, Row]) -> None:
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # the disk cannot keep up; drop rather than stall collection
+            self.dropped += 1
+
+    def flush(self, timeout: float = 10.0) -> None:
+        """Block until everything queued so far has been committed."""
+        self._flushed.clear()
+        self._queue.put(("flush", ()))
+        self._flushed.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Commit what is queued and stop the writer.
+
+        The connection is only closed once the writer has exited; a writer
+        still busy after ``timeout`` keeps it until the process exits.
+        """
+        self.flush(timeout)
+        with suppress(queue.Full):
+            self._queue.put(None, timeout=timeout)
+        self._writer.join(timeout)
+        if self._writer.is_alive():
+            logger.warning("history writer still busy after %.0f s; leaving %s open", timeout, self.path)
+            return
+        self._conn.close()
+
+    def _write_loop(self) -> None:
+        last_compact = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ("idle", ())
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    next_item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if next_item is None:
+                    self._commit(batch)
+                    return
+                batch.append(next_item)
+            self._commit(batch)
+            if self.compact_every and time.monotonic() - last_compact >= self.compact_every:
+                last_compact = time.monotonic()
+                self.compact()
+
+    def _commit(self, batch: List[Tuple[str, Row]]) -> None:
+        events = [row for kind, row in batch if kind == "event"]
+        snapshots = [row for kind, row in batch if kind == "snapshot"]
+        if events or snapshots or any(kind == "reset" for kind, _ in batch):
+            with self._lock, self._conn:
+                if events:
+                    self._conn.executemany(f"INSERT INTO events VALUES ({', '.join('?' * len(EVENT_COLUMNS))})", events)
+                if snapshots:
+                    self._conn.executemany("INSERT INTO snapshots VALUES (?, ?, ?)", snapshots)
+                self._update_intervals(batch)
+        if any(kind == "flush" for kind, _ in batch):
+            self._flushed.set()
+
+    def _update_intervals(self, batch: List[Tuple[str, Row]]) -> None:
+        """Apply the batch's events and resets to ``connections``, in order.
+
+        Consecutive events of one kind go in one statement; order matters
+        because a key may close and open again within a batch.
+        """
+        items = [(kind, row) for kind, row in batch if kind in ("event", "reset")]
+        for (kind, event), group in groupby(items, key=interval_step):
+            if kind == "reset":
+                for _, (last_ts,) in group:
+                    self._conn.execute(CLOSE_ALL, (last_ts,))
+            else:
+                self._conn.executemany(INTERVALS[event], [interval_params(row) for _, row in group])
+
+    def compact(self, now: Optional[float] = None) -> int:
+        """Delete rows older than the retention window; returns rows removed."""
+        if self.retention is None:
+            return 0
+        cutoff = (now if now is not None else time.time()) - self.retention
+        with self._lock:
+            with self._conn:
+                removed = self._conn.execute("DELETE FROM events WHERE ts < ?", (cutoff,)).rowcount
+                removed += self._conn.execute("DELETE FROM snapshots WHERE ts < ?", (cutoff,)).rowcount
+                removed += self._conn.execute("DELETE FROM connections WHERE closed < ?", (cutoff,)).rowcount
+            if removed:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed
+
+    def _read(self, sql: str, params: Any) -> Tuple[List[str], List[Row]]:
+        # a separate read connection keeps queries off the writer's transaction
+        with closing(sqlite3.connect(self.path)) as reader:
+            cursor = reader.execute(sql, params)
+            return [description[0] for description in cursor.description], cursor.fetchall()
+
+    def query(
+        self,
+        start: float,
+        end: float,
+        remote_ip: Optional[str] = None,
+        remote_port: Optional[int] = None,
+        process: Optional[str] = None,
+        kind: Optional[str] = None,
+        limit: int = 1000,
+    ) -> List[Dict[str, Any]]:
+        """Events between ``start`` and ``end`` (epoch seconds), oldest first.
+
+        Connections that opened before ``start`` and were still open at it
+        come first, as ``open`` rows stamped with the time they opened (and
+        their latest process and status), so ``query(t1, t2,
+        remote_ip="10.0.0.5")`` answers "who talked to 10.0.0.5 between t1
+        and t2" even for connections with no event in the window. ``kind``
+        selects one of ``open``, ``opened``, ``closed`` or ``changed``; each
+        filter is served by an index.
+        """
+        filters = [("remote_ip", remote_ip), ("remote_port", remote_port), ("process", process)]
+        selects: List[str] = []
+        params: List[Any] = []
+        if kind in (None, "open"):
+            clauses = ["opened < ?", "(closed IS NULL OR closed >= ?)"]
+            params += [start, start]
+            for column, value in filters:
+                if value is not None:
+                    clauses.append(f"{column} = ?")
+                    params.append(value)
+            columns = ", ".join(EVENT_COLUMNS[2:])
+            where = " AND ".join(clauses)
+            selects.append(
+                f"SELECT opened AS ts, 'open' AS kind, {columns}, 0 AS part, rowid AS seq FROM connections WHERE {where}"  # noqa: S608
+            )
+        if kind != "open":
+            clauses = ["ts >= ?", "ts <= ?"]
+            params += [start, end]
+            for column, value in [*filters, ("kind", kind)]:
+                if value is not None:
+                    clauses.append(f"{column} = ?")
+                    params.append(value)
+            where = " AND ".join(clauses)
+            selects.append(f"SELECT {', '.join(EVENT_COLUMNS)}, 1 AS part, rowid AS seq FROM events WHERE {where}")  # noqa: S608
+        params.append(limit)
+        # ties keep the order rows were recorded in
+        sql = f"SELECT {', '.join(EVENT_COLUMNS)} FROM ({' UNION ALL '.join(selects)}) ORDER BY ts, part, seq LIMIT ?"  # noqa: S608
+        names, rows = self._read(sql, params)
+        return [dict(zip(names, row)) for row in rows]
+
+    def talkers(self, remote_ip: str, start: float, end: float) -> List[Dict[str, Any]]:
+        """Distinct processes with a connection to ``remote_ip`` open at any time in the window.
+
+        ``first_seen`` is when the earliest of them opened (possibly before
+        ``start``), ``last_seen`` when the last closed, None while any is open.
+        """
+        sql = (
+            "SELECT process, pid, COUNT(*) AS connections, MIN(opened) AS first_seen, "
+            "CASE WHEN COUNT(closed) < COUNT(*) THEN NULL ELSE MAX(closed) END AS last_seen "
+            "FROM connections WHERE remote_ip = ? AND opened <= ? AND (closed IS NULL OR closed >= ?) "
+            "GROUP BY process, pid ORDER BY first_seen"
+        )
+        columns, rows = self._read(sql, (remote_ip, end, start))
+        return [dict(zip(columns, row)) for row in rows]
+
+    def snapshots(self, start: float, end: float) -> List[Dict[str, Any]]:
+        _, rows = self._read(
+            "SELECT ts, total, limited FROM snapshots WHERE ts >= ? AND ts <= ? ORDER BY ts", (start, end)
+        )
+        return [{"ts": ts, "total": total, "limited": bool(limited)} for ts, total, limited in rows]
@@ -0,0 +1,329 @@
+"""
+One shared collector fanned out to many subscribers
+
+Every Socket.IO client subscribes with its own filter, rate and encoding.
+Clients asking for the same combination share a :class:`Channel`, so the
+filtering, diffing and encoding for it happen once per tick no matter how
+many clients are in it. The hub is transport agnostic: it is given callables
+to emit to a room or client and to move clients between rooms.
+"""
+
+import asyncio
+import threading
+import time
+from itertools import count
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from connection_monitor.collector import ConnectionCollector, Snapshot
+from connection_monitor.diff import Delta, DiffEngine
+from connection_monitor.groups import GroupCounts
+from connection_monitor.instrumentation import Instruments
+from connection_monitor.pipeline import Enricher, Pipeline
+from connection_monitor.protocol import ConnectionStream, pack
+from connection_monitor.query import IndexCache, Query
+from connection_monitor.scheduler import Scheduler
+
+Emit = Callable[[str, Any, str], None]
+RoomAction = Callable[[str, str], None]
+Spawn = Callable[[Callable[[], None]], Any]
+
+
+def spawn_thread(target: Callable[[], None]) -> threading.Thread:
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+class Channel:
+    """Filtered, encoded view of the collector shared by identical subscriptions."""
+
+    _ids = count(1)
+
+    def __init__(self, filter_text: str, rate: float, encoding: str, query: Optional[Query] = None) -> None:
+        self.id = next(self._ids)
+        self.room = f"channel-{self.id}"
+        self.filter_text = filter_text
+        self.query = query
+        self.rate = rate
+        self.diff = DiffEngine()
+        self.stream = ConnectionStream(encoding)
+        self.members: Set[str] = set()
+        self.primed = False
+        self.last_emit = 0.0
+
+    @property
+    def version(self) -> int:
+        return self.stream.version
+
+    def due(self, now: float) -> bool:
+        return now - self.last_emit >= self.rate
+
+    def update(self, snapshot: Snapshot) -> Dict[str, Any]:
+        """Apply a collector snapshot and return the channel's patch message."""
+        if self.filter_text or self.query is not None:
+            rows = snapshot.connections
+            if self.query is not None:
+                rows = [conn for conn in rows if self.query.match(conn)]
+            if self.filter_text:
+                rows = [conn for conn in rows if conn.matches(self.filter_text)]
+            snapshot = Snapshot(rows, snapshot.timestamp, snapshot.limited)
+        self.primed = True
+        message = self.stream.update(self.diff.update(snapshot))
+        message["channel"] = self.id
+        return message
+
+    def snapshot(self) -> Dict[str, Any]:
+        message = self.stream.snapshot()
+        message["channel"] = self.id
+        return message
+
+    def pack(self, message: Dict[str, Any]) -> Any:
+        return pack(message, self.stream.encoding)
+
+
+class Subscriber:
+    __slots__ = ("sid", "channel", "acked", "paused_at", "warned")
+
+    def __init__(self, sid: str) -> None:
+        self.sid = sid
+        self.channel: Optional[Channel] = None
+        self.acked = 0
+        # version at which the client fell too far behind, or None
+        self.paused_at: Optional[int] = None
+        self.warned = False
+
+
+class CollectorHub:
+    """Run one collector while anyone is subscribed and fan its output out.
+
+    Slow clients are handled drop-to-latest: a client that has not
+    acknowledged within ``max_lag`` versions is taken out of its channel's
+    room, and once it catches up it gets a single fresh snapshot instead of
+    the patches it missed. No per-client queue grows without bound.
+
+    With ``pipeline`` enabled, collection runs as an asyncio
+    :class:`~connection_monitor.pipeline.Pipeline` through ``enrichers``;
+    otherwise each scheduler tick collects, diffs and publishes in turn.
+    ``spawn`` starts the background worker, e.g. Flask-SocketIO's
+    ``start_background_task``; the pipeline runs its own event loop in that
+    worker, so it needs a real thread (the ``threading`` async_mode).
+    Every patch carries the tick's timing and the hub's own cost from
+    :attr:`instruments`.
+    """
+
+    def __init__(
+        self,
+        collector: ConnectionCollector,
+        emit: Emit,
+        join: RoomAction,
+        leave: RoomAction,
+        max_lag: int = 5,
+        scheduler_options: Optional[Dict[str, Any]] = None,
+        pipeline: bool = False,
+        spawn: Spawn = spawn_thread,
+    ) -> None:
+        self.collector = collector
+        self.emit = emit
+        self.join = join
+        self.leave = leave
+        self.max_lag = max_lag
+        self.scheduler_options = scheduler_options if scheduler_options is not None else {}
+        self.diff = DiffEngine()
+        self.channels: Dict[Tuple[str, float, str, Any], Channel] = {}
+        self.subscribers: Dict[str, Subscriber] = {}
+        self.last_snapshot: Optional[Snapshot] = None
+        self.use_pipeline = pipeline
+        self.enrichers: List[Enricher] = []
+        self.spawn = spawn
+        self.scheduler: Optional[Scheduler] = None
+        self.pipeline: Optional[Pipeline] = None
+        self.lock = threading.RLock()
+        self.dropped = 0
+        self.index = IndexCache()
+        # group-by views in use, most recently requested last
+        self.groupings: Dict[Tuple[str, ...], GroupCounts] = {}
+        self.max_groupings = 8
+        self.instruments = Instruments(collector, self.enrichers)
+
+    @property
+    def running(self) -> bool:
+        return self.scheduler is not None and self.scheduler.running
+
+    def subscribe(
+        self,
+        sid: str,
+        filter_text: str = "",
+        rate: float = 2.0,
+        encoding: str = "json",
+        query: Optional[Query] = None,
+    ) -> Channel:
+        """(Re)subscribe ``sid``; it receives the channel's snapshot right away if one exists.
+
+        ``query`` narrows the stream with structured filters (its sort and
+        page do not apply to streams).
+        """
+        key = (filter_text.strip().lower(), max(float(rate), 0.0), encoding, query.filters if query else None)
+        with self.lock:
+            subscriber = self.subscribers.get(sid) or Subscriber(sid)
+            self.subscribers[sid] = subscriber
+            channel = self.channels.get(key)
+            if channel is None:
+                channel = self.channels[key] = Channel(*key[:3], query)
+                if self.last_snapshot is not None:
+                    channel.update(self.last_snapshot)
+            if subscriber.channel is not channel:
+                self._leave_channel(subscriber)
+                subscriber.channel = channel
+                channel.members.add(sid)
+                self.join(sid, channel.room)
+            subscriber.acked = channel.version
+            subscriber.paused_at = None
+            if channel.primed:
+                self.emit("connections_snapshot", channel.pack(channel.snapshot()), sid)
+            self._ensure_running()
+        return channel
+
+    def unsubscribe(self, sid: str) -> None:
+        with self.lock:
+            subscriber = self.subscribers.pop(sid, None)
+            if subscriber is not None:
+                self._leave_channel(subscriber)
+            if not self.subscribers:
+                self.stop()
+
+    def ack(self, sid: str, channel_id: int, version: int) -> None:
+        """Record that ``sid`` has applied ``version``; resume it if it was paused."""
+        with self.lock:
+            subscriber = self.subscribers.get(sid)
+            if subscriber is None or subscriber.channel is None or subscriber.channel.id != channel_id:
+                return
+            channel = subscriber.channel
+            subscriber.acked = max(subscriber.acked, version)
+            if subscriber.paused_at is not None and subscriber.acked >= subscriber.paused_at:
+                subscriber.paused_at = None
+                subscriber.acked = channel.version
+                self.join(sid, channel.room)
+                self.emit("connections_snapshot", channel.pack(channel.snapshot()), sid)
+
+    def resync(self, sid: str) -> None:
+        with self.lock:
+            subscriber = self.subscribers.get(sid)
+            if subscriber is not None and subscriber.channel is not None and subscriber.channel.primed:
+                channel = subscriber.channel
+                self.emit("connections_snapshot", channel.pack(channel.snapshot()), sid)
+
+    def search(self, query: Query, snapshot: Optional[Snapshot] = None) -> Dict[str, Any]:
+        """Answer ``query`` from ``snapshot``, by default the latest one published.
+
+        The snapshot's index is built on the first query and shared by the
+        rest until the next tick.
+        """
+        snapshot = snapshot or self.last_snapshot or Snapshot([], time.time())
+        page = self.index.get(snapshot).search(query)
+        page["timestamp"] = snapshot.timestamp
+        return page
+
+    def groups(self, by: Tuple[str, ...]) -> GroupCounts:
+        """Incrementally maintained counts for the group-by ``by``.
+
+        The first request for a grouping counts the current connections
+        once; after that it follows the deltas. Only the ``max_groupings``
+        most recently used groupings are kept up to date.
+        """
+        with self.lock:
+            groups = self.groupings.pop(by, None)
+            if groups is None:
+                groups = GroupCounts(by)
+                # seed from the snapshot of the last delta, which every later delta follows
+                delta = self.diff.last_delta
+                if delta is not None:
+                    groups.reset(delta.snapshot, delta.snapshot)
+                listeners = [*self.diff.listeners, groups.record]
+                if len(self.groupings) >= self.max_groupings:
+                    evicted = self.groupings.pop(next(iter(self.groupings)))
+                    listeners.remove(evicted.record)
+                self.diff.listeners = listeners
+            self.groupings[by] = groups
+            return groups
+
+    def stop(self) -> None:
+        with self.lock:
+            if self.scheduler is not None:
+                self.scheduler.stop()
+            self.scheduler = None
+            self.pipeline = None
+
+    def tick(self) -> Delta:
+        snapshot = self.instruments.timed("collect", self.collector.collect)
+        delta = self.instruments.timed("diff", self.diff.update, snapshot)
+        self.publish(snapshot)
+        return delta
+
+    def publish(self, snapshot: Snapshot) -> None:
+        """Fan ``snapshot`` out to every channel that is due."""
+        now = time.monotonic()
+        with self.lock:
+            self.last_snapshot = snapshot
+            tick_stats = self.scheduler.stats() if self.scheduler is not None else {}
+            tick_stats["self"] = self.instruments.stats()
+            serialize = emit = 0.0
+            published = False
+            for channel in list(self.channels.values()):
+                if not channel.members or (channel.primed and not channel.due(now)):
+                    continue
+                started = time.perf_counter()
+                first = not channel.primed
+                message = channel.update(snapshot)
+                channel.last_emit = now
+                if first:
+                    event, payload = "connections_snapshot", channel.pack(channel.snapshot())
+                else:
+                    message["tick"] = tick_stats
+                    event, payload = "connections_patch", channel.pack(message)
+                packed = time.perf_counter()
+                self.emit(event, payload, channel.room)
+                serialize += packed - started
+                emit += time.perf_counter() - packed
+                published = True
+                self._check_lag(channel)
+            if published:
+                self.instruments.stages.add("serialize", serialize)
+                self.instruments.stages.add("emit", emit)
+            if snapshot.limited:
+                for subscriber in self.subscribers.values():
+                    if not subscriber.warned:
+                        subscriber.warned = True
+                        self.emit("permission_warning", None, subscriber.sid)
+
+    def _check_lag(self, channel: Channel) -> None:
+        for sid in list(channel.members):
+            subscriber = self.subscribers[sid]
+            if subscriber.paused_at is None and channel.version - subscriber.acked > self.max_lag:
+                subscriber.paused_at = channel.version
+                self.dropped += 1
+                self.leave(sid, channel.room)
+
+    def _leave_channel(self, subscriber: Subscriber) -> None:
+        channel = subscriber.channel
+        if channel is None:
+            return
+        channel.members.discard(subscriber.sid)
+        self.leave(subscriber.sid, channel.room)
+        subscriber.channel = None
+        if not channel.members:
+            query = channel.query.filters if channel.query is not None else None
+            self.channels.pop((channel.filter_text, channel.rate, channel.stream.encoding, query), None)
+
+    def _ensure_running(self) -> None:
+        if self.running:
+            return
+        self.diff.reset()
+        self.last_snapshot = None
+        scheduler = self.scheduler = Scheduler(**self.scheduler_options)
+        if self.use_pipeline:
+            pipeline = self.pipeline = Pipeline(
+                self.collector, self.diff, self.publish, self.enrichers, scheduler, stages=self.instruments.stages
+            )
+            self.spawn(lambda: asyncio.run(pipeline.run()))
+        else:
+            self.spawn(lambda: scheduler.run(self.tick))
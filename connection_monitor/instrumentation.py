@@ -0,0 +1,199 @@
+"""
+Self-instrumentation: what the monitor itself costs
+
+:class:`Instruments` gathers per-stage wall times, how many sockets and
+processes the last collection scanned, the hit rates of the caches and the
+monitor's own RSS and CPU share, for the status line of every front-end.
+:class:`TickProfiler` records cProfile statistics for a number of ticks
+(``--profile``) to a file for ``python -m pstats`` or snakeviz.
+"""
+
+import cProfile
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, TypeVar
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Stages in pipeline order; each front-end times the ones it has
+STAGES = ("collect", "enrich", "diff", "serialize", "emit", "render")
+
+
+class StageTimes:
+    """Wall time of each stage in the most recent tick, plus a smoothed average.
+
+    Stages may be timed from different threads; each one only ever replaces
+    its own entries.
+    """
+
+    def __init__(self, smoothing: float = 0.2) -> None:
+        self.smoothing = smoothing
+        self.last: Dict[str, float] = {}
+        self.average: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.last[stage] = seconds
+        average = self.average.get(stage)
+        self.average[stage] = seconds if average is None else average + self.smoothing * (seconds - average)
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def ordered(self) -> Sequence[str]:
+        return [stage for stage in STAGES if stage in self.last] + [stage for stage in self.last if stage not in STAGES]
+
+    def as_dict(self, average: bool = False) -> Dict[str, float]:
+        """Milliseconds per stage, in pipeline order."""
+        times = self.average if average else self.last
+        return {stage: round(times[stage] * 1000, 2) for stage in self.ordered()}
+
+
+class Instruments:
+    """The monitor's own cost, gathered from the pieces it is built from.
+
+    ``collector`` provides the scan counts and the process cache,
+    ``enrichers`` (a live list; enrichers may be added later) their cache
+    statistics. CPU usage is averaged over at least ``cpu_window`` seconds,
+    so frequent callers do not see noise.
+    """
+
+    def __init__(self, collector: Any = None, enrichers: Sequence[Any] = (), cpu_window: float = 1.0) -> None:
+        self.collector = collector
+        self.enrichers = enrichers
+        self.stages = StageTimes()
+        self.cpu_window = cpu_window
+        self.process = psutil.Process()
+        self.cpu_percent = 0.0
+        self._cpu_sample = (time.monotonic(), self._cpu_time())
+
+    def timed(self, stage: str, function: Callable[..., T], *args: Any) -> T:
+        with self.stages.time(stage):
+            return function(*args)
+
+    def usage(self) -> Dict[str, float]:
+        """Resident memory in MB and CPU time as a percentage of one core."""
+        now = time.monotonic()
+        with self.process.oneshot():
+            rss = self.process.memory_info().rss
+            cpu = self._cpu_time()
+        sampled_at, sampled_cpu = self._cpu_sample
+        if now - sampled_at >= self.cpu_window:
+            self.cpu_percent = (cpu - sampled_cpu) / (now - sampled_at) * 100
+            self._cpu_sample = (now, cpu)
+        return {"rss_mb": round(rss / 1e6, 1), "cpu_percent": round(self.cpu_percent, 1)}
+
+    def scanned(self) -> Dict[str, int]:
+        return dict(getattr(self.collector, "scanned", None) or {})
+
+    def caches(self) -> Dict[str, Dict[str, Any]]:
+        """Statistics of the process cache, the inode map and every enricher that keeps any."""
+        caches: Dict[str, Dict[str, Any]] = {}
+        if self.collector is not None:
+            caches["process"] = self.collector.process_cache.stats()
+            inodes = getattr(self.collector.backend, "inodes", None)
+            if inodes is not None:
+                caches["inodes"] = {"scans": inodes.scans, "walked": inodes.walked, "size": len(inodes)}
+        for enricher in self.enrichers:
+            if hasattr(enricher, "stats"):
+                caches[type(enricher).__name__] = enricher.stats()
+        return caches
+
+    def stats(self, caches: bool = False) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {"stages_ms": self.stages.as_dict(), "scanned": self.scanned(), **self.usage()}
+        if caches:
+            stats["stages_avg_ms"] = self.stages.as_dict(average=True)
+            stats["caches"] = self.caches()
+        return stats
+
+    def summary(self) -> str:
+        """One status line: stage times, own memory and CPU, scan counts, process cache hits."""
+        parts = []
+        stages = self.stages.as_dict()
+        if stages:
+            parts.append(", ".join(f"{stage} {ms:.1f}" for stage, ms in stages.items()) + " ms")
+        usage = self.usage()
+        parts.append(f"RSS {usage['rss_mb']:.1f} MB, CPU {usage['cpu_percent']:.1f}%")
+        scanned = self.scanned()
+        if scanned:
+            parts.append(f"{scanned['sockets']} sockets, {scanned['processes']} processes scanned")
+        if self.collector is not None:
+            parts.append(f"process cache {self.collector.process_cache.stats()['hit_rate']:.0%} hits")
+        return " | ".join(parts)
+
+    def _cpu_time(self) -> float:
+        times = self.process.cpu_times()
+        return float(times.user + times.system)
+
+
+class TickProfiler:
+    """Profile the first ``ticks`` scheduler ticks with cProfile and write them to ``path``.
+
+    The scheduler counts ticks through :meth:`tick`; work a tick hands to
+    other threads (pipeline stages, the UI thread) is profiled through
+    :meth:`call`. cProfile follows one thread at a time, so profiled calls
+    are serialised by a lock while profiling is on. The statistics are
+    written once the last tick completes, or by :meth:`finish` on shutdown.
+    """
+
+    def __init__(self, path: str, ticks: int = 30) -> None:
+        if ticks < 1:
+            raise ValueError("the number of ticks to profile must be at least 1")
+        self.path = path
+        self.remaining = ticks
+        self.profile = cProfile.Profile()
+        self.lock = threading.Lock()
+        self.written = False
+
+    @property
+    def active(self) -> bool:
+        return self.remaining > 0
+
+    def call(self, function: Callable[..., T], *args: Any) -> T:
+        """Run ``function(*args)``, profiled while ticks remain."""
+        if not self.active:
+            return function(*args)
+        with self.lock:
+            self.profile.enable()
+            try:
+                return function(*args)
+            finally:
+                self.profile.disable()
+
+    def tick(self, function: Callable[[], T]) -> T:
+        """Run one scheduler tick; the last profiled one writes the statistics."""
+        if not self.active:
+            return function()
+        try:
+            return self.call(function)
+        finally:
+            self.remaining -= 1
+            if not self.active:
+                self.finish()
+
+    def finish(self) -> None:
+        """Stop profiling and write what was recorded, once."""
+        self.remaining = 0
+        with self.lock:
+            if self.written:
+                return
+            self.written = True
+            self.profile.dump_stats(self.path)
+        logger.info("wrote profile to %s (python -m pstats %s)", self.path, self.path)
+
+
+def open_profiler(path: Optional[str], ticks: Optional[int] = None) -> Optional[TickProfiler]:
+    """A :class:`TickProfiler` for the command line/config options, or None without a path."""
+    if not path:
+        return None
+    return TickProfiler(path, int(ticks) if ticks else 30)
@@ -0,0 +1,217 @@
+"""
+Prometheus text exposition of connection and collector metrics
+
+:class:`ConnectionMetrics` is a delta listener: it keeps per-label connection
+counts up to date from opened/closed/changed events, so a scrape only walks
+the (small) label tables, never the connection rows. Each labelled family is
+capped at ``max_series`` values; the rest is summed into a ``..._other`` gauge.
+The time of the last update is exported too, and a renderer that knows how
+often updates should arrive can leave out gauges that have gone stale.
+"""
+
+import heapq
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from connection_monitor.bandwidth import BandwidthTracker
+from connection_monitor.collector import Connection
+from connection_monitor.diff import Delta
+from connection_monitor.query import network_of
+from connection_monitor.scheduler import Scheduler
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (metric suffix, label name, help text) for each connection breakdown
+FAMILIES = (
+    ("state", "state", "Open connections by TCP state"),
+    ("process", "process", "Open connections by owning process"),
+    ("remote_port", "port", "Open connections by remote port"),
+    ("remote_network", "network", "Open connections by remote /24 (IPv4) or /48 (IPv6) network"),
+)
+
+
+def labels_of(conn: Connection) -> Tuple[str, str, str, str]:
+    """Label values of ``conn`` in :data:`FAMILIES` order."""
+    return (
+        conn.status,
+        conn.process or "unknown",
+        str(conn.raddr_port) if conn.raddr_port else "none",
+        network_of(conn.raddr_ip),
+    )
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_sample(name: str, value: float, labels: Optional[Dict[str, str]] = None) -> str:
+    if labels:
+        pairs = ",".join(f'{key}="{escape(val)}"' for key, val in labels.items())
+        return f"{name}{{{pairs}}} {value}"
+    return f"{name} {value}"
+
+
+class ConnectionMetrics:
+    """Incrementally maintained connection counts, rendered on demand."""
+
+    prefix = "connection_monitor"
+
+    def __init__(self, max_series: int = 50) -> None:
+        self.max_series = max_series
+        self.counts: List[Counter] = [Counter() for _ in FAMILIES]
+        self.total = 0
+        self.opened = 0
+        self.closed = 0
+        # timestamp of the snapshot behind the last delta
+        self.updated: Optional[float] = None
+        self.lock = threading.Lock()
+
+    def record(self, delta: Delta) -> None:
+        with self.lock:
+            self._record(delta)
+
+    def _record(self, delta: Delta) -> None:
+        self.updated = delta.snapshot.timestamp
+        if delta.initial:
+            # everything present is reported as opened; start counting afresh
+            for counts in self.counts:
+                counts.clear()
+            self.total = 0
+        else:
+            self.opened += len(delta.opened)
+            self.closed += len(delta.closed)
+        for conn in delta.opened:
+            self._add(conn, 1)
+        for conn in delta.closed:
+            self._add(conn, -1)
+        for old, new in delta.changed:
+            self._add(old, -1)
+            self._add(new, 1)
+
+    def _add(self, conn: Connection, step: int) -> None:
+        self.total += step
+        for counts, label in zip(self.counts, labels_of(conn)):
+            counts[label] += step
+            if not counts[label]:
+                # keep the tables as small as the live label set
+                del counts[label]
+
+    def top(self, counts: Counter) -> Tuple[List[Tuple[str, int]], int]:
+        """The ``max_series`` largest ``(label, count)`` pairs and the sum of the rest."""
+        if len(counts) <= self.max_series:
+            return sorted(counts.items()), 0
+        kept = heapq.nlargest(self.max_series, counts.items(), key=lambda item: item[1])
+        return kept, sum(counts.values()) - sum(value for _, value in kept)
+
+    def render(
+        self,
+        scheduler: Optional[Scheduler] = None,
+        cache_stats: Optional[Dict[str, Any]] = None,
+        dropped: Optional[Dict[str, int]] = None,
+        bandwidth: Optional[BandwidthTracker] = None,
+        max_age: Optional[float] = None,
+        now: Optional[float] = None,
+    ) -> str:
+        """Return the exposition text, including the collector's own stats.
+
+        ``dropped`` maps a source (e.g. ``hub`` or ``history``) to the number
+        of updates it has discarded so far. ``bandwidth`` adds per-process
+        throughput for the ``max_series`` busiest process names. With
+        ``max_age`` (seconds) the connection and throughput gauges are left
+        out once the last update is older than that, e.g. because collection
+        has stopped; the counters and the last update time remain.
+        """
+        p = self.prefix
+        with self.lock:
+            tables = [Counter(counts) for counts in self.counts]
+            total, opened, closed, updated = self.total, self.opened, self.closed, self.updated
+        now = now if now is not None else time.time()
+        fresh = max_age is None or (updated is not None and now - updated <= max_age)
+        lines = [
+            f"# HELP {p}_connections_opened_total Connections seen opening",
+            f"# TYPE {p}_connections_opened_total counter",
+            format_sample(f"{p}_connections_opened_total", opened),
+            f"# HELP {p}_connections_closed_total Connections seen closing",
+            f"# TYPE {p}_connections_closed_total counter",
+            format_sample(f"{p}_connections_closed_total", closed),
+        ]
+        if updated is not None:
+            name = f"{p}_last_update_timestamp_seconds"
+            lines.append(f"# HELP {name} Time of the snapshot the connection metrics were last updated from")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(format_sample(name, round(updated, 3)))
+        if fresh:
+            lines.append(f"# HELP {p}_connections Open connections")
+            lines.append(f"# TYPE {p}_connections gauge")
+            lines.append(format_sample(f"{p}_connections", total))
+            for (suffix, label, help_text), counts in zip(FAMILIES, tables):
+                lines.extend(self._family(f"{p}_connections_by_{suffix}", label, help_text, counts))
+            if bandwidth is not None:
+                lines.extend(self._bandwidth(bandwidth))
+        lines.extend(self._collector(scheduler, cache_stats, dropped))
+        return "\n".join(lines) + "\n"
+
+    def _family(self, name: str, label: str, help_text: str, counts: Counter) -> List[str]:
+        """One labelled gauge, with what does not fit in ``max_series`` in its own ``_other`` gauge.
+
+        The remainder is a separate series rather than an ``other`` label, which
+        a real process or network of that name would collide with.
+        """
+        kept, folded = self.top(counts)
+        return [
+            f"# HELP {name} {help_text}",
+            f"# TYPE {name} gauge",
+            *(format_sample(name, value, {label: key}) for key, value in kept),
+            f"# HELP {name}_other Open connections outside the {self.max_series} largest series of {name}",
+            f"# TYPE {name}_other gauge",
+            format_sample(f"{name}_other", folded),
+        ]
+
+    def _bandwidth(self, bandwidth: BandwidthTracker) -> List[str]:
+        rates: Dict[str, List[float]] = {}
+        for process, rx, tx in list(bandwidth.processes.values()):
+            totals = rates.setdefault(process or "unknown", [0.0, 0.0])
+            totals[0] += rx
+            totals[1] += tx
+        busiest = heapq.nlargest(self.max_series, rates.items(), key=lambda item: item[1][0] + item[1][1])
+        lines: List[str] = []
+        for index, (direction, verb) in enumerate((("receive", "received"), ("transmit", "sent"))):
+            name = f"{self.prefix}_process_{direction}_bytes_per_second"
+            lines.append(f"# HELP {name} Bytes per second {verb} by the busiest processes")
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(
+                format_sample(name, round(values[index], 1), {"process": process}) for process, values in busiest
+            )
+        return lines
+
+    def _collector(
+        self, scheduler: Optional[Scheduler], cache_stats: Optional[Dict[str, Any]], dropped: Optional[Dict[str, int]]
+    ) -> List[str]:
+        """The collector's own tick, process cache and dropped update stats."""
+        p = self.prefix
+        lines: List[str] = []
+        if scheduler is not None:
+            name = f"{p}_tick_duration_seconds"
+            lines.append(f"# HELP {name} Time spent collecting per tick")
+            lines.append(f"# TYPE {name} summary")
+            lines.append(format_sample(f"{name}_sum", round(scheduler.busy, 6)))
+            lines.append(format_sample(f"{name}_count", scheduler.ticks))
+            lines.append(f"# HELP {p}_tick_interval_seconds Current polling interval")
+            lines.append(f"# TYPE {p}_tick_interval_seconds gauge")
+            lines.append(format_sample(f"{p}_tick_interval_seconds", round(scheduler.interval, 3)))
+        if cache_stats is not None:
+            lines.append(f"# HELP {p}_process_cache_hit_ratio Process metadata cache hit ratio")
+            lines.append(f"# TYPE {p}_process_cache_hit_ratio gauge")
+            lines.append(format_sample(f"{p}_process_cache_hit_ratio", cache_stats["hit_rate"]))
+            for key in ("hits", "misses", "evictions"):
+                name = f"{p}_process_cache_{key}_total"
+                lines.append(f"# TYPE {name} counter")
+                lines.append(format_sample(name, cache_stats[key]))
+        if dropped:
+            name = f"{p}_dropped_updates_total"
+            lines.append(f"# HELP {name} Updates discarded because a consumer fell behind")
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(format_sample(name, count, {"source": source}) for source, count in sorted(dropped.items()))
+        return lines
@@ -0,0 +1,346 @@
+"""
+Asyncio collection pipeline: collect -> enrich -> diff -> emit
+
+Each stage runs as its own task, joined to the next by a bounded queue. A
+full queue drops its oldest item, so a slow stage loses intermediate
+snapshots rather than delaying the ones behind it. Enrichers only fill in
+what they already have cached; lookups for the rest run as background tasks
+and show up on a later snapshot, which the diff then reports as changed.
+
+asyncio is imported where it is first needed, so the console and wx
+monitors without enrichers start up without it.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Protocol,
+    Sequence,
+    Set,
+    TypeVar,
+    cast,
+)
+
+from connection_monitor.collector import ConnectionCollector, Snapshot
+from connection_monitor.diff import Delta, DiffEngine
+from connection_monitor.instrumentation import StageTimes
+from connection_monitor.process_cache import ProcessCache
+from connection_monitor.scheduler import Scheduler
+
+if TYPE_CHECKING:
+    import asyncio
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Enricher(Protocol):
+    """Adds data to connections without ever blocking the pipeline."""
+
+    def apply(self, snapshot: Snapshot) -> Set[Hashable]:
+        """Fill in cached values and return the keys that still need a lookup."""
+
+    async def resolve(self, keys: Set[Hashable]) -> None:
+        """Look ``keys`` up so a later :meth:`apply` finds them cached."""
+
+
+class ProcessEnricher:
+    """Name processes from the :class:`ProcessCache`, loading misses in a thread.
+
+    Processes still being looked up keep ``process`` None, so history,
+    groups, metrics and alerts never see a placeholder; front-ends show them
+    as resolving. Processes that cannot be inspected (gone, or access denied)
+    are named ``Unknown`` and retried after ``retry`` seconds.
+    """
+
+    def __init__(self, process_cache: ProcessCache, executor: Optional[Executor] = None, retry: float = 30.0) -> None:
+        self.process_cache = process_cache
+        self.executor = executor
+        self.retry = retry
+        self.unknown: Dict[int, float] = {}
+
+    def apply(self, snapshot: Snapshot) -> Set[Hashable]:
+        missing: Set[Hashable] = set()
+        now = time.monotonic()
+        for conn in snapshot:
+            # the collector already names pid-less sockets
+            if conn.process is not None or conn.pid is None:
+                continue
+            info = self.process_cache.peek(conn.pid)
+            if info is not None:
+                conn.process = info.name
+            elif self.unknown.get(conn.pid, 0.0) > now:
+                conn.process = "Unknown"
+            else:
+                missing.add(conn.pid)
+        return missing
+
+    async def resolve(self, keys: Set[Hashable]) -> None:
+        import asyncio
+
+        # apply only ever reports pids
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._load, cast(Set[int], keys))
+
+    def _load(self, pids: Set[int]) -> None:
+        now = time.monotonic()
+        for pid, expires in list(self.unknown.items()):
+            if expires <= now:
+                del self.unknown[pid]
+        for pid in pids:
+            if self.process_cache.lookup(pid) is None:
+                self.unknown[pid] = now + self.retry
+
+
+def offer(queue: "asyncio.Queue[Any]", item: Any) -> bool:
+    """Put ``item`` without waiting, evicting the oldest entry if the queue is full.
+
+    Returns True if something was dropped.
+    """
+    dropped = False
+    if queue.full():
+        queue.get_nowait()
+        dropped = True
+    queue.put_nowait(item)
+    return dropped
+
+
+def build_enrichers(resolve: bool = False, geoip: Optional[str] = None, bandwidth: bool = True) -> List[Enricher]:
+    """Enrichers for the command line/config options.
+
+    ``geoip`` is a comma separated list of database paths (see
+    :func:`connection_monitor.geoip.open_table`). ``bandwidth`` adds a
+    :class:`~connection_monitor.bandwidth.BandwidthTracker` for throughput.
+    Each enricher's module is imported only when it is wanted; the resolver's
+    brings in asyncio.
+    """
+    enrichers: List[Enricher] = []
+    if bandwidth:
+        from connection_monitor.bandwidth import BandwidthTracker
+
+        enrichers.append(BandwidthTracker())
+    if geoip:
+        from connection_monitor.geoip import GeoEnricher
+
+        enrichers.append(GeoEnricher.from_paths(path.strip() for path in geoip.split(",") if path.strip()))
+    if resolve:
+        from connection_monitor.resolver import ReverseResolver
+
+        enrichers.append(ReverseResolver())
+    return enrichers
+
+
+def close_enrichers(enrichers: Sequence[Enricher]) -> None:
+    """Release whatever ``enrichers`` hold open (mapped databases, resolver threads)."""
+    for enricher in enrichers:
+        close = getattr(enricher, "close", None)
+        if close is not None:
+            close()
+
+
+class Enrichment:
+    """Apply enrichers to snapshots and resolve their misses in the background.
+
+    Keys already being looked up are not requested again, so a burst of
+    snapshots costs one lookup per key. Lookups run on ``loop``: the caller's
+    event loop, or for monitors that have no event loop of their own a
+    private one enabled by :meth:`start`. That loop (and asyncio) is only
+    started once some enricher has something to look up.
+    """
+
+    def __init__(self, enrichers: Sequence[Enricher] = ()) -> None:
+        self.enrichers = list(enrichers)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.private = False
+        self._inflight: Dict[int, Set[Hashable]] = {}
+        self._pending: Set[Future[None]] = set()
+
+    def start(self) -> None:
+        """Run lookups on a private event loop, started in a daemon thread when first needed."""
+        self.private = True
+
+    def _private_loop(self) -> "asyncio.AbstractEventLoop":
+        import asyncio
+
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, name="enrichment", daemon=True).start()
+        return self.loop
+
+    def stop(self) -> None:
+        self.cancel()
+        self.private = False
+        loop, self.loop = self.loop, None
+        if loop is not None:
+            import asyncio
+
+            asyncio.run_coroutine_threadsafe(self._drain(), loop)
+
+    @staticmethod
+    async def _drain() -> None:
+        """Stop the running loop once the cancelled lookups have unwound."""
+        import asyncio
+
+        current = asyncio.current_task()
+        await asyncio.gather(*(task for task in asyncio.all_tasks() if task is not current), return_exceptions=True)
+        asyncio.get_running_loop().stop()
+
+    def apply(self, snapshot: Snapshot, loop: "Optional[asyncio.AbstractEventLoop]" = None) -> Snapshot:
+        """Enrich ``snapshot`` in place from cache and queue lookups for the rest."""
+        loop = loop or self.loop
+        for enricher in self.enrichers:
+            inflight = self._inflight.setdefault(id(enricher), set())
+            missing = enricher.apply(snapshot) - inflight
+            if missing and loop is None and self.private:
+                loop = self._private_loop()
+            if missing and loop is not None:
+                import asyncio
+
+                inflight |= missing
+                future = asyncio.run_coroutine_threadsafe(self._resolve(enricher, missing, inflight), loop)
+                self._pending.add(future)
+                future.add_done_callback(self._pending.discard)
+        return snapshot
+
+    def replace(self, enrichers: Sequence[Enricher]) -> None:
+        """Switch to ``enrichers``, cancelling the old ones' lookups and closing them."""
+        self.cancel()
+        old, self.enrichers = self.enrichers, list(enrichers)
+        self._inflight.clear()
+        retired = [enricher for enricher in old if enricher not in self.enrichers]
+        if self.loop is not None:
+            # close one iteration later, after the cancellations reach the lookups
+            self.loop.call_soon_threadsafe(self.loop.call_soon, close_enrichers, retired)
+        else:
+            close_enrichers(retired)
+
+    def cancel(self) -> None:
+        for future in list(self._pending):
+            future.cancel()
+
+    async def _resolve(self, enricher: Enricher, keys: Set[Hashable], inflight: Set[Hashable]) -> None:
+        try:
+            await enricher.resolve(keys)
+        except Exception:
+            logger.exception("enrichment lookup failed")
+        finally:
+            inflight -= keys
+
+
+class Pipeline:
+    """Drive ``collector`` through enrichment and ``diff`` into ``emit``.
+
+    Collection runs on ``scheduler`` in a worker thread, because the backends
+    make blocking system calls; diffing and ``emit`` also run in worker
+    threads so the event loop only moves items between queues and applies
+    cached enrichment. The diff stage reports each delta to the scheduler,
+    which adapts on it at its next tick.
+    Collection, enrichment and diffing are timed into ``stages``; ``emit``
+    times its own parts. While the scheduler's profiler is on, the stages
+    running outside the scheduler thread are profiled too.
+    """
+
+    def __init__(
+        self,
+        collector: ConnectionCollector,
+        diff: DiffEngine,
+        emit: Callable[[Snapshot], None],
+        enrichers: Sequence[Enricher] = (),
+        scheduler: Optional[Scheduler] = None,
+        queue_size: int = 1,
+        stages: Optional[StageTimes] = None,
+    ) -> None:
+        self.collector = collector
+        self.diff = diff
+        self.emit = emit
+        self.enrichment = Enrichment(enrichers)
+        self.scheduler = scheduler or Scheduler()
+        self.queue_size = queue_size
+        self.stages = stages if stages is not None else StageTimes()
+        self.dropped = 0
+
+    async def run(self) -> None:
+        """Run until the scheduler is stopped."""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        collected: asyncio.Queue[Snapshot] = asyncio.Queue(self.queue_size)
+        enriched: asyncio.Queue[Snapshot] = asyncio.Queue(self.queue_size)
+        deltas: asyncio.Queue[Delta] = asyncio.Queue(self.queue_size)
+
+        def collect() -> None:
+            # already profiled as the scheduler's tick
+            with self.stages.time("collect"):
+                snapshot = self.collector.collect()
+            loop.call_soon_threadsafe(self._offer, collected, snapshot)
+
+        async def enrich(snapshot: Snapshot) -> Snapshot:
+            return self._work("enrich", self.enrichment.apply, snapshot, loop)
+
+        def diff(snapshot: Snapshot) -> "asyncio.Future[Delta]":
+            return loop.run_in_executor(None, self._diff, snapshot)
+
+        def emit(delta: Delta) -> "asyncio.Future[None]":
+            return loop.run_in_executor(None, self._work, None, self.emit, delta.snapshot)
+
+        stages = [
+            loop.create_task(self._stage(collected, enriched, enrich)),
+            loop.create_task(self._stage(enriched, deltas, diff)),
+            loop.create_task(self._stage(deltas, None, emit)),
+        ]
+        try:
+            await loop.run_in_executor(None, self.scheduler.run, collect)
+        finally:
+            self.scheduler.stop()
+            self.enrichment.cancel()
+            for task in stages:
+                task.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+
+    def stop(self) -> None:
+        self.scheduler.stop()
+
+    def _work(self, stage: Optional[str], function: Callable[..., T], *args: Any) -> T:
+        """Run one stage's work, timed as ``stage`` and profiled while the profiler is on."""
+        profiler = self.scheduler.profiler
+        started = time.perf_counter()
+        try:
+            return profiler.call(function, *args) if profiler is not None else function(*args)
+        finally:
+            if stage is not None:
+                self.stages.add(stage, time.perf_counter() - started)
+
+    def _diff(self, snapshot: Snapshot) -> Delta:
+        delta = self._work("diff", self.diff.update, snapshot)
+        self.scheduler.report(delta)
+        return delta
+
+    def _offer(self, queue: "asyncio.Queue[Any]", item: Any) -> None:
+        if offer(queue, item):
+            self.dropped += 1
+
+    async def _stage(
+        self,
+        source: "asyncio.Queue[Any]",
+        sink: "Optional[asyncio.Queue[Any]]",
+        work: Callable[[Any], Awaitable[Any]],
+    ) -> None:
+        while True:
+            item = await source.get()
+            try:
+                result = await work(item)
+            except Exception:
+                logger.exception("pipeline stage failed; skipping this snapshot")
+                continue
+            if sink is not None:
+                self._offer(sink, result)
@@ -0,0 +1,157 @@
+"""
+PID to process metadata cache shared by the collection backends
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import psutil
+
+PROCESS_ATTRS = ["name", "exe", "cmdline", "username"]
+
+# marks a pid not yet looked up this tick (None is a remembered miss)
+_MISSING: Any = object()
+
+
+class ProcessInfo:
+    """Metadata for one process incarnation, identified by ``(pid, create_time)``."""
+
+    __slots__ = ("pid", "create_time", "name", "exe", "cmdline", "user", "expires")
+
+    def __init__(
+        self,
+        pid: int,
+        create_time: float,
+        name: str,
+        exe: str = "",
+        cmdline: Optional[List[str]] = None,
+        user: str = "",
+        expires: float = 0.0,
+    ) -> None:
+        self.pid = pid
+        self.create_time = create_time
+        self.name = name
+        self.exe = exe
+        self.cmdline = cmdline or []
+        self.user = user
+        self.expires = expires
+
+    def __repr__(self) -> str:
+        return f"ProcessInfo({self.pid}, {self.name!r}, user={self.user!r})"
+
+
+class ProcessCache:
+    """LRU/TTL cache of :class:`ProcessInfo` records.
+
+    Entries are stored per PID together with the process create time; a
+    lookup that finds a different create time treats the entry as a reused
+    PID and reloads it. Within one collection tick (see :meth:`begin_tick`)
+    each PID is resolved at most once, however many sockets it owns.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 300.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, ProcessInfo]" = OrderedDict()
+        self._tick: Dict[int, Optional[ProcessInfo]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def begin_tick(self) -> None:
+        """Forget per-tick memoisation; call once before each collection pass."""
+        self._tick.clear()
+
+    def lookup(self, pid: int) -> Optional[ProcessInfo]:
+        """Return metadata for ``pid`` or ``None`` if it is gone or inaccessible."""
+        # one read: another thread may clear the tick memo between a check and a lookup
+        memo: Optional[ProcessInfo] = self._tick.get(pid, _MISSING)
+        if memo is not _MISSING:
+            self.hits += 1
+            return memo
+
+        info = None
+        try:
+            proc = psutil.Process(pid)
+            create_time = proc.create_time()
+            entry = self._entries.get(pid)
+            now = time.monotonic()
+            if entry is not None and entry.create_time == create_time and entry.expires > now:
+                self.hits += 1
+                self._entries.move_to_end(pid)
+                info = entry
+            else:
+                self.misses += 1
+                info = self._load(proc, create_time, now)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            self.misses += 1
+            self.invalidate(pid)
+        self._tick[pid] = info
+        return info
+
+    def name(self, pid: int) -> str:
+        info = self.lookup(pid)
+        return info.name if info is not None else "Unknown"
+
+    def peek(self, pid: int) -> Optional[ProcessInfo]:
+        """Return the cached entry for ``pid`` without touching the process.
+
+        Never blocks; an unknown or expired PID gives ``None``.
+        """
+        entry = self._entries.get(pid)
+        if entry is None or entry.expires <= time.monotonic():
+            return None
+        return entry
+
+    def observe(self, pid: int, create_time: Optional[float]) -> None:
+        """Reconcile the cache with a process seen by ``psutil.process_iter``.
+
+        A create time that does not match the cached entry means the PID was
+        reused, so the stale entry is dropped.
+        """
+        entry = self._entries.get(pid)
+        if entry is not None and entry.create_time != create_time:
+            self.invalidate(pid)
+
+    def invalidate(self, pid: int) -> None:
+        self._entries.pop(pid, None)
+        self._tick.pop(pid, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tick.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _load(self, proc: Any, create_time: float, now: float) -> ProcessInfo:
+        data = proc.as_dict(attrs=PROCESS_ATTRS, ad_value=None)
+        info = ProcessInfo(
+            proc.pid,
+            create_time,
+            data["name"] or "Unknown",
+            data["exe"] or "",
+            data["cmdline"],
+            data["username"] or "",
+            now + self.ttl,
+        )
+        self._store(info)
+        return info
+
+    def _store(self, info: ProcessInfo) -> None:
+        self._entries[info.pid] = info
+        self._entries.move_to_end(info.pid)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,217 @@
+"""
+Linux collection backend that reads /proc/net/{tcp,tcp6,udp,udp6} directly
+
+``psutil.net_connections`` walks every ``/proc/<pid>/fd`` on each call to map
+socket inodes to PIDs. This backend parses the kernel socket tables in bulk
+and keeps an inode to PID map that is only refreshed for inodes it has not
+seen before.
+"""
+
+import os
+import socket
+import sys
+import time
+from array import array
+from typing import Dict, Iterable, List, Set, Tuple
+
+from connection_monitor.collector import Connection, is_reportable
+
+TCP_STATES = {
+    "01": "ESTABLISHED",
+    "02": "SYN_SENT",
+    "03": "SYN_RECV",
+    "04": "FIN_WAIT1",
+    "05": "FIN_WAIT2",
+    "06": "TIME_WAIT",
+    "07": "CLOSE",
+    "08": "CLOSE_WAIT",
+    "09": "LAST_ACK",
+    "0A": "LISTEN",
+    "0B": "CLOSING",
+}
+
+# (file name, address family, socket type)
+TABLES = (
+    ("tcp", socket.AF_INET, socket.SOCK_STREAM),
+    ("tcp6", socket.AF_INET6, socket.SOCK_STREAM),
+    ("udp", socket.AF_INET, socket.SOCK_DGRAM),
+    ("udp6", socket.AF_INET6, socket.SOCK_DGRAM),
+)
+
+_SWAP_WORDS = sys.byteorder == "little"
+
+
+def decode_addresses(hex_addrs: List[str], family: int) -> List[str]:
+    """Decode a batch of /proc/net address columns to printable IPs.
+
+    The kernel prints each 32-bit word of the address in host byte order, so
+    the whole batch is converted with one ``bytes.fromhex`` and one array
+    byteswap instead of per-address string slicing.
+    """
+    if not hex_addrs:
+        return []
+    words = array("I", bytes.fromhex("".join(hex_addrs)))
+    if _SWAP_WORDS:
+        words.byteswap()
+    raw = words.tobytes()
+    size = 4 if family == socket.AF_INET else 16
+    ntop = socket.inet_ntop
+    return [ntop(family, raw[i : i + size]) for i in range(0, len(raw), size)]
+
+
+class InodeMap:
+    """Lazily built socket inode to PID map for a /proc tree."""
+
+    def __init__(self, root: str = "/proc", retry_interval: float = 10.0) -> None:
+        self.root = root
+        self.retry_interval = retry_interval
+        self._owners: Dict[int, int] = {}
+        self._scanned_pids: Set[int] = set()
+        # pids most recently found owning sockets, scanned first on refresh
+        self._socket_pids: Dict[int, None] = {}
+        self._unresolved: Dict[int, float] = {}
+        self.denied = False
+        self.scans = 0
+        # process fd directories listed, over all scans
+        self.walked = 0
+
+    def __len__(self) -> int:
+        return len(self._owners)
+
+    def resolve(self, inodes: Set[int]) -> Dict[int, int]:
+        """Return the owners of ``inodes``, scanning /proc only for unknown ones."""
+        now = time.monotonic()
+        missing = {
+            inode
+            for inode in inodes
+            if inode not in self._owners
+            and now - self._unresolved.get(inode, -self.retry_interval) >= self.retry_interval
+        }
+        if missing:
+            self._refresh(missing, now)
+        # forget sockets that no longer exist so the map tracks the live table
+        for stale in [inode for inode in self._owners if inode not in inodes]:
+            del self._owners[stale]
+        for stale in [inode for inode in self._unresolved if inode not in inodes]:
+            del self._unresolved[stale]
+        return self._owners
+
+    def _refresh(self, missing: Set[int], now: float) -> None:
+        self.scans += 1
+        self.denied = False
+        try:
+            live = {int(name) for name in os.listdir(self.root) if name.isdigit()}
+        except OSError:
+            return
+        self._scanned_pids &= live
+        for pid in [pid for pid in self._socket_pids if pid not in live]:
+            del self._socket_pids[pid]
+
+        # new processes first, then processes already known to own sockets,
+        # then everything else; stop as soon as every missing inode is found
+        new = live - self._scanned_pids
+        order = [*new, *(pid for pid in self._socket_pids if pid not in new)]
+        order.extend(live - new - set(self._socket_pids))
+        for pid in order:
+            if not missing:
+                break
+            self._scanned_pids.add(pid)
+            self.walked += 1
+            for inode in self._socket_inodes(pid):
+                if inode in missing:
+                    missing.discard(inode)
+                    self._owners[inode] = pid
+                    self._socket_pids[pid] = None
+        for inode in missing:
+            self._unresolved[inode] = now
+
+    def _socket_inodes(self, pid: int) -> Iterable[int]:
+        fd_dir = os.path.join(self.root, str(pid), "fd")
+        try:
+            fds = os.listdir(fd_dir)
+        except PermissionError:
+            self.denied = True
+            return
+        except OSError:
+            return
+        for fd in fds:
+            try:
+                target = os.readlink(os.path.join(fd_dir, fd))
+            except OSError:
+                continue
+            if target.startswith("socket:["):
+                yield int(target[8:-1])
+
+
+class ProcNetBackend:
+    """Collect connections by parsing the /proc/net socket tables."""
+
+    name = "proc"
+
+    def __init__(self, root: str = "/proc", tables: Iterable[Tuple[str, int, int]] = TABLES) -> None:
+        self.root = root
+        self.tables = tuple(tables)
+        self.inodes = InodeMap(root)
+        # table rows read by the last collect, reportable or not
+        self.scanned = 0
+
+    @staticmethod
+    def available(root: str = "/proc") -> bool:
+        return sys.platform.startswith("linux") and os.path.exists(os.path.join(root, "net", "tcp"))
+
+    def read_table(self, name: str, family: int, kind: int) -> List[Tuple[str, str, str, str, str, int]]:
+        """Return ``(local, remote, lport_hex, rport_hex, status, inode)`` for reportable rows."""
+        try:
+            with open(os.path.join(self.root, "net", name), "rb") as f:
+                data = f.read().decode("ascii")
+        except OSError:
+            return []
+        is_tcp = kind == socket.SOCK_STREAM
+        rows = []
+        lines = data.splitlines()[1:]
+        self.scanned += len(lines)
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 10:
+                continue
+            local, lport = fields[1].split(":")
+            remote, rport = fields[2].split(":")
+            status = TCP_STATES.get(fields[3], "NONE") if is_tcp else "NONE"
+            if not is_reportable(status, rport != "0000"):
+                continue
+            rows.append((local, remote, lport, rport, status, int(fields[9])))
+        return rows
+
+    def collect(self) -> Tuple[List[Connection], bool]:
+        tables = []
+        inodes: Set[int] = set()
+        self.scanned = 0
+        for name, family, kind in self.tables:
+            rows = self.read_table(name, family, kind)
+            tables.append((family, kind, rows))
+            inodes.update(row[5] for row in rows)
+        inodes.discard(0)
+        owners = self.inodes.resolve(inodes)
+
+        connections = []
+        for family, kind, rows in tables:
+            if not rows:
+                continue
+            # decode both address columns of the table in one batch
+            ips = decode_addresses([row[0] for row in rows] + [row[1] for row in rows], family)
+            count = len(rows)
+            for i, (_, _, lport, rport, status, inode) in enumerate(rows):
+                connections.append(
+                    Connection(
+                        owners.get(inode),
+                        None,
+                        family,
+                        kind,
+                        ips[i],
+                        int(lport, 16),
+                        ips[count + i],
+                        int(rport, 16),
+                        status,
+                    )
+                )
+        return connections, self.inodes.denied
@@ -0,0 +1,188 @@
+"""
+Versioned snapshot + patch protocol for streaming connections to web clients
+
+A client receives one ``snapshot`` message and then a ``patch`` per tick.
+Every message carries a ``version``; patches also carry the ``base`` version
+they apply to, plus ``added`` and ``updated`` rows (replaced wholesale by id)
+and ``removed`` row ids. Throughput changes every tick without the row
+otherwise changing, so patches carry it separately as ``rates``: columns of
+row ids and the four rate fields, for rows whose displayed rate moved. A
+client whose version does not match a patch's base asks for a fresh
+snapshot (the ``resync`` Socket.IO event) instead of guessing.
+"""
+
+import threading
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Hashable, List, Tuple
+
+from connection_monitor.collector import Connection
+from connection_monitor.diff import Delta
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+ENCODINGS = ("json", "columnar", "msgpack")
+# what the page served by the web monitor decodes; msgpack is for other clients
+PAGE_ENCODINGS = ("json", "columnar")
+COLUMNS = (
+    "id",
+    "process",
+    "pid",
+    "local",
+    "remote",
+    "status",
+    "hostname",
+    "country",
+    "asn",
+    "as_org",
+    "rx_rate",
+    "tx_rate",
+    "rx_pps",
+    "tx_pps",
+)
+RATE_COLUMNS = ("rx_rate", "tx_rate", "rx_pps", "tx_pps")
+
+
+def encode_rows(rows: List[Tuple[int, Connection]], encoding: str) -> Any:
+    """Encode ``(row_id, connection)`` pairs as row objects or as columns."""
+    if encoding == "json":
+        return [{"id": row_id, **conn.as_row()} for row_id, conn in rows]
+    return {
+        "id": [row_id for row_id, _ in rows],
+        "process": [conn.process for _, conn in rows],
+        "pid": [conn.pid_text for _, conn in rows],
+        "local": [conn.local for _, conn in rows],
+        "remote": [conn.remote for _, conn in rows],
+        "status": [conn.status for _, conn in rows],
+        "hostname": [conn.hostname for _, conn in rows],
+        "country": [conn.country for _, conn in rows],
+        "asn": [conn.asn for _, conn in rows],
+        "as_org": [conn.as_org for _, conn in rows],
+        **encode_rates(rows),
+    }
+
+
+def encode_rates(rows: List[Tuple[int, Connection]]) -> Dict[str, List[Any]]:
+    """Rate columns of ``(row_id, connection)`` pairs, always in columnar form."""
+    rates = [conn.rates() for _, conn in rows]
+    return {column: [row[column] for row in rates] for column in RATE_COLUMNS}
+
+
+def pack(message: Dict[str, Any], encoding: str) -> Any:
+    """Return the Socket.IO payload for ``message``.
+
+    ``msgpack`` payloads are sent as zlib-compressed binary frames; the other
+    encodings rely on the transport's HTTP compression.
+    """
+    if encoding == "msgpack":
+        return zlib.compress(require_msgpack().packb(message))
+    return message
+
+
+def unpack(payload: Any, encoding: str) -> Dict[str, Any]:
+    if encoding == "msgpack":
+        return dict(require_msgpack().unpackb(zlib.decompress(payload)))
+    return dict(payload)
+
+
+def require_msgpack() -> Any:
+    """The msgpack module; raises ValueError when it is not installed."""
+    if msgpack is None:
+        raise ValueError("The msgpack encoding requires the 'msgpack' package")
+    return msgpack
+
+
+class ConnectionStream:
+    """Server side state of the protocol: row ids and the current version.
+
+    Row ids are small integers assigned when a connection first appears and
+    kept until it closes, so patches can refer to rows without repeating
+    their 5-tuple.
+    """
+
+    def __init__(self, encoding: str = "json") -> None:
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding {encoding!r}, expected one of: {', '.join(ENCODINGS)}")
+        if encoding == "msgpack":
+            require_msgpack()
+        self.encoding = encoding
+        self.version = 0
+        self._lock = threading.Lock()
+        self._ids: Dict[Hashable, int] = {}
+        self._rows: Dict[int, Connection] = {}
+        self._next_id = 1
+
+    def reset(self) -> None:
+        """Drop all rows. The version keeps counting so stale clients resync."""
+        with self._lock:
+            self._ids.clear()
+            self._rows.clear()
+
+    def update(self, delta: Delta) -> Dict[str, Any]:
+        """Apply ``delta`` and return the (unpacked) patch message describing it.
+
+        An ``initial`` delta (the diff restarted) reports every connection as
+        opened, so the stream starts over: the patch removes all known rows
+        before adding the new ones.
+        """
+        with self._lock:
+            removed: List[int] = []
+            if delta.initial:
+                removed.extend(self._rows)
+                self._ids.clear()
+                self._rows.clear()
+            added: List[Tuple[int, Connection]] = []
+            for conn in delta.opened:
+                row_id = self._next_id
+                self._next_id += 1
+                self._ids[conn.key] = row_id
+                self._rows[row_id] = conn
+                added.append((row_id, conn))
+            for conn in delta.closed:
+                closed_id = self._ids.pop(conn.key, None)
+                if closed_id is not None:
+                    del self._rows[closed_id]
+                    removed.append(closed_id)
+            updated: List[Tuple[int, Connection]] = []
+            for _, conn in delta.changed:
+                row_id = self._ids[conn.key]
+                self._rows[row_id] = conn
+                updated.append((row_id, conn))
+            rates: List[Tuple[int, Connection]] = []
+            for conn in delta.snapshot:
+                known_id = self._ids.get(conn.key)
+                if known_id is None:
+                    continue
+                before = self._rows[known_id]
+                if before is not conn:
+                    # unchanged row, fresh object: keep the newest rates for snapshots
+                    self._rows[known_id] = conn
+                    if conn.rates_differ(before):
+                        rates.append((known_id, conn))
+
+            self.version += 1
+            return {
+                "type": "patch",
+                "version": self.version,
+                "base": self.version - 1,
+                "added": encode_rows(added, self.encoding),
+                "removed": removed,
+                "updated": encode_rows(updated, self.encoding),
+                "rates": {"id": [row_id for row_id, _ in rates], **encode_rates(rates)},
+                "total": len(self._rows),
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the (unpacked) full snapshot message for the current version."""
+        with self._lock:
+            return {
+                "type": "snapshot",
+                "version": self.version,
+                "rows": encode_rows(list(self._rows.items()), self.encoding),
+                "total": len(self._rows),
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }
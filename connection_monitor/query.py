@@ -0,0 +1,308 @@
+"""
+Server-side filtering, sorting and cursor pagination over a snapshot
+
+A :class:`ConnectionIndex` is built once per snapshot and groups row
+positions by pid, process name, remote IP and state. A :class:`Query` starts
+from the smallest group its filters select and tests its remaining
+conditions on those rows only; a CIDR filter is a binary search over the
+sorted distinct remote addresses. Pages are cut with a heap and continued
+through an opaque keyset cursor (the last row's sort value and identity), so
+paging stays consistent while rows come and go between requests.
+"""
+
+import base64
+import bisect
+import heapq
+import ipaddress
+import json
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+from connection_monitor.collector import SORT_KEYS, Connection, Snapshot
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+@lru_cache(maxsize=65536)
+def parse_address(ip: str) -> Optional[Union[ipaddress.IPv4Address, ipaddress.IPv6Address]]:
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    if address.version == 6 and address.ipv4_mapped is not None:
+        return address.ipv4_mapped
+    return address
+
+
+@lru_cache(maxsize=16384)
+def network_of(ip: str, prefix: int = 24) -> str:
+    """The IPv4 /``prefix`` (IPv6: /48) network containing ``ip``; IPv4-mapped addresses count as IPv4."""
+    if not ip:
+        return "none"
+    address = parse_address(ip)
+    if address is None:
+        return "invalid"
+    bits = prefix if address.version == 4 else 48
+    return str(ipaddress.ip_network(f"{address}/{bits}", strict=False))
+
+
+def identity(conn: Connection) -> Tuple[str, int, str, int, int, int]:
+    """Total order tie-breaker for rows with equal sort values."""
+    return (conn.laddr_ip, conn.laddr_port, conn.raddr_ip, conn.raddr_port, conn.pid or 0, conn.type)
+
+
+class Query:
+    """Filters (all of which must match), sort order and page of a connection query.
+
+    ``ports`` is an inclusive ``(low, high)`` range matched against either
+    end of the connection, ``remote_ports`` one matched against the remote
+    port only; ``process`` and ``state`` match whole values,
+    case-insensitively; ``text`` is a substring match on any displayed
+    column (see :meth:`Connection.matches`).
+    """
+
+    __slots__ = (
+        "process",
+        "pid",
+        "state",
+        "ports",
+        "remote_ports",
+        "network",
+        "text",
+        "sort",
+        "descending",
+        "limit",
+        "cursor",
+    )
+
+    def __init__(
+        self,
+        process: Optional[str] = None,
+        pid: Optional[int] = None,
+        state: Optional[str] = None,
+        ports: Optional[Tuple[int, int]] = None,
+        remote_ports: Optional[Tuple[int, int]] = None,
+        network: Optional[Network] = None,
+        text: str = "",
+        sort: Optional[str] = None,
+        descending: bool = False,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> None:
+        self.process = process.lower() if process else None
+        self.pid = pid
+        self.state = state.upper() if state else None
+        self.ports = ports
+        self.remote_ports = remote_ports
+        self.network = network
+        self.text = text.lower()
+        self.sort = sort
+        self.descending = descending
+        self.limit = limit
+        self.cursor = cursor
+
+    @property
+    def filters(self) -> Tuple[Any, ...]:
+        """The filter part of the query, hashable, e.g. to share a stream between clients."""
+        network = str(self.network) if self.network is not None else None
+        return (self.process, self.pid, self.state, self.ports, self.remote_ports, network, self.text)
+
+    def match(self, conn: Connection) -> bool:
+        if self.pid is not None and conn.pid != self.pid:
+            return False
+        if self.state is not None and conn.status != self.state:
+            return False
+        if self.process is not None and (conn.process or "").lower() != self.process:
+            return False
+        if self.ports is not None:
+            low, high = self.ports
+            if not (low <= conn.raddr_port <= high or low <= conn.laddr_port <= high):
+                return False
+        if self.remote_ports is not None and not self.remote_ports[0] <= conn.raddr_port <= self.remote_ports[1]:
+            return False
+        if self.network is not None:
+            address = parse_address(conn.raddr_ip)
+            if address is None or address.version != self.network.version or address not in self.network:
+                return False
+        return not self.text or conn.matches(self.text)
+
+    def order(self) -> Callable[[Connection], Tuple[Any, Any]]:
+        key = SORT_KEYS[self.sort] if self.sort else None
+        if key is None:
+            return lambda conn: (0, identity(conn))
+        return lambda conn: (key(conn), identity(conn))
+
+
+def parse_ports(value: str) -> Tuple[int, int]:
+    low, _, high = value.partition("-")
+    ports = (int(low), int(high or low))
+    if not 0 <= ports[0] <= ports[1] <= 65535:
+        raise ValueError(f"port range out of bounds: {value!r}")
+    return ports
+
+
+def parse_query(args: Mapping[str, Any], max_limit: int = 1000) -> Query:
+    """Build a :class:`Query` from request arguments.
+
+    Recognised keys: ``process``, ``pid``, ``state``, ``port`` (``443`` or
+    ``1024-65535``, either end), ``rport`` (the same, remote end only), ``cidr`` (a network or a single address), ``q`` (text),
+    ``sort`` (a :data:`SORT_KEYS` name, ``-`` prefixed for descending),
+    ``limit`` and ``cursor``. Raises ValueError for malformed values,
+    including arguments that are not a mapping of strings and numbers (e.g.
+    a socket payload of the wrong shape).
+    """
+    if not isinstance(args, Mapping):
+        raise ValueError("Invalid query: expected an object of query arguments")
+    for key in ("sort", "process", "state", "q", "cursor"):
+        if args.get(key) is not None and not isinstance(args[key], str):
+            raise ValueError(f"Invalid query: {key} must be a string")
+    sort = args.get("sort") or None
+    descending = False
+    if sort and sort.startswith("-"):
+        sort, descending = sort[1:], True
+    if sort is not None and sort not in SORT_KEYS:
+        raise ValueError(f"Unknown sort key {sort!r}, expected one of: {', '.join(SORT_KEYS)}")
+    try:
+        pid = int(args["pid"]) if args.get("pid") else None
+        ports = parse_ports(str(args["port"])) if args.get("port") else None
+        remote_ports = parse_ports(str(args["rport"])) if args.get("rport") else None
+        network = ipaddress.ip_network(str(args["cidr"]), strict=False) if args.get("cidr") else None
+        limit = int(args.get("limit") or 100)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid query: {e}") from None
+    if not 1 <= limit <= max_limit:
+        raise ValueError(f"limit must be between 1 and {max_limit}")
+    cursor = args.get("cursor") or None
+    if cursor is not None:
+        decode_cursor(cursor)  # reject garbage up front
+    return Query(
+        process=args.get("process") or None,
+        pid=pid,
+        state=args.get("state") or None,
+        ports=ports,
+        remote_ports=remote_ports,
+        network=network,
+        text=str(args.get("q") or ""),
+        sort=sort,
+        descending=descending,
+        limit=limit,
+        cursor=cursor,
+    )
+
+
+def _tuples(value: Any) -> Any:
+    return tuple(_tuples(item) for item in value) if isinstance(value, list) else value
+
+
+def encode_cursor(position: Tuple[Any, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+    try:
+        position = _tuples(json.loads(base64.urlsafe_b64decode(cursor.encode())))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor") from None
+    if not isinstance(position, tuple) or len(position) != 2:
+        raise ValueError("Invalid cursor")
+    return position
+
+
+class ConnectionIndex:
+    """Lookup tables over one snapshot's rows, built in a single pass."""
+
+    def __init__(self, connections: Sequence[Connection]) -> None:
+        self.rows = list(connections)
+        self.by_pid: Dict[Optional[int], List[int]] = {}
+        self.by_process: Dict[str, List[int]] = {}
+        self.by_remote: Dict[str, List[int]] = {}
+        self.by_state: Dict[str, List[int]] = {}
+        for position, conn in enumerate(self.rows):
+            self.by_pid.setdefault(conn.pid, []).append(position)
+            self.by_process.setdefault((conn.process or "").lower(), []).append(position)
+            self.by_remote.setdefault(conn.raddr_ip, []).append(position)
+            self.by_state.setdefault(conn.status, []).append(position)
+        # remote addresses as sorted integers per IP version, built on the first CIDR query
+        self._addresses: Optional[Dict[int, Tuple[List[int], List[str]]]] = None
+
+    def candidates(self, query: Query) -> Tuple[Optional[List[int]], int]:
+        """Positions of the smallest index group the query selects (None: every row), and how many groups it used."""
+        groups = []
+        if query.pid is not None:
+            groups.append(self.by_pid.get(query.pid, []))
+        if query.process is not None:
+            groups.append(self.by_process.get(query.process, []))
+        if query.state is not None:
+            groups.append(self.by_state.get(query.state, []))
+        if query.network is not None:
+            groups.append(self.in_network(query.network))
+        return (min(groups, key=len) if groups else None), len(groups)
+
+    def in_network(self, network: Network) -> List[int]:
+        """Positions of rows whose remote address is in ``network``, by binary search."""
+        addresses = self._addresses
+        if addresses is None:
+            addresses = {4: ([], []), 6: ([], [])}
+            for value, version, ip in sorted(
+                (int(address), address.version, ip)
+                for ip, address in ((ip, parse_address(ip)) for ip in self.by_remote)
+                if address is not None
+            ):
+                addresses[version][0].append(value)
+                addresses[version][1].append(ip)
+            # published complete, so concurrent queries never see a partial table
+            self._addresses = addresses
+        values, ips = addresses[network.version]
+        first = bisect.bisect_left(values, int(network.network_address))
+        last = bisect.bisect_right(values, int(network.broadcast_address))
+        return sorted(position for ip in ips[first:last] for position in self.by_remote[ip])
+
+    def select(self, query: Query) -> List[Connection]:
+        """Every row matching the query's filters, in snapshot order."""
+        positions, indexed = self.candidates(query)
+        rows = self.rows if positions is None else [self.rows[position] for position in positions]
+        if indexed <= 1 and query.ports is None and query.remote_ports is None and not query.text:
+            # the one index group used is the whole answer
+            return rows
+        return [conn for conn in rows if query.match(conn)]
+
+    def search(self, query: Query) -> Dict[str, Any]:
+        """One page of matching rows in the query's order, with the cursor for the next."""
+        rows = self.select(query)
+        total = len(rows)
+        order = query.order()
+        if query.cursor is not None:
+            after = decode_cursor(query.cursor)
+            try:
+                if query.descending:
+                    rows = [conn for conn in rows if order(conn) < after]
+                else:
+                    rows = [conn for conn in rows if order(conn) > after]
+            except TypeError:
+                raise ValueError("Cursor does not belong to this sort order") from None
+        select = heapq.nlargest if query.descending else heapq.nsmallest
+        page = select(query.limit + 1, rows, key=order)
+        more = len(page) > query.limit
+        page = page[: query.limit]
+        return {
+            "total": total,
+            "connections": [conn.as_row() for conn in page],
+            "next_cursor": encode_cursor(order(page[-1])) if more else None,
+        }
+
+
+class IndexCache:
+    """The index of the most recent snapshot, built on its first query."""
+
+    def __init__(self) -> None:
+        self._snapshot: Optional[Snapshot] = None
+        self._index: Optional[ConnectionIndex] = None
+        self._lock = threading.Lock()
+
+    def get(self, snapshot: Snapshot) -> ConnectionIndex:
+        with self._lock:
+            if self._index is None or snapshot is not self._snapshot:
+                self._snapshot = snapshot
+                self._index = ConnectionIndex(snapshot.connections)
+            return self._index
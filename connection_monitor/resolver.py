@@ -0,0 +1,181 @@
+"""
+Asynchronous reverse DNS for remote addresses
+
+:class:`ReverseResolver` is an enricher (see :mod:`connection_monitor.pipeline`):
+hostnames come from its cache on the hot path, and misses are resolved on a
+small thread pool behind a global rate limit. Answers are cached for their
+TTL, failures for ``negative_ttl``, and concurrent requests for one address
+share a single query.
+"""
+
+import asyncio
+import socket
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from connection_monitor.collector import Snapshot
+
+try:
+    import dns.exception
+    import dns.resolver
+    import dns.reversename
+except ImportError:  # optional dependency
+    dns = None
+
+# ip -> (hostname or None, TTL in seconds or None for the resolver default)
+Lookup = Callable[[str], Tuple[Optional[str], Optional[float]]]
+
+
+def system_lookup(ip: str) -> Tuple[Optional[str], Optional[float]]:
+    """Resolve via the C library; it does not report a TTL."""
+    try:
+        return socket.gethostbyaddr(ip)[0], None
+    except OSError:
+        return None, None
+
+
+def dns_lookup(ip: str) -> Tuple[Optional[str], Optional[float]]:
+    """Resolve a PTR record with dnspython, honouring the record's TTL."""
+    try:
+        answer = dns.resolver.resolve(dns.reversename.from_address(ip), "PTR", lifetime=5.0)
+    except (dns.exception.DNSException, OSError):
+        return None, None
+    return str(answer[0]).rstrip("."), float(answer.rrset.ttl)
+
+
+default_lookup: Lookup = dns_lookup if dns is not None else system_lookup
+
+
+class RateLimiter:
+    """Token bucket shared by all lookups: ``rate`` per second, bursts up to ``burst``."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take a token and return how long to wait before using it."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    async def acquire(self) -> None:
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class ReverseResolver:
+    """Cached, rate limited, deduplicated reverse DNS.
+
+    ``lookup`` defaults to dnspython when installed (TTL aware) and the
+    system resolver otherwise; tests pass a stub. ``ttl`` applies to answers
+    without a TTL of their own, and ``min_ttl`` keeps very short TTLs from
+    turning into a query per tick.
+    """
+
+    def __init__(
+        self,
+        lookup: Optional[Lookup] = None,
+        workers: int = 4,
+        ttl: float = 300.0,
+        min_ttl: float = 30.0,
+        negative_ttl: float = 60.0,
+        rate: float = 20.0,
+        maxsize: int = 10000,
+    ) -> None:
+        self.lookup = lookup or default_lookup
+        self.ttl = ttl
+        self.min_ttl = min_ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        self.limiter = RateLimiter(rate)
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="reverse-dns")
+        self._cache: "OrderedDict[str, Tuple[Optional[str], float]]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Future[Optional[str]]"] = {}
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+        self.failures = 0
+
+    def cached(self, ip: str) -> Tuple[bool, Optional[str]]:
+        """Return ``(found, hostname)``; ``hostname`` is None for a cached failure."""
+        entry = self._cache.get(ip)
+        if entry is None or entry[1] <= time.monotonic():
+            return False, None
+        return True, entry[0]
+
+    def apply(self, snapshot: Snapshot) -> Set[Hashable]:
+        missing: Set[Hashable] = set()
+        for conn in snapshot:
+            if not conn.raddr_ip:
+                continue
+            found, hostname = self.cached(conn.raddr_ip)
+            if found:
+                self.hits += 1
+                conn.hostname = hostname
+            else:
+                self.misses += 1
+                missing.add(conn.raddr_ip)
+        return missing
+
+    async def resolve(self, keys: Set[Hashable]) -> None:
+        await asyncio.gather(*(self.reverse(str(ip)) for ip in keys))
+
+    async def reverse(self, ip: str) -> Optional[str]:
+        """Hostname for ``ip``; concurrent calls for the same address share one query."""
+        found, hostname = self.cached(ip)
+        if found:
+            return hostname
+        pending = self._inflight.get(ip)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        loop = asyncio.get_running_loop()
+        future = self._inflight[ip] = loop.create_future()
+        try:
+            await self.limiter.acquire()
+            self.queries += 1
+            hostname, ttl = await loop.run_in_executor(self.executor, self.lookup, ip)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception:
+            hostname, ttl = None, None
+        finally:
+            del self._inflight[ip]
+        self._store(ip, hostname, ttl)
+        future.set_result(hostname)
+        return hostname
+
+    def _store(self, ip: str, hostname: Optional[str], ttl: Optional[float]) -> None:
+        if hostname is None:
+            self.failures += 1
+            ttl = self.negative_ttl
+        else:
+            ttl = max(ttl if ttl is not None else self.ttl, self.min_ttl)
+        self._cache[ip] = (hostname, time.monotonic() + ttl)
+        self._cache.move_to_end(ip)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def close(self) -> None:
+        """Stop the lookup threads, dropping queued queries; running ones are left to finish."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "queries": self.queries,
+            "failures": self.failures,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,154 @@
+"""
+Adaptive, drift-corrected polling scheduler shared by the monitor loops
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from connection_monitor.diff import Delta
+from connection_monitor.instrumentation import TickProfiler
+
+
+class TickStats:
+    """Timing of one completed tick."""
+
+    __slots__ = ("started", "duration", "cpu", "interval", "churn")
+
+    def __init__(self, started: float, duration: float, cpu: float, interval: float, churn: int) -> None:
+        self.started = started
+        self.duration = duration
+        self.cpu = cpu
+        self.interval = interval
+        self.churn = churn
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "duration_ms": round(self.duration * 1000, 2),
+            "cpu_ms": round(self.cpu * 1000, 2),
+            "interval": round(self.interval, 2),
+            "churn": self.churn,
+        }
+
+
+class Scheduler:
+    """Run a tick function repeatedly until :meth:`stop` is called.
+
+    Ticks are scheduled against absolute deadlines, so time spent collecting
+    does not stretch the period. With ``adaptive`` enabled the period grows by
+    ``backoff`` while nothing changes (up to ``max_interval``) and halves when a
+    tick sees at least ``busy_churn`` events (down to ``min_interval``).
+    ``cpu_budget`` (a fraction of one core, e.g. ``0.05``) stretches the period
+    so the process never spends more than that share of CPU time.
+    With a ``profiler`` (:class:`~connection_monitor.instrumentation.TickProfiler`)
+    the first ticks run under cProfile.
+
+    A tick whose delta is produced on another thread (a pipeline's diff
+    stage) returns None and hands the delta to :meth:`report` instead; the
+    next tick adapts on the churn reported since the previous one.
+    """
+
+    def __init__(
+        self,
+        interval: float = 2.0,
+        min_interval: float = 0.5,
+        max_interval: float = 10.0,
+        adaptive: bool = True,
+        backoff: float = 1.5,
+        busy_churn: int = 50,
+        cpu_budget: Optional[float] = None,
+        profiler: Optional[TickProfiler] = None,
+    ) -> None:
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if cpu_budget is not None and not 0 < cpu_budget <= 1:
+            raise ValueError("cpu_budget must be a fraction of one core in (0, 1]")
+        self.base_interval = interval
+        self.min_interval = min(min_interval, interval)
+        self.max_interval = max(max_interval, interval)
+        self.adaptive = adaptive
+        self.backoff = backoff
+        self.busy_churn = busy_churn
+        self.cpu_budget = cpu_budget
+        self.profiler = profiler
+        self.interval = interval
+        self.last: Optional[TickStats] = None
+        self.ticks = 0
+        # total wall time spent inside ticks
+        self.busy = 0.0
+        self._reported: Optional[int] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return not self._stop.is_set()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self) -> None:
+        """Run the next tick now instead of waiting for its deadline."""
+        self._wake.set()
+
+    def report(self, delta: Delta) -> None:
+        """Count ``delta`` towards the adaptation of the next tick; may be called from any thread."""
+        with self._lock:
+            self._reported = (self._reported or 0) + delta.churn
+
+    def next_interval(self, churn: Optional[int], cpu: float) -> float:
+        """The period after a tick that saw ``churn`` events (None: not known yet) and used ``cpu`` seconds."""
+        interval = self.interval
+        if not self.adaptive:
+            interval = self.base_interval
+        elif churn is None:
+            # no delta since the last tick (still in the pipeline): keep the period
+            pass
+        elif churn == 0:
+            interval = min(interval * self.backoff, self.max_interval)
+        elif churn >= self.busy_churn:
+            interval = max(interval / 2, self.min_interval)
+        else:
+            # some activity: drift back towards the configured interval
+            interval = (interval + self.base_interval) / 2
+        if self.cpu_budget is not None:
+            interval = max(interval, cpu / self.cpu_budget)
+        return interval
+
+    def run(self, tick: Callable[[], Optional[Delta]]) -> None:
+        """Call ``tick`` on schedule; its returned :class:`Delta` drives adaptation."""
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            started = time.monotonic()
+            cpu_started = time.process_time()
+            delta = self.profiler.tick(tick) if self.profiler is not None else tick()
+            duration = time.monotonic() - started
+            cpu = time.process_time() - cpu_started
+
+            churn = delta.churn if delta is not None else self._take_reported()
+            self.interval = self.next_interval(churn, cpu)
+            self.last = TickStats(started, duration, cpu, self.interval, churn or 0)
+            self.ticks += 1
+            self.busy += duration
+
+            deadline += self.interval
+            now = time.monotonic()
+            if deadline < now:
+                # overran the period: start again from now rather than bursting
+                deadline = now
+            self._wake.wait(deadline - now)
+            if self._wake.is_set():
+                self._wake.clear()
+                deadline = time.monotonic()
+
+    def _take_reported(self) -> Optional[int]:
+        with self._lock:
+            churn, self._reported = self._reported, None
+        return churn
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.last.as_dict() if self.last is not None else {}
+        stats["ticks"] = self.ticks
+        return stats
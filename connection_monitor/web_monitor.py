@@ -3,94 +3,103 @@
 Web-based connection monitor with accessible HTML interface
 """
 
-import psutil
-import json
-import asyncio
+import math
 import webbrowser
-from datetime import datetime
-from flask import Flask, render_template, jsonify
+from flask import Flask, Response, jsonify, request
+from flask.typing import ResponseReturnValue
 from flask_socketio import SocketIO, emit
 import threading
 import time
 import os
+from typing import Any, Dict, Mapping, Optional
+
+from connection_monitor.bandwidth import busiest, find_tracker
+from connection_monitor.collector import ConnectionCollector, Snapshot
+from connection_monitor.alerts import AlertEngine, load_rules
+from connection_monitor.export import open_exporter
+from connection_monitor.history import open_history, query_args
+from connection_monitor.hub import CollectorHub
+from connection_monitor.instrumentation import open_profiler
+from connection_monitor.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, ConnectionMetrics
+from connection_monitor.pipeline import ProcessEnricher, build_enrichers
+from connection_monitor.protocol import ENCODINGS, PAGE_ENCODINGS, require_msgpack
+from connection_monitor.groups import GroupCounts, parse_dimensions
+from connection_monitor.query import parse_query
 
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = 'connection-monitor-secret'
-socketio = SocketIO(app, cors_allowed_origins="*")
+app.config["SECRET_KEY"] = "connection-monitor-secret"
+# Compress long-polling responses; patches are small but snapshots are not
+SOCKETIO_OPTIONS = dict(cors_allowed_origins="*", http_compression=True, compression_threshold=1024)
+socketio = SocketIO(app, **SOCKETIO_OPTIONS)
 
-monitoring = False
-monitor_thread = None
+scheduler_options: Dict[str, Any] = {}
+default_encoding = "json"
+# Process names are filled in by the pipeline's enrichment stage instead
+collector = ConnectionCollector(resolve_names=False)
 
 
-def get_process_name(pid):
-    try:
-        process = psutil.Process(pid)
-        return process.name()
-    except (psutil.NoSuchProcess, psutil.AccessDenied):
-        return "Unknown"
+def emit_to(event: str, data: Any, to: str) -> None:
+    socketio.emit(event, data, to=to)
 
 
-def get_connections():
-    connections = []
-    try:
-        for conn in psutil.net_connections(kind='inet'):
-            if conn.status == 'NONE' or not conn.raddr:
-                continue
-                
-            process_name = get_process_name(conn.pid) if conn.pid else "System"
-            
-            local_addr = f"{conn.laddr.ip}:{conn.laddr.port}"
-            remote_addr = f"{conn.raddr.ip}:{conn.raddr.port}" if conn.raddr else "N/A"
-            
-            connections.append({
-                'process': process_name,
-                'pid': str(conn.pid) if conn.pid else "N/A",
-                'local': local_addr,
-                'remote': remote_addr,
-                'status': conn.status,
-                'timestamp': datetime.now().strftime('%H:%M:%S')
-            })
-    except (psutil.AccessDenied, PermissionError):
-        # Try per-process connections
-        for proc in psutil.process_iter(['pid', 'name']):
-            try:
-                for conn in proc.connections(kind='inet'):
-                    if conn.status == 'NONE' or not conn.raddr:
-                        continue
-                        
-                    local_addr = f"{conn.laddr.ip}:{conn.laddr.port}"
-                    remote_addr = f"{conn.raddr.ip}:{conn.raddr.port}"
-                    
-                    connections.append({
-                        'process': proc.info['name'],
-                        'pid': str(proc.info['pid']),
-                        'local': local_addr,
-                        'remote': remote_addr,
-                        'status': conn.status,
-                        'timestamp': datetime.now().strftime('%H:%M:%S')
-                    })
-            except (psutil.AccessDenied, psutil.NoSuchProcess):
-                continue
-                
-    return connections
-
-
-def monitor_connections():
-    global monitoring
-    while monitoring:
-        connections = get_connections()
-        socketio.emit('update_connections', {
-            'connections': connections,
-            'total': len(connections),
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        })
-        time.sleep(2)
-
-
-@app.route('/')
+def join_room(sid: str, room: str) -> None:
+    socketio.server.enter_room(sid, room, namespace="/")
+
+
+def leave_room(sid: str, room: str) -> None:
+    socketio.server.leave_room(sid, room, namespace="/")
+
+
+history_store = None
+exporter = None
+alert_engine = None
+
+
+# One collector for every client; each client subscribes with its own view
+hub = CollectorHub(
+    collector,
+    emit_to,
+    join_room,
+    leave_room,
+    scheduler_options=scheduler_options,
+    pipeline=True,
+    spawn=socketio.start_background_task,
+)
+hub.enrichers.append(ProcessEnricher(collector.process_cache))
+metrics = ConnectionMetrics()
+hub.diff.listeners.append(metrics.record)
+
+
+def collect_once() -> Snapshot:
+    """A one-off snapshot for requests made while nobody is streaming, with processes named inline."""
+    return ConnectionCollector(collector.backend, collector.process_cache).collect()
+
+
+def query_connections(args: Mapping[str, Any]) -> Dict[str, Any]:
+    """One page of connections for request arguments (see :func:`parse_query`); raises ValueError."""
+    query = parse_query(args)
+    if hub.running:
+        return hub.search(query)
+    return hub.search(query, collect_once())
+
+
+def group_connections(args: Mapping[str, Any]) -> Dict[str, Any]:
+    """The largest groups for ``by`` (e.g. ``process,state``) and ``limit``; raises ValueError."""
+    by = parse_dimensions(str(args.get("by") or "process"))
+    limit = int(args.get("limit") or 100)
+    if not 1 <= limit <= 1000:
+        raise ValueError("limit must be between 1 and 1000")
+    if hub.running:
+        return hub.groups(by).rows(limit)
+    groups = GroupCounts(by)
+    groups.reset(collect_once())
+    return groups.rows(limit)
+
+
+@app.route("/")
 def index():
-    return '''
+    return """
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -143,6 +152,12 @@ def index():
             outline: 2px solid #0056b3;
             outline-offset: 2px;
         }
+        input[type="search"] {
+            padding: 9px;
+            font-size: 16px;
+            border: 1px solid #ccc;
+            border-radius: 4px;
+        }
         .status {
             padding: 10px;
             border-radius: 4px;
@@ -177,6 +192,52 @@ def index():
         tr:hover {
             background: #f8f9fa;
         }
+        #connectionTable {
+            max-height: 60vh;
+            overflow-y: auto;
+            margin-top: 20px;
+        }
+        #connectionTable table {
+            table-layout: fixed;
+            margin-top: 0;
+        }
+        tr.data-row {
+            height: 45px;
+        }
+        tr.data-row td {
+            white-space: nowrap;
+            overflow: hidden;
+            text-overflow: ellipsis;
+        }
+        th button.sort {
+            font: inherit;
+            color: inherit;
+            background: none;
+            border: none;
+            padding: 0;
+            cursor: pointer;
+        }
+        th[aria-sort="ascending"] button.sort::after {
+            content: " \\25B2";
+        }
+        th[aria-sort="descending"] button.sort::after {
+            content: " \\25BC";
+        }
+        tr.spacer td {
+            padding: 0;
+            border: none;
+        }
+        #alerts {
+            margin-top: 20px;
+            padding: 10px 15px;
+            border-left: 4px solid #dc3545;
+            background: #f8d7da;
+            font-size: 14px;
+        }
+        #alerts h2 {
+            margin: 0 0 5px;
+            font-size: 16px;
+        }
         .summary {
             margin-top: 20px;
             padding: 15px;
@@ -233,26 +294,50 @@ def index():
             <button id="stopBtn" onclick="stopMonitoring()" disabled aria-label="Stop monitoring network connections">
                 Stop Monitoring
             </button>
+            <label for="filterInput">Filter:</label>
+            <input id="filterInput" type="search" placeholder="text, or state:ESTABLISHED port:443 cidr:10.0.0.0/8"
+                   aria-describedby="filterHelp">
+            <span id="filterHelp" class="sr-only">Only connections matching this text are shown. Terms such as
+                process:, pid:, state:, port: (a number or range) and cidr: filter on that field.</span>
+            <label for="groupSelect">Group by:</label>
+            <select id="groupSelect">
+                <option value="">Nothing (individual connections)</option>
+                <option value="process">Process</option>
+                <option value="remote">Remote address</option>
+                <option value="network">Remote network</option>
+                <option value="port">Remote port</option>
+                <option value="state">State</option>
+                <option value="process,state,network/8">Process, state and /8 network</option>
+            </select>
             <div class="status inactive" id="status" role="status" aria-live="polite">
                 Status: <span id="statusText">Stopped</span>
             </div>
         </div>
         
-        <div id="connectionTable" role="region" aria-label="Network connections table">
+        <div id="drillDown" hidden>
+            Showing the connections of <span id="drillLabel"></span>
+            <button id="clearDrill">Show all connections</button>
+        </div>
+        
+        <div id="connectionTable" role="region" aria-label="Network connections table" tabindex="0">
             <table role="table">
                 <caption class="sr-only">Active network connections</caption>
                 <thead>
                     <tr role="row">
-                        <th role="columnheader" scope="col">Process Name</th>
-                        <th role="columnheader" scope="col">PID</th>
-                        <th role="columnheader" scope="col">Local Address</th>
-                        <th role="columnheader" scope="col">Remote Address</th>
-                        <th role="columnheader" scope="col">Status</th>
+                        <th role="columnheader" scope="col" aria-sort="none"><button class="sort" data-column="process">Process Name</button></th>
+                        <th role="columnheader" scope="col" aria-sort="none"><button class="sort" data-column="pid">PID</button></th>
+                        <th role="columnheader" scope="col" aria-sort="none"><button class="sort" data-column="local">Local Address</button></th>
+                        <th role="columnheader" scope="col" aria-sort="none"><button class="sort" data-column="remote">Remote Address</button></th>
+                        <th role="columnheader" scope="col" aria-sort="none"><button class="sort" data-column="status">Status</button></th>
+                        <th role="columnheader" scope="col" aria-sort="none"><button class="sort" data-column="country">Country</button></th>
+                        <th role="columnheader" scope="col" aria-sort="none"><button class="sort" data-column="asn">ASN</button></th>
+                        <th role="columnheader" scope="col" aria-sort="none"><button class="sort" data-column="rx_rate">Rx/s</button></th>
+                        <th role="columnheader" scope="col" aria-sort="none"><button class="sort" data-column="tx_rate">Tx/s</button></th>
                     </tr>
                 </thead>
                 <tbody id="connectionsBody" role="rowgroup">
                     <tr role="row">
-                        <td role="cell" colspan="5" style="text-align: center; color: #666;">
+                        <td role="cell" colspan="9" style="text-align: center; color: #666;">
                             Click "Start Monitoring" to begin
                         </td>
                     </tr>
@@ -260,9 +345,27 @@ def index():
             </table>
         </div>
         
+        <div id="groupTable" role="region" aria-label="Grouped connections table" tabindex="0" hidden>
+            <table role="table">
+                <caption class="sr-only">Connection counts per group; choose a group to list its connections</caption>
+                <thead>
+                    <tr role="row" id="groupHead"></tr>
+                </thead>
+                <tbody id="groupBody" role="rowgroup"></tbody>
+            </table>
+        </div>
+        
+        <div id="alerts" role="log" aria-label="Alerts" hidden>
+            <h2>Alerts</h2>
+            <ul id="alertList"></ul>
+        </div>
+        
         <div class="summary" id="summary" role="status" aria-live="polite">
             <div>Total connections: <span id="totalConnections">0</span></div>
+            <div>Since last update: <span id="changes">none</span></div>
             <div>Last updated: <span id="lastUpdated">Never</span></div>
+            <div>Collection: <span id="tickStats">-</span></div>
+            <div>Monitor cost: <span id="selfStats">-</span></div>
         </div>
     </div>
     
@@ -272,17 +375,90 @@ def index():
         
         socket.on('connect', function() {
             console.log('Connected to server');
+            if (isMonitoring) {
+                // Reconnected: the server forgot our subscription
+                startMonitoring();
+            }
+        });
+        
+        // Client copy of the server's rows, keyed by row id, at `version`
+        const rows = new Map();
+        let version = null;
+        let channel = null;  // server-side subscription this view belongs to
+        
+        socket.on('connections_snapshot', function(data) {
+            channel = data.channel;
+            rows.clear();
+            decodeRows(data.rows).forEach(row => rows.set(row.id, row));
+            order = Array.from(rows.keys());
+            orderDirty = false;
+            version = data.version;
+            socket.emit('ack', { channel: channel, version: version });
+            render(data, `${data.total} connections`);
+        });
+        
+        socket.on('connections_patch', function(patch) {
+            if (patch.channel !== channel || version === null || patch.version <= version) {
+                return;
+            }
+            if (patch.base !== version) {
+                // Missed an update: drop local state until a fresh snapshot arrives
+                version = null;
+                socket.emit('resync');
+                return;
+            }
+            const added = decodeRows(patch.added);
+            added.forEach(row => {
+                rows.set(row.id, row);
+                order.push(row.id);
+            });
+            patch.removed.forEach(id => rows.delete(id));
+            orderDirty = orderDirty || patch.removed.length > 0;
+            const updated = decodeRows(patch.updated);
+            updated.forEach(row => rows.set(row.id, row));
+            // Throughput moves every tick, so it arrives apart from row changes
+            decodeRows(patch.rates).forEach(rates => {
+                const row = rows.get(rates.id);
+                if (row) {
+                    Object.assign(row, rates);
+                }
+            });
+            version = patch.version;
+            socket.emit('ack', { channel: channel, version: version });
+            render(patch, `${added.length} opened, ${patch.removed.length} closed, ${updated.length} changed`);
         });
         
-        socket.on('update_connections', function(data) {
-            updateTable(data.connections);
+        function decodeRows(encoded) {
+            if (Array.isArray(encoded)) {
+                return encoded;
+            }
+            // Columnar encoding: one array per column
+            const names = Object.keys(encoded);
+            return encoded.id.map((id, i) => {
+                const row = {};
+                names.forEach(name => { row[name] = encoded[name][i]; });
+                return row;
+            });
+        }
+        
+        function render(data, changes) {
+            scheduleRender();
+            refreshGroups();
             document.getElementById('totalConnections').textContent = data.total;
+            document.getElementById('changes').textContent = changes;
             document.getElementById('lastUpdated').textContent = data.timestamp;
+            if (data.tick) {
+                document.getElementById('tickStats').textContent =
+                    `${data.tick.duration_ms} ms per tick, next update in ${data.tick.interval}s`;
+            }
+            if (data.tick && data.tick.self) {
+                showSelfStats(data.tick.self);
+            }
             
             // Announce update to screen readers
             const announcement = `Updated: ${data.total} connections found`;
             announceToScreenReader(announcement);
-        });
+        }
         
         socket.on('monitoring_started', function() {
             isMonitoring = true;
@@ -306,41 +482,372 @@ def index():
             document.getElementById('permissionAlert').style.display = 'block';
         });
         
+        const QUERY_FIELDS = ['process', 'pid', 'state', 'port', 'rport', 'cidr'];
+        
+        function parseFilter(value) {
+            // "state:ESTABLISHED port:443 curl" -> structured query plus free text
+            const query = {};
+            const text = [];
+            value.trim().split(/\\s+/).filter(Boolean).forEach(term => {
+                const separator = term.indexOf(':');
+                const field = term.slice(0, separator).toLowerCase();
+                if (separator > 0 && QUERY_FIELDS.includes(field)) {
+                    query[field] = term.slice(separator + 1);
+                } else {
+                    text.push(term);
+                }
+            });
+            return { filter: text.join(' '), query: query };
+        }
+        
         function startMonitoring() {
-            socket.emit('start_monitoring');
+            // Filtering happens on the server, once per distinct subscription
+            const options = parseFilter(document.getElementById('filterInput').value);
+            options.query = Object.assign({}, drillQuery, options.query);
+            socket.emit('start_monitoring', options);
+        }
+        
+        // Group-by view: counts come from the server, which keeps them up to date from deltas
+        let groupBy = '';
+        let groupRequestPending = false;
+        let drillQuery = {};  // query selecting the group being drilled into
+        
+        document.getElementById('groupSelect').addEventListener('change', function() {
+            showGroups(this.value);
+        });
+        document.getElementById('clearDrill').addEventListener('click', function() {
+            drillQuery = {};
+            document.getElementById('drillDown').hidden = true;
+            if (isMonitoring) {
+                startMonitoring();
+            }
+        });
+        
+        function showGroups(by) {
+            groupBy = by;
+            document.getElementById('groupSelect').value = by;
+            document.getElementById('connectionTable').hidden = Boolean(by);
+            document.getElementById('groupTable').hidden = !by;
+            refreshGroups();
+        }
+        
+        function refreshGroups() {
+            if (!groupBy || groupRequestPending) {
+                return;
+            }
+            groupRequestPending = true;
+            const by = groupBy;
+            socket.emit('group_connections', { by: by, limit: 200 }, function(data) {
+                groupRequestPending = false;
+                if (by === groupBy) {
+                    renderGroups(data);
+                }
+            });
         }
         
+        function renderGroups(data) {
+            const head = document.getElementById('groupHead');
+            const body = document.getElementById('groupBody');
+            if (data.error) {
+                body.replaceChildren(makeMessageRow(data.error));
+                return;
+            }
+            const headers = data.by.concat(['connections']).map(name => {
+                const th = document.createElement('th');
+                th.setAttribute('role', 'columnheader');
+                th.scope = 'col';
+                th.textContent = name;
+                return th;
+            });
+            head.replaceChildren(...headers);
+            if (data.rows.length === 0) {
+                body.replaceChildren(makeMessageRow('No active connections found'));
+                return;
+            }
+            body.replaceChildren(...data.rows.map(row => {
+                const tr = document.createElement('tr');
+                tr.setAttribute('role', 'row');
+                row.group.forEach((value, i) => {
+                    const td = document.createElement('td');
+                    td.setAttribute('role', 'cell');
+                    if (i === 0) {
+                        // the first cell drills down into the group's connections
+                        const button = document.createElement('button');
+                        button.textContent = String(value);
+                        button.setAttribute('aria-label', `Show the ${row.count} connections of ${row.group.join(', ')}`);
+                        button.addEventListener('click', () => drillDown(data.by, row));
+                        td.appendChild(button);
+                    } else {
+                        td.textContent = String(value);
+                    }
+                    tr.appendChild(td);
+                });
+                const count = document.createElement('td');
+                count.setAttribute('role', 'cell');
+                count.textContent = row.count.toLocaleString();
+                tr.appendChild(count);
+                return tr;
+            }));
+        }
+        
+        function drillDown(by, row) {
+            drillQuery = row.query;
+            document.getElementById('drillLabel').textContent =
+                by.map((name, i) => `${name} ${row.group[i]}`).join(', ');
+            document.getElementById('drillDown').hidden = false;
+            showGroups('');
+            if (isMonitoring) {
+                startMonitoring();
+            }
+        }
+        
+        // Alerts from the server's rules, newest first; the list is a live log region
+        const MAX_ALERTS = 20;
+        socket.on('alert', function(alert) {
+            const item = document.createElement('li');
+            const time = new Date(alert.ts * 1000).toLocaleTimeString();
+            item.textContent = `${time} ${alert.rule}: ${alert.message}`;
+            const list = document.getElementById('alertList');
+            list.prepend(item);
+            while (list.children.length > MAX_ALERTS) {
+                list.lastChild.remove();
+            }
+            document.getElementById('alerts').hidden = false;
+        });
+        
+        socket.on('query_error', function(data) {
+            announceToScreenReader(`Filter not applied: ${data.error}`);
+            document.getElementById('changes').textContent = `Filter not applied: ${data.error}`;
+        });
+        
+        let filterTimer = null;
+        document.getElementById('filterInput').addEventListener('input', function() {
+            clearTimeout(filterTimer);
+            filterTimer = setTimeout(() => {
+                if (isMonitoring) {
+                    startMonitoring();
+                }
+            }, 300);
+        });
+        
         function stopMonitoring() {
             socket.emit('stop_monitoring');
         }
         
-        function updateTable(connections) {
+        // Virtualized table: only the rows inside the scroll viewport (plus a
+        // small overscan) exist in the DOM; spacer rows stand in for the rest.
+        const ROW_HEIGHT = 45;
+        const OVERSCAN = 10;
+        const COLUMNS = ['process', 'pid', 'local', 'remote', 'status', 'country', 'asn', 'rx_rate', 'tx_rate'];
+        // Sort value per column, matching the console and wx monitors
+        const SORT_VALUES = {
+            process: row => (row.process || '').toLowerCase(),
+            pid: row => Number(row.pid) || 0,
+            local: row => row.local,
+            remote: row => row.remote,
+            status: row => row.status,
+            country: row => row.country,
+            asn: row => row.asn,
+            rx_rate: row => row.rx_rate,
+            tx_rate: row => row.tx_rate,
+        };
+        const DESCENDING = new Set(['rx_rate', 'tx_rate']);
+        let sortColumn = null;
+        let sortAscending = true;
+        const rendered = new Map();  // row id -> <tr> currently in the DOM
+        const topSpacer = makeSpacerRow();
+        const bottomSpacer = makeSpacerRow();
+        let order = [];  // row ids in display order
+        let orderDirty = false;
+        let renderPending = false;
+        
+        document.getElementById('connectionTable').addEventListener('scroll', scheduleRender, { passive: true });
+        document.querySelectorAll('th button.sort').forEach(button => {
+            button.addEventListener('click', () => sortBy(button.dataset.column));
+        });
+        
+        function sortBy(column) {
+            if (column === sortColumn) {
+                sortAscending = !sortAscending;
+            } else {
+                sortColumn = column;
+                sortAscending = !DESCENDING.has(column);
+            }
+            document.querySelectorAll('th button.sort').forEach(button => {
+                const state = button.dataset.column !== sortColumn ? 'none' : (sortAscending ? 'ascending' : 'descending');
+                button.parentElement.setAttribute('aria-sort', state);
+            });
+            scheduleRender();
+        }
+        
+        function sortOrder() {
+            const value = SORT_VALUES[sortColumn];
+            const direction = sortAscending ? 1 : -1;
+            order.sort((a, b) => {
+                const x = value(rows.get(a));
+                const y = value(rows.get(b));
+                return (x < y ? -1 : x > y ? 1 : 0) * direction;
+            });
+        }
+        
+        // Time the browser spent on the last table render, shown with the server's own cost
+        let renderMs = null;
+        
+        function showSelfStats(stats) {
+            const stages = Object.entries(stats.stages_ms).map(([stage, ms]) => `${stage} ${ms}`);
+            if (renderMs !== null) {
+                stages.push(`browser render ${renderMs.toFixed(1)}`);
+            }
+            const parts = [];
+            if (stages.length) {
+                parts.push(`${stages.join(', ')} ms`);
+            }
+            if (stats.scanned.sockets !== undefined) {
+                parts.push(`${stats.scanned.sockets} sockets, ${stats.scanned.processes} processes scanned`);
+            }
+            parts.push(`server RSS ${stats.rss_mb} MB, CPU ${stats.cpu_percent}%`);
+            document.getElementById('selfStats').textContent = parts.join(' | ');
+        }
+        
+        function scheduleRender() {
+            // Coalesce every patch and scroll event since the last frame into one render
+            if (!renderPending) {
+                renderPending = true;
+                requestAnimationFrame(flushRender);
+            }
+        }
+        
+        function flushRender() {
+            const started = performance.now();
+            renderPending = false;
+            if (orderDirty) {
+                order = order.filter(id => rows.has(id));
+                orderDirty = false;
+            }
+            if (sortColumn) {
+                sortOrder();
+            }
+            updateTable();
+            renderMs = performance.now() - started;
+        }
+        
+        function updateTable() {
+            const container = document.getElementById('connectionTable');
+            const table = container.querySelector('table');
             const tbody = document.getElementById('connectionsBody');
-            tbody.innerHTML = '';
+            table.setAttribute('aria-rowcount', order.length + 1);
             
-            if (connections.length === 0) {
-                tbody.innerHTML = '<tr role="row"><td role="cell" colspan="5" style="text-align: center; color: #666;">No active connections found</td></tr>';
+            if (order.length === 0) {
+                rendered.clear();
+                tbody.replaceChildren(makeMessageRow('No active connections found'));
                 return;
             }
             
-            connections.forEach(conn => {
-                const row = document.createElement('tr');
-                row.setAttribute('role', 'row');
-                row.innerHTML = `
-                    <td role="cell">${escapeHtml(conn.process)}</td>
-                    <td role="cell">${escapeHtml(conn.pid)}</td>
-                    <td role="cell">${escapeHtml(conn.local)}</td>
-                    <td role="cell">${escapeHtml(conn.remote)}</td>
-                    <td role="cell">${escapeHtml(conn.status)}</td>
-                `;
-                tbody.appendChild(row);
-            });
+            const scrollTop = Math.max(0, container.scrollTop - table.tHead.offsetHeight);
+            const first = Math.max(0, Math.floor(scrollTop / ROW_HEIGHT) - OVERSCAN);
+            const last = Math.min(order.length, Math.ceil((scrollTop + container.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+            
+            const visible = [];
+            const keep = new Set();
+            for (let i = first; i < last; i++) {
+                const id = order[i];
+                let tr = rendered.get(id);
+                if (!tr) {
+                    tr = makeDataRow();
+                    rendered.set(id, tr);
+                }
+                fillRow(tr, rows.get(id), i);
+                keep.add(id);
+                visible.push(tr);
+            }
+            for (const id of rendered.keys()) {
+                if (!keep.has(id)) {
+                    rendered.delete(id);
+                }
+            }
+            
+            topSpacer.style.height = `${first * ROW_HEIGHT}px`;
+            bottomSpacer.style.height = `${(order.length - last) * ROW_HEIGHT}px`;
+            tbody.replaceChildren(topSpacer, ...visible, bottomSpacer);
+        }
+        
+        function fillRow(tr, row, index) {
+            // aria-rowindex keeps the position within the full table for screen readers
+            tr.setAttribute('aria-rowindex', index + 2);
+            for (let c = 0; c < COLUMNS.length; c++) {
+                const value = cellText(row, COLUMNS[c]);
+                const cell = tr.cells[c];
+                if (cell.textContent !== value) {
+                    cell.textContent = value;
+                }
+            }
+        }
+        
+        function cellText(row, column) {
+            if (column === 'process' && row.process == null) {
+                // Name lookup still outstanding
+                return '(resolving)';
+            }
+            if (column === 'remote' && row.hostname) {
+                // Reverse DNS name in place of the address, like netstat
+                return row.hostname + row.remote.slice(row.remote.lastIndexOf(':'));
+            }
+            if (column === 'asn') {
+                return row.asn ? `AS${row.asn} ${row.as_org}`.trim() : '';
+            }
+            if (column === 'rx_rate' || column === 'tx_rate') {
+                return formatRate(row[column]);
+            }
+            return String(row[column]);
+        }
+        
+        function formatRate(value) {
+            // Same short form as the console: 512, 1.5K, 12M
+            const units = ['', 'K', 'M', 'G'];
+            let unit = 0;
+            while (value >= 1000 && unit < units.length - 1) {
+                value /= 1000;
+                unit++;
+            }
+            if (unit === 0) {
+                return String(Math.round(value));
+            }
+            return (value < 10 ? value.toFixed(1) : value.toFixed(0)) + units[unit];
+        }
+        
+        function makeDataRow() {
+            const tr = document.createElement('tr');
+            tr.setAttribute('role', 'row');
+            tr.className = 'data-row';
+            for (let c = 0; c < COLUMNS.length; c++) {
+                const td = document.createElement('td');
+                td.setAttribute('role', 'cell');
+                tr.appendChild(td);
+            }
+            return tr;
+        }
+        
+        function makeSpacerRow() {
+            const tr = document.createElement('tr');
+            tr.className = 'spacer';
+            tr.setAttribute('aria-hidden', 'true');
+            const td = document.createElement('td');
+            td.colSpan = COLUMNS.length;
+            tr.appendChild(td);
+            return tr;
         }
         
-        function escapeHtml(text) {
-            const div = document.createElement('div');
-            div.textContent = text;
-            return div.innerHTML;
+        function makeMessageRow(message) {
+            const tr = document.createElement('tr');
+            tr.setAttribute('role', 'row');
+            const td = document.createElement('td');
+            td.setAttribute('role', 'cell');
+            td.colSpan = COLUMNS.length;
+            td.style.textAlign = 'center';
+            td.style.color = '#666';
+            td.textContent = message;
+            tr.appendChild(td);
+            return tr;
         }
         
         function announceToScreenReader(message) {
@@ -355,40 +862,240 @@ def index():
     </script>
 </body>
 </html>
-    '''
+    """
 
 
-@socketio.on('start_monitoring')
-def handle_start_monitoring():
-    global monitoring, monitor_thread
-    if not monitoring:
-        monitoring = True
-        monitor_thread = threading.Thread(target=monitor_connections, daemon=True)
-        monitor_thread.start()
-        emit('monitoring_started', broadcast=True)
-        
-        # Check if running with limited permissions
+@app.route("/api/history")
+def api_history() -> ResponseReturnValue:
+    """Events in a time range, e.g. /api/history?remote_ip=10.0.0.5&start=...&end=..."""
+    if history_store is None:
+        return jsonify({"error": "history is not enabled (start with --history PATH)"}), 404
+    try:
+        kwargs = query_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    events = history_store.query(**kwargs)
+    return jsonify({"start": kwargs["start"], "end": kwargs["end"], "events": events})
+
+
+@app.route("/api/alerts")
+def api_alerts() -> ResponseReturnValue:
+    """The most recent alerts, oldest first."""
+    if alert_engine is None:
+        return jsonify({"error": "alerting is not enabled (start with --alerts RULES.ini)"}), 404
+    return jsonify({"alerts": list(alert_engine.recent), **alert_engine.stats()})
+
+
+@app.route("/api/self")
+def api_self() -> ResponseReturnValue:
+    """The monitor's own cost: stage timings, scan counts, cache statistics, RSS and CPU."""
+    return jsonify({"tick": hub.scheduler.stats() if hub.scheduler else {}, **hub.instruments.stats(caches=True)})
+
+
+@app.route("/api/connections")
+def api_connections() -> ResponseReturnValue:
+    """Filtered, sorted, paged connections, e.g. /api/connections?state=ESTABLISHED&cidr=10.0.0.0/8&sort=-rx"""
+    try:
+        return jsonify(query_connections(request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/api/groups")
+def api_groups() -> ResponseReturnValue:
+    """Connection counts per group, e.g. /api/groups?by=process,state,network/8"""
+    try:
+        return jsonify(group_connections(request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/api/bandwidth")
+def api_bandwidth() -> ResponseReturnValue:
+    """The busiest connections and processes, e.g. /api/bandwidth?limit=20"""
+    limit = request.args.get("limit", 10, type=int)
+    with hub.lock:
+        snapshot = hub.last_snapshot
+    connections = list(snapshot) if snapshot is not None else []
+    return jsonify(busiest(connections, find_tracker(hub.enrichers), max(1, min(limit, 1000))))
+
+
+@app.route("/metrics")
+def prometheus_metrics() -> Response:
+    """Prometheus scrape target; the collector only runs while a client is subscribed.
+
+    Connection gauges older than a few polling intervals are left out, so a
+    scrape with nobody subscribed reports no stale counts.
+    """
+    scheduler = hub.scheduler
+    max_age = 3 * scheduler.interval if scheduler is not None else 0.0
+    dropped = {"hub": hub.dropped, "pipeline": hub.pipeline.dropped if hub.pipeline else 0}
+    if history_store:
+        dropped["history"] = history_store.dropped
+    if exporter:
+        dropped["export"] = exporter.dropped
+    text = metrics.render(
+        scheduler, hub.collector.process_cache.stats(), dropped, find_tracker(hub.enrichers), max_age=max_age
+    )
+    return Response(text, content_type=METRICS_CONTENT_TYPE)
+
+
+def client_sid() -> str:
+    """The Socket.IO session id of the client whose event is being handled."""
+    # flask-socketio sets it on the request while the handler runs
+    return str(request.sid)  # type: ignore[attr-defined]
+
+
+@socketio.on("start_monitoring")
+def handle_start_monitoring(options=None):
+    # Starting (or changing the filter/rate) only affects the requesting client
+    options = options or {}
+    try:
+        if not isinstance(options, dict):
+            raise ValueError("start_monitoring expects an object of options")
+        # structured filters (state, port, cidr, ...) on top of the free text one
+        query = parse_query(options["query"]) if options.get("query") else None
         try:
-            list(psutil.net_connections(kind='inet'))
-        except (psutil.AccessDenied, PermissionError):
-            emit('permission_warning')
+            rate = float(options.get("rate", scheduler_options.get("interval", 2.0)))
+        except (TypeError, ValueError):
+            rate = math.nan
+        if not math.isfinite(rate):
+            raise ValueError(f"Invalid rate {options.get('rate')!r}, expected a number of seconds")
+        encoding = options.get("encoding", default_encoding)
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding {encoding!r}, expected one of: {', '.join(ENCODINGS)}")
+        if encoding == "msgpack":
+            require_msgpack()
+    except ValueError as e:
+        emit("query_error", {"error": str(e)})
+        return
+    hub.subscribe(
+        client_sid(),
+        filter_text=str(options.get("filter", "")),
+        rate=rate,
+        encoding=encoding,
+        query=query,
+    )
+    emit("monitoring_started")
+
+
+@socketio.on("query_connections")
+def handle_query_connections(args: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Same as GET /api/connections; the page is the acknowledgement's payload."""
+    try:
+        return query_connections(args or {})
+    except ValueError as e:
+        return {"error": str(e)}
 
 
-@socketio.on('stop_monitoring')
+@socketio.on("group_connections")
+def handle_group_connections(args: Any = None) -> Dict[str, Any]:
+    """Same as GET /api/groups; the groups are the acknowledgement's payload."""
+    if not isinstance(args or {}, dict):
+        return {"error": "group_connections expects an object of arguments"}
+    try:
+        return group_connections(args or {})
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+@socketio.on("ack")
+def handle_ack(data: Any = None) -> None:
+    version = data.get("version", 0) if isinstance(data, dict) else None
+    if not isinstance(version, int) or isinstance(version, bool):
+        emit("query_error", {"error": "ack expects an object with a channel and an integer version"})
+        return
+    hub.ack(client_sid(), data.get("channel"), version)
+
+
+@socketio.on("resync")
+def handle_resync() -> None:
+    # A client missed a version; send it its channel's current state
+    hub.resync(client_sid())
+
+
+@socketio.on("stop_monitoring")
 def handle_stop_monitoring():
-    global monitoring
-    monitoring = False
-    emit('monitoring_stopped', broadcast=True)
+    hub.unsubscribe(client_sid())
+    emit("monitoring_stopped")
+
+
+@socketio.on("disconnect")
+def handle_disconnect() -> None:
+    hub.unsubscribe(client_sid())
+
+
+def open_sinks(
+    history: Optional[str],
+    retention_days: Optional[float],
+    export: Optional[str],
+    export_rotate: Optional[str],
+    alerts: Optional[str],
+) -> None:
+    """Open the history store, exporter and alert engine that were asked for and feed them each delta."""
+    global history_store, exporter, alert_engine
+    history_store = open_history(history, retention_days)
+    if history_store:
+        hub.diff.listeners.append(history_store.record)
+    if export:
+        exporter = open_exporter(export, export_rotate)
+        hub.diff.listeners.append(exporter.record)
+    if alerts:
+        alert_engine = AlertEngine(load_rules(alerts), {"socketio": lambda alert: socketio.emit("alert", alert)})
+        hub.diff.listeners.append(alert_engine.record)
+
+
+def close_sinks() -> None:
+    if history_store:
+        history_store.close()
+    if exporter:
+        exporter.close()
+    if alert_engine:
+        alert_engine.close()
+
 
+def main(
+    backend=None,
+    encoding="json",
+    interval=2.0,
+    cpu_budget=None,
+    history=None,
+    async_mode=None,
+    resolve=False,
+    geoip=None,
+    export=None,
+    export_rotate=None,
+    alerts=None,
+    profile=None,
+    profile_ticks=None,
+    retention_days=None,
+):
+    global collector, default_encoding
+    if async_mode not in (None, "threading"):
+        # the hub's pipeline runs an asyncio loop in its worker, which a green thread would block on
+        raise ValueError(f"Unsupported async mode {async_mode!r}: the collection pipeline needs 'threading'")
+    if async_mode:
+        socketio.init_app(app, async_mode=async_mode, **SOCKETIO_OPTIONS)
+    collector = hub.collector = hub.instruments.collector = ConnectionCollector(
+        backend, collector.process_cache, resolve_names=False
+    )
+    if encoding not in PAGE_ENCODINGS:
+        # msgpack stays available to other Socket.IO clients through start_monitoring
+        raise ValueError(f"The web page cannot decode {encoding!r}, expected one of: {', '.join(PAGE_ENCODINGS)}")
+    default_encoding = encoding
+    # --profile: cProfile the first ticks of collection after a client subscribes
+    profiler = open_profiler(profile, profile_ticks)
+    scheduler_options.update(interval=interval, cpu_budget=cpu_budget, profiler=profiler)
+    open_sinks(history, retention_days, export, export_rotate, alerts)
+    hub.enrichers.extend(build_enrichers(resolve, geoip))
 
-def main():
     print("Connection Monitor - Web Interface")
     print("-" * 50)
     print(f"Starting web server on http://localhost:5000")
-    
+
     # Check if running on WSL
-    is_wsl = os.path.exists('/proc/sys/fs/binfmt_misc/WSLInterop')
-    
+    is_wsl = os.path.exists("/proc/sys/fs/binfmt_misc/WSLInterop")
+
     if is_wsl:
         print("\nRunning on WSL detected!")
         print("Open this URL in your Windows browser:")
@@ -396,19 +1103,25 @@ def main():
     else:
         print("\nThe browser should open automatically.")
         print("If not, please open http://localhost:5000 in your browser.")
+
         # Try to open browser after a short delay
         def open_browser():
             time.sleep(1.5)
-            webbrowser.open('http://localhost:5000')
-        
+            webbrowser.open("http://localhost:5000")
+
         browser_thread = threading.Thread(target=open_browser, daemon=True)
         browser_thread.start()
-    
+
     print("Press Ctrl+C to stop the server.")
-    
+
     # Run the web server
-    socketio.run(app, debug=False, host='0.0.0.0', port=5000)
+    try:
+        socketio.run(app, debug=False, host="0.0.0.0", port=5000)
+    finally:
+        if profiler:
+            profiler.finish()
+        close_sinks()
 
 
-if __name__ == '__main__':
-    main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
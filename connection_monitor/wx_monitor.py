@@ -4,202 +4,483 @@ wxPython-based connection monitor with accessible interface
 """
 
 import wx
-import psutil
 import threading
-import time
 from datetime import datetime
+from typing import Any, Callable, List, Optional, Tuple
+
+from connection_monitor.alerts import Alert, AlertEngine, load_rules
+from connection_monitor.bandwidth import format_rate
+from connection_monitor.collector import DESCENDING_KEYS, SORT_KEYS, ConnectionCollector
+from connection_monitor.diff import Delta, DiffEngine
+from connection_monitor.export import open_exporter
+from connection_monitor.groups import Group, GroupCounts, group_label
+from connection_monitor.history import open_history
+from connection_monitor.instrumentation import Instruments, open_profiler
+from connection_monitor.pipeline import Enrichment, build_enrichers
+from connection_monitor.scheduler import Scheduler
+
+
+# (header, width, cell text, sort key name) for each list column
+COLUMNS = [
+    ("Process Name", 200, lambda conn: conn.process, "process"),
+    ("PID", 80, lambda conn: conn.pid_text, "pid"),
+    ("Local Address", 150, lambda conn: conn.local, "local"),
+    ("Remote Address", 200, lambda conn: conn.remote_name, "remote"),
+    ("Status", 100, lambda conn: conn.status, "status"),
+    ("Country", 70, lambda conn: conn.country, "country"),
+    ("ASN", 200, lambda conn: f"{conn.asn_text} {conn.as_org}".strip(), "asn"),
+    ("Rx/s", 70, lambda conn: format_rate(conn.rx_rate), "rx"),
+    ("Tx/s", 70, lambda conn: format_rate(conn.tx_rate), "tx"),
+]
+
+# (choice label, group-by dimensions) offered by the "Group by" control
+GROUPINGS = [
+    ("Nothing", None),
+    ("Process", "process"),
+    ("Remote host", "remote"),
+    ("Remote network", "network"),
+    ("Remote port", "port"),
+    ("State", "state"),
+    ("Process and state", "process,state"),
+]
+
+# Largest groups listed at once
+GROUP_ROWS = 500
 
 
 class ConnectionListCtrl(wx.ListCtrl):
+    """Virtual list over the latest snapshot.
+
+    The widget holds no rows of its own: it asks OnGetItemText for whatever is
+    visible. Sorting and filtering happen on the backing list, and after each
+    update only the range of rows that actually differ is refreshed.
+    """
+
     def __init__(self, parent):
-        super().__init__(parent, style=wx.LC_REPORT | wx.LC_SINGLE_SEL)
-        
+        super().__init__(parent, style=wx.LC_REPORT | wx.LC_SINGLE_SEL | wx.LC_VIRTUAL)
+
         # Create columns
-        self.InsertColumn(0, "Process Name", width=200)
-        self.InsertColumn(1, "PID", width=80)
-        self.InsertColumn(2, "Local Address", width=150)
-        self.InsertColumn(3, "Remote Address", width=200)
-        self.InsertColumn(4, "Status", width=100)
-        
+        for col, (header, width, _, _) in enumerate(COLUMNS):
+            self.InsertColumn(col, header, width=width)
+
+        self.connections = []  # latest snapshot, unfiltered
+        self.view = []  # rows currently shown, filtered and sorted
+        self.sort_column = None
+        self.sort_ascending = True
+        self.filter_text = ""
+        self.drill: Optional[Tuple[GroupCounts, Group]] = None  # group whose members are shown
+
+        self.Bind(wx.EVT_LIST_COL_CLICK, self.OnColumnClick)
+
+    def OnGetItemText(self, item: int, column: int) -> str:
+        return str(COLUMNS[column][2](self.view[item]))
+
     def UpdateConnections(self, connections):
-        # Clear existing items
-        self.DeleteAllItems()
-        
-        # Add new items
-        for idx, conn in enumerate(connections):
-            index = self.InsertItem(idx, conn['process'])
-            self.SetItem(index, 1, conn['pid'])
-            self.SetItem(index, 2, conn['local'])
-            self.SetItem(index, 3, conn['remote'])
-            self.SetItem(index, 4, conn['status'])
+        self.connections = connections
+        self.RebuildView()
+
+    def SetFilter(self, text: str) -> None:
+        self.filter_text = text.strip().lower()
+        self.RebuildView()
+
+    def SetDrill(self, drill: Optional[Tuple[GroupCounts, Group]]) -> None:
+        self.drill = drill
+        self.RebuildView()
+
+    def OnColumnClick(self, event: Any) -> None:
+        column = event.GetColumn()
+        if column == self.sort_column:
+            self.sort_ascending = not self.sort_ascending
+        else:
+            self.sort_column = column
+            self.sort_ascending = COLUMNS[column][3] not in DESCENDING_KEYS
+        self.RebuildView()
+
+    def RebuildView(self) -> None:
+        view = self.connections
+        if self.drill:
+            groups, group = self.drill
+            members = groups.member_keys(group)
+            view = [conn for conn in view if conn.key in members]
+        if self.filter_text:
+            view = [conn for conn in view if conn.matches(self.filter_text)]
+        if self.sort_column is not None:
+            view = sorted(view, key=SORT_KEYS[COLUMNS[self.sort_column][3]], reverse=not self.sort_ascending)
+
+        old_view = self.view
+        self.view = view
+        if len(view) != len(old_view):
+            self.SetItemCount(len(view))
+
+        # Find the span of positions whose row changed and repaint only that
+        first = last = None
+        for i in range(max(len(view), len(old_view))):
+            if (
+                i >= len(view)
+                or i >= len(old_view)
+                or (view[i].key != old_view[i].key or view[i].differs(old_view[i]) or view[i].rates_differ(old_view[i]))
+            ):
+                if first is None:
+                    first = i
+                last = i
+        if first is not None and last is not None and view:
+            self.RefreshItems(first, min(last, len(view) - 1))
+
+
+class GroupListCtrl(wx.ListCtrl):
+    """Virtual list of the largest groups of a :class:`GroupCounts`."""
+
+    def __init__(self, parent: Any) -> None:
+        super().__init__(parent, style=wx.LC_REPORT | wx.LC_SINGLE_SEL | wx.LC_VIRTUAL)
+        self.InsertColumn(0, "Connections", width=110)
+        self.InsertColumn(1, "Group", width=600)
+        self.groups: Optional[GroupCounts] = None
+        self.rows: List[Tuple[Group, int]] = []  # largest first
+
+    def OnGetItemText(self, item: int, column: int) -> str:
+        group, count = self.rows[item]
+        return str(count) if column == 0 else group_label(group)
+
+    def SetGroups(self, groups: Optional[GroupCounts]) -> None:
+        self.groups = groups
+        self.rows = []
+        self.SetItemCount(0)
+        self.RefreshGroups()
+
+    def RefreshGroups(self) -> None:
+        rows = self.groups.top(GROUP_ROWS) if self.groups is not None else []
+        changed = rows != self.rows
+        self.rows = rows
+        self.SetItemCount(len(rows))
+        if changed and rows:
+            self.RefreshItems(0, len(rows) - 1)
 
 
 class NetworkMonitorFrame(wx.Frame):
-    def __init__(self):
-        super().__init__(None, title="Connection Monitor", size=(900, 600))
-        
+    def __init__(
+        self,
+        backend=None,
+        interval=2.0,
+        cpu_budget=None,
+        history=None,
+        resolve=False,
+        geoip=None,
+        export=None,
+        export_rotate=None,
+        alerts=None,
+        profile=None,
+        profile_ticks=None,
+        retention_days=None,
+    ):
+        super().__init__(None, title="Connection Monitor", size=(1040, 600))
+
         self.monitoring = False
         self.monitor_thread = None
-        
+        self.collector = ConnectionCollector(backend)
+        self.diff = DiffEngine()
+        self.history = open_history(history, retention_days)
+        if self.history:
+            self.diff.listeners.append(self.history.record)
+        self.exporter = open_exporter(export, export_rotate) if export else None
+        if self.exporter:
+            self.diff.listeners.append(self.exporter.record)
+        self.alerts = AlertEngine(load_rules(alerts)) if alerts else None
+        if self.alerts:
+            self.diff.listeners.append(self.alerts.record)
+            self.alerts.listeners.append(lambda alert: wx.CallAfter(self.ShowAlert, alert))
+        self.groups: Optional[GroupCounts] = None  # behind the group list, if one is shown
+        self.enrichment = Enrichment(build_enrichers(resolve, geoip))
+        if self.enrichment.enrichers:
+            self.enrichment.start()
+        # What the monitor itself costs, for the status bar; --profile runs the first ticks under cProfile
+        self.instruments = Instruments(self.collector, self.enrichment.enrichers)
+        self.profiler = open_profiler(profile, profile_ticks)
+        self.scheduler_options = {"interval": interval, "cpu_budget": cpu_budget, "profiler": self.profiler}
+        self.scheduler = Scheduler(**self.scheduler_options)
+
         self.InitUI()
         self.SetupAccelerators()
         self.Centre()
-        
+
     def InitUI(self):
         panel = wx.Panel(self)
         vbox = wx.BoxSizer(wx.VERTICAL)
-        
+
         # Control panel
         control_panel = wx.BoxSizer(wx.HORIZONTAL)
-        
+
         self.start_btn = wx.Button(panel, label="&Start Monitoring")
         self.start_btn.Bind(wx.EVT_BUTTON, self.OnStart)
         control_panel.Add(self.start_btn, 0, wx.ALL, 5)
-        
+
         self.stop_btn = wx.Button(panel, label="S&top Monitoring")
         self.stop_btn.Bind(wx.EVT_BUTTON, self.OnStop)
         self.stop_btn.Enable(False)
         control_panel.Add(self.stop_btn, 0, wx.ALL, 5)
-        
+
         self.status_text = wx.StaticText(panel, label="Status: Stopped")
         control_panel.Add(self.status_text, 0, wx.ALL | wx.ALIGN_CENTER_VERTICAL, 5)
-        
+
+        # Filter box; the label precedes the control so screen readers announce it
+        filter_label = wx.StaticText(panel, label="&Filter:")
+        control_panel.Add(filter_label, 0, wx.ALL | wx.ALIGN_CENTER_VERTICAL, 5)
+        self.filter_ctrl = wx.SearchCtrl(panel, size=(180, -1))
+        self.filter_ctrl.SetName("Filter connections")
+        self.filter_ctrl.Bind(wx.EVT_TEXT, self.OnFilter)
+        control_panel.Add(self.filter_ctrl, 0, wx.ALL | wx.ALIGN_CENTER_VERTICAL, 5)
+
         # Add keyboard shortcut hint
         shortcut_text = wx.StaticText(panel, label="(Ctrl+P to toggle)")
         control_panel.Add(shortcut_text, 0, wx.ALL | wx.ALIGN_CENTER_VERTICAL, 5)
-        
+
         vbox.Add(control_panel, 0, wx.ALL | wx.EXPAND, 10)
-        
+
+        # Grouping: pick what to count by, then press Enter on a group to list its connections
+        group_panel = wx.BoxSizer(wx.HORIZONTAL)
+        group_label_text = wx.StaticText(panel, label="&Group by:")
+        group_panel.Add(group_label_text, 0, wx.ALL | wx.ALIGN_CENTER_VERTICAL, 5)
+        self.group_choice = wx.Choice(panel, choices=[label for label, _ in GROUPINGS])
+        self.group_choice.SetName("Group connections by")
+        self.group_choice.SetSelection(0)
+        self.group_choice.Bind(wx.EVT_CHOICE, self.OnGroupBy)
+        group_panel.Add(self.group_choice, 0, wx.ALL | wx.ALIGN_CENTER_VERTICAL, 5)
+        self.drill_text = wx.StaticText(panel, label="")
+        group_panel.Add(self.drill_text, 0, wx.ALL | wx.ALIGN_CENTER_VERTICAL, 5)
+        self.show_all_btn = wx.Button(panel, label="Show &all connections")
+        self.show_all_btn.Bind(wx.EVT_BUTTON, self.OnShowAll)
+        self.show_all_btn.Enable(False)
+        group_panel.Add(self.show_all_btn, 0, wx.ALL, 5)
+        vbox.Add(group_panel, 0, wx.LEFT | wx.RIGHT | wx.EXPAND, 10)
+
+        self.group_list = GroupListCtrl(panel)
+        self.group_list.SetName("Connection groups")
+        self.group_list.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.OnDrillDown)
+        self.group_list.Hide()
+        vbox.Add(self.group_list, 1, wx.ALL | wx.EXPAND, 10)
+
         # Connection list
         self.list_ctrl = ConnectionListCtrl(panel)
-        vbox.Add(self.list_ctrl, 1, wx.ALL | wx.EXPAND, 10)
-        
+        vbox.Add(self.list_ctrl, 2, wx.ALL | wx.EXPAND, 10)
+        self.panel = panel
+
         # Summary panel
         self.summary_text = wx.StaticText(panel, label="Total connections: 0")
         vbox.Add(self.summary_text, 0, wx.ALL, 10)
-        
+
+        # Latest alert from the rules file, if one was given
+        self.alert_text = wx.StaticText(panel, label="")
+        self.alert_text.SetName("Latest alert")
+        vbox.Add(self.alert_text, 0, wx.LEFT | wx.RIGHT | wx.BOTTOM, 10)
+
         panel.SetSizer(vbox)
-        
-        # Status bar
-        self.CreateStatusBar()
+
+        # Status bar: state on the left, the monitor's own cost on the right
+        self.CreateStatusBar(2)
+        self.SetStatusWidths([-2, -3])
         self.SetStatusText("Ready - Press Ctrl+P to start/stop monitoring")
-        
+
         # Bind close event
         self.Bind(wx.EVT_CLOSE, self.OnClose)
-        
+
     def SetupAccelerators(self):
         # Create accelerator for Ctrl+P
         accel_id = wx.NewIdRef()
         self.Bind(wx.EVT_MENU, self.OnToggleMonitoring, id=accel_id)
-        
-        accel_tbl = wx.AcceleratorTable([
-            (wx.ACCEL_CTRL, ord('P'), accel_id)
-        ])
+
+        accel_tbl = wx.AcceleratorTable([(wx.ACCEL_CTRL, ord("P"), accel_id)])
         self.SetAcceleratorTable(accel_tbl)
-        
+
     def OnToggleMonitoring(self, event):
         """Toggle monitoring on/off with Ctrl+P"""
         if self.monitoring:
             self.OnStop(event)
         else:
             self.OnStart(event)
-            
-    def GetProcessName(self, pid):
-        try:
-            process = psutil.Process(pid)
-            return process.name()
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            return "Unknown"
-    
-    def GetConnections(self):
-        connections = []
-        try:
-            for conn in psutil.net_connections(kind='inet'):
-                if conn.status == 'NONE' or not conn.raddr:
-                    continue
-                    
-                process_name = self.GetProcessName(conn.pid) if conn.pid else "System"
-                
-                local_addr = f"{conn.laddr.ip}:{conn.laddr.port}"
-                remote_addr = f"{conn.raddr.ip}:{conn.raddr.port}" if conn.raddr else "N/A"
-                
-                connections.append({
-                    'process': process_name,
-                    'pid': str(conn.pid) if conn.pid else "N/A",
-                    'local': local_addr,
-                    'remote': remote_addr,
-                    'status': conn.status
-                })
-        except (psutil.AccessDenied, PermissionError):
-            # Try per-process connections
-            for proc in psutil.process_iter(['pid', 'name']):
-                try:
-                    for conn in proc.connections(kind='inet'):
-                        if conn.status == 'NONE' or not conn.raddr:
-                            continue
-                            
-                        local_addr = f"{conn.laddr.ip}:{conn.laddr.port}"
-                        remote_addr = f"{conn.raddr.ip}:{conn.raddr.port}"
-                        
-                        connections.append({
-                            'process': proc.info['name'],
-                            'pid': str(proc.info['pid']),
-                            'local': local_addr,
-                            'remote': remote_addr,
-                            'status': conn.status
-                        })
-                except (psutil.AccessDenied, psutil.NoSuchProcess):
-                    continue
-                    
-        return connections
-    
+
+    def MonitorTick(self) -> Delta:
+        snapshot = self.instruments.timed("collect", self.collector.collect)
+        self.instruments.timed("enrich", self.enrichment.apply, snapshot)
+        delta = self.instruments.timed("diff", self.diff.update, snapshot)
+
+        # Update UI in main thread, profiled along with the tick while profiled ticks remain
+        if self.profiler is not None and self.profiler.active:
+            wx.CallAfter(self.profiler.call, self.UpdateUI, snapshot.connections, delta)
+        else:
+            wx.CallAfter(self.UpdateUI, snapshot.connections, delta)
+        return delta
+
     def MonitorLoop(self):
-        while self.monitoring:
-            connections = self.GetConnections()
-            
-            # Update UI in main thread
-            wx.CallAfter(self.UpdateUI, connections)
-            time.sleep(2)
-    
-    def UpdateUI(self, connections):
-        self.list_ctrl.UpdateConnections(connections)
-        self.summary_text.SetLabel(f"Total connections: {len(connections)}")
-        self.SetStatusText(f"Last updated: {datetime.now().strftime('%H:%M:%S')} - Press Ctrl+P to stop")
-        
+        self.diff.reset()
+        self.scheduler.run(self.MonitorTick)
+
+    def UpdateUI(self, connections, delta):
+        with self.instruments.stages.time("render"):
+            self.list_ctrl.UpdateConnections(connections)
+            if self.groups is not None:
+                self.group_list.RefreshGroups()
+            self.summary_text.SetLabel(
+                f"Total connections: {len(connections)}, showing {len(self.list_ctrl.view)} "
+                f"(opened {len(delta.opened)}, closed {len(delta.closed)}, changed {len(delta.changed)})"
+            )
+        tick = self.scheduler.last
+        timing = f" - {tick.duration * 1000:.0f} ms per tick, next in {tick.interval:.1f}s" if tick else ""
+        self.SetStatusText(f"Last updated: {datetime.now().strftime('%H:%M:%S')}{timing} - Press Ctrl+P to stop")
+        self.SetStatusText(self.instruments.summary(), 1)
+
+    def ShowAlert(self, alert: Alert) -> None:
+        time_text = datetime.fromtimestamp(alert["ts"]).strftime("%H:%M:%S")
+        fired = self.alerts.fired if self.alerts is not None else 1
+        self.alert_text.SetLabel(f"Alert {time_text} {alert['rule']}: {alert['message']} ({fired} so far)")
+
+    def OnFilter(self, event: Any) -> None:
+        self.list_ctrl.SetFilter(self.filter_ctrl.GetValue())
+
+    def OnGroupBy(self, event: Any) -> None:
+        """Count connections by the chosen grouping, updated from each tick's delta."""
+        _, by = GROUPINGS[self.group_choice.GetSelection()]
+        groups = None
+        if by:
+            groups = GroupCounts(by.split(","))
+            delta = self.diff.last_delta
+            if delta is not None:
+                groups.reset(delta.snapshot, delta.snapshot)
+            self.diff.listeners = [*self.diff.listeners, groups.record]
+        self.groups = groups
+        self.ReleaseGroups()
+        self.group_list.SetGroups(groups)
+        self.group_list.Show(groups is not None)
+        self.panel.Layout()
+
+    def OnDrillDown(self, event: Any) -> None:
+        """List only the connections of the activated group."""
+        if self.groups is None:
+            return
+        group, _ = self.group_list.rows[event.GetIndex()]
+        self.list_ctrl.SetDrill((self.groups, group))
+        self.drill_text.SetLabel(f"Showing {group_label(group)}")
+        self.show_all_btn.Enable(True)
+        self.list_ctrl.SetFocus()
+
+    def OnShowAll(self, event: Any) -> None:
+        self.list_ctrl.SetDrill(None)
+        self.drill_text.SetLabel("")
+        self.show_all_btn.Enable(False)
+        self.ReleaseGroups()
+
+    def ReleaseGroups(self) -> None:
+        """Stop maintaining group counts nothing is showing any more."""
+        in_use = [self.groups, self.list_ctrl.drill[0] if self.list_ctrl.drill else None]
+
+        def wanted(listener: Callable[[Delta], None]) -> bool:
+            owner = getattr(listener, "__self__", None)
+            return not isinstance(owner, GroupCounts) or owner in in_use
+
+        self.diff.listeners = [listener for listener in self.diff.listeners if wanted(listener)]
+
     def OnStart(self, event):
         self.monitoring = True
         self.start_btn.Enable(False)
         self.stop_btn.Enable(True)
         self.status_text.SetLabel("Status: Monitoring...")
         self.SetStatusText("Monitoring active - Press Ctrl+P to stop")
-        
+
         # Start monitoring thread
+        self.scheduler = Scheduler(**self.scheduler_options)
         self.monitor_thread = threading.Thread(target=self.MonitorLoop, daemon=True)
         self.monitor_thread.start()
-        
+
     def OnStop(self, event):
         self.monitoring = False
+        self.scheduler.stop()
         self.start_btn.Enable(True)
         self.stop_btn.Enable(False)
         self.status_text.SetLabel("Status: Stopped")
         self.SetStatusText("Monitoring stopped - Press Ctrl+P to start")
-        
+
     def OnClose(self, event):
         self.monitoring = False
+        self.scheduler.stop()
+        self.enrichment.stop()
+        if self.profiler:
+            self.profiler.finish()
+        if self.history:
+            self.history.close()
+        if self.exporter:
+            self.exporter.close()
+        if self.alerts:
+            self.alerts.close()
         self.Destroy()
 
 
 class NetworkMonitorApp(wx.App):
+    def __init__(
+        self,
+        backend=None,
+        interval=2.0,
+        cpu_budget=None,
+        history=None,
+        resolve=False,
+        geoip=None,
+        export=None,
+        export_rotate=None,
+        alerts=None,
+        profile=None,
+        profile_ticks=None,
+        retention_days=None,
+    ):
+        # OnInit runs inside wx.App.__init__, so the options must be set first
+        self.options = {
+            "backend": backend,
+            "interval": interval,
+            "cpu_budget": cpu_budget,
+            "history": history,
+            "resolve": resolve,
+            "geoip": geoip,
+            "export": export,
+            "export_rotate": export_rotate,
+            "alerts": alerts,
+            "profile": profile,
+            "profile_ticks": profile_ticks,
+            "retention_days": retention_days,
+        }
+        super().__init__()
+
     def OnInit(self):
-        frame = NetworkMonitorFrame()
+        frame = NetworkMonitorFrame(**self.options)
         frame.Show()
         return True
 
 
-def main():
-    app = NetworkMonitorApp()
+def main(
+    backend=None,
+    interval=2.0,
+    cpu_budget=None,
+    history=None,
+    resolve=False,
+    geoip=None,
+    export=None,
+    export_rotate=None,
+    alerts=None,
+    profile=None,
+    profile_ticks=None,
+    retention_days=None,
+):
+    app = NetworkMonitorApp(
+        backend,
+        interval,
+        cpu_budget,
+        history,
+        resolve,
+        geoip,
+        export,
+        export_rotate,
+        alerts,
+        profile,
+        profile_ticks,
+        retention_days,
+    )
     app.MainLoop()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
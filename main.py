@@ -3,103 +3,199 @@
 Connection Monitor - A simple network connection monitoring tool
 """
 
+import importlib.util
 import sys
-import os
+import time
+
+# Start of the launcher, for --import-time
+STARTED = time.perf_counter()
+
+# Modules each interface needs besides connection_monitor itself
+INTERFACES = {
+    "console": (),
+    "web": ("flask", "flask_socketio"),
+    "wx": ("wx",),
+}
+
+
+def pop_option(argv, name):
+    """Remove ``name VALUE`` or ``name=VALUE`` from argv and return VALUE"""
+    for i, arg in enumerate(argv):
+        if arg == name and i + 1 < len(argv):
+            value = argv[i + 1]
+            del argv[i : i + 2]
+            return value
+        if arg.startswith(name + "="):
+            del argv[i]
+            return arg.split("=", 1)[1]
+    return None
+
+
+def pop_flag(argv, name):
+    """Remove ``name`` from argv and return whether it was present"""
+    if name in argv:
+        argv.remove(name)
+        return True
+    return False
+
+
+def interface_available(name):
+    """Whether the modules interface ``name`` needs are installed, found without importing them"""
+    return all(importlib.util.find_spec(module) is not None for module in INTERFACES[name])
+
+
+def load_interface(name, report=False):
+    """Import interface ``name`` and return its ``main``.
+
+    The interfaces are only imported once chosen, so the console never pays
+    for Flask or wx. The imports are spelled out rather than computed so
+    PyInstaller still finds them. With ``report`` the import time, and the
+    time since the launcher started, go to stderr.
+    """
+    started = time.perf_counter()
+    if name == "web":
+        from connection_monitor.web_monitor import main as interface_main
+    elif name == "wx":
+        from connection_monitor.wx_monitor import main as interface_main
+    else:
+        from connection_monitor.console_monitor import main as interface_main
+    if report:
+        now = time.perf_counter()
+        print(
+            f"Loaded the {name} interface in {(now - started) * 1000:.0f} ms "
+            f"({(now - STARTED) * 1000:.0f} ms since the launcher started)",
+            file=sys.stderr,
+        )
+    return interface_main
+
+
+def run_interface(name, options, encoding="json", async_mode=None, report_import_time=False):
+    """Start interface ``name``, falling back to the console if the web or wx one fails"""
+    if name == "console":
+        load_interface("console", report_import_time)(**options)
+    elif name == "web":
+        try:
+            web_main = load_interface("web", report_import_time)
+            web_main(encoding=encoding, async_mode=async_mode, **options)
+        except Exception as e:
+            print(f"\nError starting web interface: {e}")
+            print("\nDetailed error information:")
+            import traceback
+
+            traceback.print_exc()
+            print("\nPress Enter to continue to console interface...")
+            input()
+            load_interface("console")(**options)
+    else:
+        try:
+            load_interface("wx", report_import_time)(**options)
+        except Exception as e:
+            print(f"\nError starting wxPython interface: {e}")
+            print("Falling back to console interface...")
+            load_interface("console")(**options)
 
 
 def main():
+    # Collection backend: psutil (default), proc, netlink or auto (see collector.BACKENDS)
+    backend = pop_option(sys.argv, "--backend")
+    # Web wire encoding: json (default) or columnar (see protocol.PAGE_ENCODINGS)
+    encoding = pop_option(sys.argv, "--encoding") or "json"
+    # Flask-SocketIO async_mode for the web interface: only threading (the default) runs the pipeline
+    async_mode = pop_option(sys.argv, "--async-mode")
+    # Polling: base interval in seconds and optional CPU cap as a fraction of one core
+    interval = pop_option(sys.argv, "--interval")
+    cpu_budget = pop_option(sys.argv, "--cpu-budget")
+    profile_ticks = pop_option(sys.argv, "--profile-ticks")
+    retention_days = pop_option(sys.argv, "--history-retention")
+    options = {
+        "backend": backend,
+        "interval": float(interval) if interval else 2.0,
+        "cpu_budget": float(cpu_budget) if cpu_budget else None,
+        # SQLite file to record connection history into
+        "history": pop_option(sys.argv, "--history"),
+        # Days of history to keep (default 30, 0 keeps everything)
+        "retention_days": float(retention_days) if retention_days else None,
+        # Show reverse DNS names for remote addresses
+        "resolve": pop_flag(sys.argv, "--resolve"),
+        # Country/ASN databases (.mmdb, ip2asn .csv/.tsv), comma separated
+        "geoip": pop_option(sys.argv, "--geoip"),
+        # Stream events and snapshots to a file: .ndjson, .csv or .parquet, optionally .gz or .zst
+        "export": pop_option(sys.argv, "--export"),
+        # Start a new export file by size and/or age, e.g. 100MB, 1h or 100MB,1h
+        "export_rotate": pop_option(sys.argv, "--export-rotate"),
+        # Alert rules file ([rule:NAME] sections, see connection_monitor/alerts.py)
+        "alerts": pop_option(sys.argv, "--alerts"),
+        # Write cProfile statistics for the first --profile-ticks ticks (default 30) to this file
+        "profile": pop_option(sys.argv, "--profile"),
+        "profile_ticks": int(profile_ticks) if profile_ticks else None,
+    }
+    # Daemon settings file; command line options override it
+    config = pop_option(sys.argv, "--config")
+    # Start this interface instead of asking: console, web or wx
+    interface = pop_option(sys.argv, "--interface")
+    # Print how long loading the interface took (see load_interface)
+    report_import_time = pop_flag(sys.argv, "--import-time")
+
     # Check command line arguments
     if len(sys.argv) > 1:
-        if sys.argv[1] == '--console':
-            from connection_monitor.console_monitor import main as console_main
-            console_main()
+        if sys.argv[1] == "--daemon":
+            from connection_monitor.daemon import main as daemon_main
+
+            # only options actually given override the config file
+            daemon_main(
+                config,
+                **dict(options, interval=options["interval"] if interval else None, resolve=options["resolve"] or None),
+            )
             return
-    
-    # Check what's available
-    web_available = False
-    wx_available = False
-    
-    try:
-        import flask
-        import flask_socketio
-        web_available = True
-    except ImportError:
-        pass
-    
-    try:
-        import wx
-        wx_available = True
-    except ImportError:
-        pass
-    
+        if sys.argv[1] == "--console":
+            interface = "console"
+
+    if interface is not None:
+        if interface not in INTERFACES:
+            print(f"Unknown interface {interface!r}, expected one of: {', '.join(INTERFACES)}")
+            sys.exit(2)
+        if not interface_available(interface):
+            print(f"The {interface} interface needs {' and '.join(INTERFACES[interface])} installed")
+            sys.exit(1)
+        run_interface(interface, options, encoding, async_mode, report_import_time)
+        return
+
+    # Check what's available without importing it; wx alone can take a second to import
+    web_available = interface_available("web")
+    wx_available = interface_available("wx")
+
     print("Connection Monitor")
     print("-" * 50)
     print("\nAvailable interfaces:")
     print("1. Console interface (works everywhere)")
-    
-    options = ['console']
-    
+
+    interfaces = ["console"]
+
     if web_available:
-        options.append('web')
+        interfaces.append("web")
         print("2. Web interface (accessible, works in browser)")
-    
+
     if wx_available:
-        options.append('wx')
-        print(f"{len(options)}. wxPython interface (accessible with screen readers)")
+        interfaces.append("wx")
+        print(f"{len(interfaces)}. wxPython interface (accessible with screen readers)")
     else:
         print("\nNote: wxPython not installed. To install:")
         print("  See INSTALL_WX.md for instructions")
-    
-    print(f"\nSelect interface (1-{len([o for o in options if o != 'console'])+1}): ", end='')
-    
+
+    print(f"\nSelect interface (1-{len(interfaces)}): ", end="")
+
     try:
         choice = int(input())
     except (ValueError, KeyboardInterrupt):
         print("\nExiting...")
         sys.exit(0)
-    
-    if choice == 1:
-        from connection_monitor.console_monitor import main as console_main
-        console_main()
-    elif choice == 2 and len(options) > 1:
-        selected = options[1]
-        if selected == 'web':
-            try:
-                from connection_monitor.web_monitor import main as web_main
-                web_main()
-            except Exception as e:
-                print(f"\nError starting web interface: {e}")
-                print("\nDetailed error information:")
-                import traceback
-                traceback.print_exc()
-                print("\nPress Enter to continue to console interface...")
-                input()
-                from connection_monitor.console_monitor import main as console_main
-                console_main()
-        elif selected == 'wx':
-            try:
-                from connection_monitor.wx_monitor import main as wx_main
-                wx_main()
-            except Exception as e:
-                print(f"\nError starting wxPython interface: {e}")
-                print("Falling back to console interface...")
-                from connection_monitor.console_monitor import main as console_main
-                console_main()
-    elif choice == 3 and len(options) > 2:
-        # This would be wx if both web and wx are available
-        try:
-            from connection_monitor.wx_monitor import main as wx_main
-            wx_main()
-        except Exception as e:
-            print(f"\nError starting wxPython interface: {e}")
-            print("Falling back to console interface...")
-            from connection_monitor.console_monitor import main as console_main
-            console_main()
+
+    if 1 <= choice <= len(interfaces):
+        run_interface(interfaces[choice - 1], options, encoding, async_mode, report_import_time)
     else:
         print("\nInvalid choice. Starting console interface...")
-        from connection_monitor.console_monitor import main as console_main
-        console_main()
+        run_interface("console", options, encoding, async_mode, report_import_time)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,139 @@
+"""
+Synthetic snapshots and per-connection budgets for the benchmark suite
+
+Run with ``make bench`` (or ``pytest tests/benchmarks --benchmark-only``).
+Every benchmark is checked against :data:`BUDGETS`, a ceiling on the median
+time per connection generous enough for slow CI machines, so only an
+order-of-magnitude regression fails outright; ``make bench`` also compares
+against the last saved run and fails on a slowdown of more than 15%.
+"""
+
+import random
+import socket
+import struct
+
+import pytest
+
+from connection_monitor.collector import Connection
+
+SIZES = (1_000, 10_000, 100_000)
+
+STATES = ["ESTABLISHED"] * 16 + ["TIME_WAIT"] * 2 + ["CLOSE_WAIT", "SYN_SENT"]
+
+# microseconds per connection, about three times the slowest size on a laptop;
+# the per-connection cost grows with size as the working set leaves the CPU caches
+BUDGETS = {
+    "collect_proc": 20.0,
+    "collect_netlink": 25.0,
+    "as_row": 12.0,
+    "filter": 5.0,
+    "snapshot_json": 30.0,
+    "snapshot_columnar": 20.0,
+    "snapshot_msgpack": 20.0,
+    "patch_json": 10.0,
+    "diff": 8.0,
+    "console_frame": 0.5,
+    "wx_view": 15.0,
+}
+
+
+def synthetic_connections(n, seed=0):
+    """``n`` connections spread like a busy server's: a few hundred processes, thousands of peers."""
+    rng = random.Random(seed)
+    processes = [(1000 + i, f"worker-{i}") for i in range(max(n // 200, 10))]
+    connections = []
+    for i in range(n):
+        pid, name = processes[rng.randrange(len(processes))]
+        conn = Connection(
+            pid,
+            name,
+            socket.AF_INET,
+            socket.SOCK_STREAM,
+            "10.0.0.2",
+            1024 + i % 64000,
+            f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+            rng.choice((443, 443, 443, 80, 22, 5432)),
+            rng.choice(STATES),
+        )
+        conn.rx_rate = rng.random() * 1e6
+        conn.tx_rate = rng.random() * 1e5
+        connections.append(conn)
+    return connections
+
+
+def churned(connections, fraction=0.01, seed=1):
+    """The next tick of ``connections``: ``fraction`` closed, as many opened and as many changed state."""
+    rng = random.Random(seed)
+    count = max(int(len(connections) * fraction), 1)
+    rows = list(connections)
+    for _ in range(count):
+        rows.pop(rng.randrange(len(rows)))
+    for i in rng.sample(range(len(rows)), count):
+        old = rows[i]
+        rows[i] = Connection(
+            old.pid, old.process, old.family, old.type, old.laddr_ip, old.laddr_port, old.raddr_ip,
+            old.raddr_port, "CLOSE_WAIT" if old.status != "CLOSE_WAIT" else "TIME_WAIT",
+        )  # fmt: skip
+    opened = synthetic_connections(count, seed + 1)
+    for conn in opened:
+        conn.laddr_ip = "10.0.0.3"  # keeps the new keys distinct from the old ones
+    return rows + opened
+
+
+def proc_tcp_table(connections):
+    """A /proc/net/tcp listing of ``connections``."""
+    lines = ["  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode"]
+    states = {"ESTABLISHED": "01", "SYN_SENT": "02", "TIME_WAIT": "06", "CLOSE_WAIT": "08"}
+    for i, conn in enumerate(connections):
+        local = socket.inet_aton(conn.laddr_ip)[::-1].hex().upper()
+        remote = socket.inet_aton(conn.raddr_ip)[::-1].hex().upper()
+        lines.append(
+            f"{i:4}: {local}:{conn.laddr_port:04X} {remote}:{conn.raddr_port:04X} {states[conn.status]} "
+            f"00000000:00000000 00:00000000 00000000  1000        0 {100000 + i} 1 0000000000000000 20 4 30 10 -1"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def netlink_dump(connections):
+    """A sock_diag reply buffer holding ``connections``, each with ``tcp_info`` counters."""
+    from connection_monitor import netlink
+
+    states = {name: number for number, name in enumerate(netlink.TCP_STATES)}
+    info = bytes(120) + struct.pack("=QQII", 10_000, 20_000, 10, 20)
+    attr = netlink.RTATTR.pack(netlink.RTATTR.size + len(info), netlink.INET_DIAG_INFO) + info
+    parts = []
+    for i, conn in enumerate(connections):
+        record = netlink.INET_DIAG_MSG.pack(
+            socket.AF_INET,
+            states[conn.status],
+            conn.laddr_port.to_bytes(2, "big"),
+            conn.raddr_port.to_bytes(2, "big"),
+            socket.inet_aton(conn.laddr_ip).ljust(16, b"\0"),
+            socket.inet_aton(conn.raddr_ip).ljust(16, b"\0"),
+            1000,
+            100000 + i,
+        )
+        payload = record + attr
+        parts.append(netlink.NLMSGHDR.pack(netlink.NLMSGHDR.size + len(payload), netlink.SOCK_DIAG_BY_FAMILY, 2, 1, 0))
+        parts.append(payload)
+    parts.append(netlink.NLMSGHDR.pack(netlink.NLMSGHDR.size + 4, netlink.NLMSG_DONE, 2, 1, 0) + bytes(4))
+    return b"".join(parts)
+
+
+@pytest.fixture(scope="session", params=SIZES, ids=lambda n: f"{n // 1000}k")
+def connections(request):
+    return synthetic_connections(request.param)
+
+
+@pytest.fixture
+def within_budget(benchmark):
+    """Call with the budget name and connection count after running ``benchmark``."""
+
+    def check(name, n):
+        stats = benchmark.stats
+        if stats is None:  # --benchmark-disable: ran once as a plain test
+            return
+        per_connection = stats.stats.median / n * 1e6
+        assert per_connection <= BUDGETS[name], f"{name}: {per_connection:.2f} us per connection"
+
+    return check
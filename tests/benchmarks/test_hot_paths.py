@@ -0,0 +1,152 @@
+import io
+import json
+import os
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from conftest import churned, netlink_dump, proc_tcp_table  # noqa: E402
+
+from connection_monitor.collector import ConnectionCollector, Snapshot  # noqa: E402
+from connection_monitor.console_render import ScreenRenderer  # noqa: E402
+from connection_monitor.diff import DiffEngine  # noqa: E402
+from connection_monitor.netlink import NetlinkBackend, parse_messages  # noqa: E402
+from connection_monitor.procnet import ProcNetBackend  # noqa: E402
+from connection_monitor.protocol import ENCODINGS, ConnectionStream, msgpack, pack  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def proc_root(connections, tmp_path_factory):
+    root = tmp_path_factory.mktemp("proc")
+    (root / "net").mkdir()
+    (root / "net" / "tcp").write_text(proc_tcp_table(connections))
+    for name in ("tcp6", "udp", "udp6"):
+        (root / "net" / name).write_text(proc_tcp_table([]))
+    return str(root)
+
+
+def test_collect_proc(benchmark, connections, proc_root, within_budget):
+    backend = ProcNetBackend(proc_root)
+    rows, _ = benchmark(backend.collect)
+    assert len(rows) == len(connections)
+    within_budget("collect_proc", len(connections))
+
+
+def test_collect_netlink(benchmark, connections, tmp_path, within_budget):
+    # the kernel's reply is replaced by a prepared buffer; decoding it is what is measured
+    data = netlink_dump(connections)
+    backend = NetlinkBackend(root=str(tmp_path))
+    backend.dump = lambda family: parse_messages(data)[0] if family == 2 else []
+    rows, _ = benchmark(backend.collect)
+    assert len(rows) == len(connections)
+    within_budget("collect_netlink", len(connections))
+
+
+@pytest.mark.parametrize("backend", ["psutil", "proc", "netlink"])
+def test_collect_live(benchmark, backend):
+    """The real backends on this machine, for comparing them; no budget, the socket count varies."""
+    collector = ConnectionCollector(backend)
+    if getattr(collector.backend, "name", backend) != backend:
+        pytest.skip(f"{backend} is not available here")
+    benchmark(collector.collect)
+
+
+def test_format_rows(benchmark, connections, within_budget):
+    benchmark(lambda: [conn.as_row() for conn in connections])
+    within_budget("as_row", len(connections))
+
+
+def test_filter(benchmark, connections, within_budget):
+    benchmark(lambda: [conn for conn in connections if conn.matches("worker-1")])
+    within_budget("filter", len(connections))
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_snapshot_payload(benchmark, connections, encoding, within_budget):
+    if encoding == "msgpack" and msgpack is None:
+        pytest.skip("msgpack is not installed")
+    stream = ConnectionStream(encoding)
+    stream.update(DiffEngine().update(Snapshot(connections, 0.0)))
+
+    def serialize():
+        payload = pack(stream.snapshot(), encoding)
+        # Socket.IO sends dicts as JSON text and bytes as a binary attachment
+        return payload if isinstance(payload, bytes) else json.dumps(payload)
+
+    benchmark(serialize)
+    within_budget(f"snapshot_{encoding}", len(connections))
+
+
+def test_patch_payload(benchmark, connections, within_budget):
+    after = Snapshot(churned(connections), 1.0)
+
+    def setup():
+        engine = DiffEngine()
+        stream = ConnectionStream()
+        stream.update(engine.update(Snapshot(connections, 0.0)))
+        return (engine, stream), {}
+
+    def patch(engine, stream):
+        return json.dumps(pack(stream.update(engine.update(after)), "json"))
+
+    benchmark.pedantic(patch, setup=setup, rounds=5)
+    within_budget("patch_json", len(connections))
+
+
+def test_diff(benchmark, connections, within_budget):
+    after = Snapshot(churned(connections), 1.0)
+
+    def setup():
+        engine = DiffEngine()
+        engine.update(Snapshot(connections, 0.0))
+        return (engine,), {}
+
+    delta = benchmark.pedantic(lambda engine: engine.update(after), setup=setup, rounds=10)
+    assert delta.churn > 0
+    within_budget("diff", len(connections))
+
+
+def test_console_frame(benchmark, connections, within_budget):
+    from connection_monitor.console_monitor import ConsoleNetworkMonitor
+
+    monitor = ConsoleNetworkMonitor()
+    monitor.connections_data = connections
+    monitor.sort_column, monitor.sort_ascending = "rx", False
+    renderer = ScreenRenderer(io.StringIO())
+
+    def frame():
+        renderer.previous = []  # repaint everything, as after a resize
+        renderer.stream = io.StringIO()
+        renderer.render(monitor.build_frame())
+
+    benchmark(frame)
+    within_budget("console_frame", len(connections))
+
+
+def test_wx_view(benchmark, connections, within_budget):
+    wx = pytest.importorskip("wx")
+    if os.name != "nt" and not os.environ.get("DISPLAY") and not os.environ.get("WAYLAND_DISPLAY"):
+        pytest.skip("no display for wx")
+    from connection_monitor.wx_monitor import ConnectionListCtrl
+
+    app = wx.App(False)
+    frame = wx.Frame(None)
+    try:
+        ctrl = ConnectionListCtrl(frame)
+        ctrl.sort_column = 7  # Rx/s
+        ctrl.sort_ascending = False
+        after = churned(connections)
+        ctrl.UpdateConnections(connections)
+        # alternate between two ticks so every round rebuilds and repaints a changed view
+        ticks = [connections, after]
+
+        def tick():
+            ticks.reverse()
+            ctrl.UpdateConnections(ticks[0])
+
+        benchmark(tick)
+        within_budget("wx_view", len(connections))
+    finally:
+        frame.Destroy()
+        app.Destroy()
@@ -0,0 +1,21 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+ROOT = Path(__file__).parent.parent.parent
+
+# milliseconds from launching the interpreter to the console interface being
+# imported; the target is about 100 ms, this leaves room for slow CI machines
+STARTUP_BUDGET_MS = 300
+
+
+def test_console_startup(benchmark):
+    """Interpreter start, interface probing and the console imports, as ``main.py --interface console`` does."""
+    command = [sys.executable, "-c", "import main; main.interface_available('web'); main.load_interface('console')"]
+    benchmark.pedantic(subprocess.run, args=(command,), kwargs={"cwd": ROOT, "check": True}, rounds=5)
+    if benchmark.stats is not None:
+        assert benchmark.stats.stats.median * 1000 <= STARTUP_BUDGET_MS
@@ -0,0 +1,104 @@
+import socket
+
+import pytest
+
+from connection_monitor.alerts import AlertEngine, NetworkSet, Rule, load_rules, parse_port_set
+from connection_monitor.collector import Connection, Snapshot
+from connection_monitor.diff import DiffEngine
+
+
+def conn(process, lport, rip, rport=443, status="ESTABLISHED"):
+    return Connection(10, process, socket.AF_INET, socket.SOCK_STREAM, "10.0.0.2", lport, rip, rport, status)
+
+
+def make_engine(*rules):
+    fired = []
+    engine = AlertEngine(rules, {"log": fired.append})
+    diff = DiffEngine()
+    diff.listeners.append(engine.record)
+    return diff, engine, fired
+
+
+def test_network_set():
+    networks = NetworkSet(["10.0.0.0/8", "192.168.1.0/24", "203.0.113.7", "fc00::/7"])
+    assert "10.200.0.1" in networks
+    assert "192.168.1.9" in networks and "192.168.2.9" not in networks
+    assert "203.0.113.7" in networks and "203.0.113.8" not in networks
+    assert "fd12::1" in networks and "2001:db8::1" not in networks
+    assert "::ffff:10.1.1.1" in networks
+    assert "not an ip" not in networks
+
+
+def test_process_to_public_address_fires_on_open_and_change():
+    rule = Rule("curl-out", process=["CURL"], remote=["private"], remote_outside=True, cooldown=0)
+    diff, engine, fired = make_engine(rule)
+    diff.update(Snapshot([conn("curl", 1, "10.0.0.5"), conn("curl", 2, "1.1.1.1"), conn("ssh", 3, "8.8.8.8")], 0.0))
+    assert [alert["connection"]["local"] for alert in fired] == ["10.0.0.2:2"]
+
+    # already matching: no repeat; a resolved process name that now matches fires
+    diff.update(Snapshot([conn("curl", 2, "1.1.1.1"), conn("(resolving)", 4, "9.9.9.9")], 1.0))
+    diff.update(Snapshot([conn("curl", 2, "1.1.1.1"), conn("curl", 4, "9.9.9.9")], 2.0))
+    assert [alert["connection"]["local"] for alert in fired] == ["10.0.0.2:2", "10.0.0.2:4"]
+    assert list(engine.recent) == fired
+
+
+def test_per_host_count_threshold():
+    diff, engine, fired = make_engine(Rule("syn", state=["syn_sent"], count=2, cooldown=0))
+    syns = [conn("scan", port, "198.51.100.1", status="SYN_SENT") for port in range(1, 4)]
+    diff.update(Snapshot(syns[:2], 0.0))
+    assert fired == []
+    diff.update(Snapshot(syns, 1.0))
+    assert [alert["message"] for alert in fired] == ["more than 2 connections to 198.51.100.1"]
+    assert engine.host_counts["syn"]["198.51.100.1"] == 3
+
+    # falling back to the threshold re-arms the rule
+    diff.update(Snapshot(syns[:2], 2.0))
+    diff.update(Snapshot(syns, 3.0))
+    assert len(fired) == 2
+
+
+def test_count_does_not_refire_when_a_counted_connection_changes():
+    diff, engine, fired = make_engine(Rule("fanout", count=2, cooldown=0))
+    conns = [conn("curl", port, "198.51.100.1") for port in range(1, 4)]
+    diff.update(Snapshot(conns, 0.0))
+    assert len(fired) == 1
+
+    conns[0] = conn("curl", 1, "198.51.100.1", status="CLOSE_WAIT")
+    diff.update(Snapshot(conns, 1.0))
+    assert len(fired) == 1
+    assert engine.host_counts["fanout"]["198.51.100.1"] == 3
+
+
+def test_new_local_port_learns_the_first_tick():
+    diff, engine, fired = make_engine(Rule("new-port", local_ports=parse_port_set("1-1024"), new_local_port=True))
+    diff.update(Snapshot([conn("sshd", 22, "1.1.1.1")], 0.0))
+    diff.update(Snapshot([conn("sshd", 22, "1.1.1.1"), conn("sshd", 22, "2.2.2.2"), conn("nc", 31337, "3.3.3.3")], 1.0))
+    assert fired == []
+    diff.update(Snapshot([conn("nginx", 80, "4.4.4.4")], 2.0))
+    assert [alert["message"] for alert in fired] == ["new local port 80"]
+
+
+def test_cooldown_suppresses_repeats():
+    diff, engine, fired = make_engine(Rule("any-ssh", remote_ports=frozenset({22})))
+    diff.update(Snapshot([conn("ssh", port, "8.8.8.8", 22) for port in range(1, 4)], 0.0))
+    assert len(fired) == 1
+    assert engine.stats() == {"rules": 1, "fired": 1, "suppressed": 2}
+
+
+def test_load_rules(tmp_path):
+    path = tmp_path / "alerts.ini"
+    path.write_text(
+        "[rule:curl-out]\nprocess = curl, wget\nremote = !private\n\n"
+        "[rule:hook]\nstate = SYN_SENT\ncount = 50\nwebhook = http://127.0.0.1:9/hook\n"
+    )
+    rules = load_rules(str(path))
+    assert [rule.name for rule in rules] == ["curl-out", "hook"]
+    assert rules[0].processes == {"curl", "wget"} and rules[0].remote_outside
+    assert rules[1].notify == ("log", "webhook")
+
+    path.write_text("[rule:bad]\nproces = curl\n")
+    with pytest.raises(ValueError, match="proces"):
+        load_rules(str(path))
+    path.write_text("[rule:bad]\nnotify = pager\n")
+    with pytest.raises(ValueError, match="pager"):
+        load_rules(str(path))
@@ -0,0 +1,95 @@
+import asyncio
+import socket
+from types import SimpleNamespace
+
+from connection_monitor import bandwidth
+from connection_monitor.bandwidth import BandwidthTracker, busiest, format_rate, top
+from connection_monitor.collector import Connection, Snapshot
+
+
+def conn(port, counters=None, pid=10, process="curl"):
+    connection = Connection(
+        pid, process, socket.AF_INET, socket.SOCK_STREAM, "10.0.0.2", port, "1.1.1.1", 443, "ESTABLISHED"
+    )
+    connection.counters = counters
+    return connection
+
+
+def test_rates_are_deltas_between_ticks():
+    tracker = BandwidthTracker(process_fallback=False)
+    first = conn(1, (1000, 2000, 10, 20))
+    tracker.apply(Snapshot([first], 10.0))
+    assert (first.tx_rate, first.rx_rate) == (0.0, 0.0)
+
+    second = conn(1, (3000, 2000, 14, 30))
+    tracker.apply(Snapshot([second], 12.0))
+    assert (second.tx_rate, second.rx_rate, second.tx_pps, second.rx_pps) == (1000.0, 0.0, 2.0, 5.0)
+    assert tracker.processes == {10: ("curl", 0.0, 1000.0)}
+
+
+def test_counter_reset_and_slot_reuse():
+    tracker = BandwidthTracker(process_fallback=False)
+    tracker.apply(Snapshot([conn(1, (5000, 5000, 5, 5))], 0.0))
+    reused = conn(1, (100, 100, 1, 1))
+    tracker.apply(Snapshot([reused], 1.0))
+    assert reused.tx_rate == 0.0
+
+    # port 1 closes only once the tick is over, so port 2 takes a new slot...
+    tracker.apply(Snapshot([conn(2, (0, 0, 0, 0))], 2.0))
+    assert tracker.stats() == {"tracked": 1, "free": 1, "processes": 1}
+    # ...and port 3 reuses port 1's
+    tracker.apply(Snapshot([conn(3, (0, 0, 0, 0))], 3.0))
+    assert len(tracker.rates) == 8
+
+
+def test_top_uses_the_busiest():
+    tracker = BandwidthTracker(process_fallback=False)
+    rows = [conn(port, (0, 0, 0, 0), pid=port, process=f"p{port}") for port in range(1, 6)]
+    tracker.apply(Snapshot(rows, 0.0))
+    rows = [conn(port, (port * 100, 0, 0, 0), pid=port, process=f"p{port}") for port in range(1, 6)]
+    tracker.apply(Snapshot(rows, 1.0))
+
+    assert [c.laddr_port for c in top(rows, 2)] == [5, 4]
+    assert [pid for pid, *_ in tracker.top_processes(2)] == [5, 4]
+    summary = busiest(rows, tracker, 1)
+    assert summary["connections"][0]["tx_rate"] == 500
+    assert summary["processes"] == [{"pid": 5, "process": "p5", "rx_rate": 0, "tx_rate": 500}]
+
+
+def test_io_counter_fallback_is_sampled_by_resolve(monkeypatch):
+    chars = iter([(1000, 500), (3000, 700)])
+
+    class Process:
+        def __init__(self, pid):
+            assert pid == 7
+
+        def io_counters(self):
+            read, written = next(chars)
+            return SimpleNamespace(read_chars=read, write_chars=written, read_bytes=0, write_bytes=0)
+
+    monkeypatch.setattr(bandwidth.psutil, "Process", Process)
+    tracker = BandwidthTracker()
+    rows = [conn(1, pid=7, process="wget")]
+
+    # apply never calls psutil itself; it asks for the pid to be sampled
+    assert tracker.apply(Snapshot(rows, 0.0)) == {7}
+    asyncio.run(tracker.resolve({7}))
+    assert tracker.apply(Snapshot(rows, 1.0)) == {7} and tracker.processes == {}
+    asyncio.run(tracker.resolve({7}))
+    tracker.apply(Snapshot(rows, 2.0))
+    # rates come from the samples' own clock, not the snapshots'
+    before, latest = tracker._io[7]
+    elapsed = latest[0] - before[0]
+    assert tracker.processes == {7: ("wget", 2000 / elapsed, 200 / elapsed)}
+
+    # samples of processes no longer seen are dropped
+    tracker.apply(Snapshot([], 3.0))
+    assert tracker._io == {}
+
+
+def test_format_rate():
+    assert format_rate(0) == "0"
+    assert format_rate(512.4) == "512"
+    assert format_rate(1500) == "1.5K"
+    assert format_rate(12_300_000) == "12M"
+    assert format_rate(5e12) == "5000G"
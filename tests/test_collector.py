@@ -0,0 +1,57 @@
+import socket
+from collections import namedtuple
+
+import psutil
+
+from connection_monitor import collector as collector_module
+from connection_monitor.collector import ConnectionCollector, PsutilBackend
+
+addr = namedtuple("addr", ["ip", "port"])
+sconn = namedtuple("sconn", ["fd", "family", "type", "laddr", "raddr", "status", "pid"])
+
+
+def make_conn(pid, status="ESTABLISHED", raddr=None):
+    if raddr is None:
+        raddr = addr("93.184.216.34", 443)
+    return sconn(3, socket.AF_INET, socket.SOCK_STREAM, addr("10.0.0.2", 50000), raddr, status, pid)
+
+
+def test_collect_filters_and_resolves_names(monkeypatch):
+    rows = [make_conn(42), make_conn(None), make_conn(43, status="LISTEN", raddr=()), make_conn(44, status="NONE")]
+    monkeypatch.setattr(psutil, "net_connections", lambda kind: rows)
+    monkeypatch.setattr(ConnectionCollector, "get_process_name", lambda self, pid: f"proc{pid}")
+
+    snapshot = ConnectionCollector().collect()
+
+    assert len(snapshot) == 2
+    assert not snapshot.limited
+    first, second = snapshot.connections
+    assert first.as_dict() == {
+        "process": "proc42",
+        "pid": "42",
+        "local": "10.0.0.2:50000",
+        "remote": "93.184.216.34:443",
+        "status": "ESTABLISHED",
+    }
+    assert second.process == "System"
+    assert second.pid_text == "N/A"
+
+
+def test_collect_falls_back_to_per_process(monkeypatch):
+    def denied(kind):
+        raise psutil.AccessDenied()
+
+    class FakeProc:
+        info = {"pid": 7, "name": "curl", "create_time": 1.0}
+
+        def connections(self, kind):
+            return [make_conn(None)]
+
+    monkeypatch.setattr(psutil, "net_connections", denied)
+    monkeypatch.setattr(psutil, "process_iter", lambda attrs: [FakeProc()])
+
+    snapshot = ConnectionCollector(PsutilBackend()).collect()
+
+    assert snapshot.limited
+    assert [(c.pid, c.process) for c in snapshot] == [(7, "curl")]
+    assert collector_module.is_reportable("ESTABLISHED", ("1.1.1.1", 53))
@@ -0,0 +1,49 @@
+import io
+
+from connection_monitor.console_render import CLEAR_SCREEN, ScreenRenderer
+
+
+class CountingStream(io.StringIO):
+    writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+
+def test_first_frame_clears_and_later_frames_only_send_changes():
+    stream = CountingStream()
+    renderer = ScreenRenderer(stream)
+
+    renderer.render(["header", "row 1", "row 2"])
+    first = stream.getvalue()
+    assert first.startswith(CLEAR_SCREEN)
+    assert "row 2" in first
+
+    stream.seek(0)
+    stream.truncate()
+    renderer.render(["header", "row 1", "row 2 changed"])
+    second = stream.getvalue()
+    assert CLEAR_SCREEN not in second
+    assert "header" not in second
+    assert "\x1b[3;1Hrow 2 changed" in second
+    assert stream.writes == 2
+
+
+def test_invalidate_forces_full_repaint():
+    stream = io.StringIO()
+    renderer = ScreenRenderer(stream)
+    renderer.render(["a"])
+    renderer.invalidate()
+    renderer.render(["a"])
+    assert stream.getvalue().count(CLEAR_SCREEN) == 2
+
+
+def test_lines_are_clipped_to_the_width_and_a_resize_repaints():
+    stream = io.StringIO()
+    renderer = ScreenRenderer(stream, width=10)
+    renderer.render(["x" * 30, "short"])
+    assert "x" * 10 + "\x1b[K" in stream.getvalue() and "x" * 11 not in stream.getvalue()
+    renderer.width = 20
+    renderer.render(["x" * 30, "short"])
+    assert stream.getvalue().count(CLEAR_SCREEN) == 2
@@ -0,0 +1,131 @@
+import json
+import socket
+from urllib.request import urlopen
+
+import pytest
+
+from connection_monitor.collector import Connection
+from connection_monitor.daemon import Daemon, load_config
+
+
+class StubBackend:
+    name = "stub"
+
+    def __init__(self, batches, on_collect=None):
+        self.batches = list(batches)
+        self.on_collect = on_collect
+        self.calls = 0
+
+    def collect(self):
+        self.calls += 1
+        rows = self.batches.pop(0) if len(self.batches) > 1 else self.batches[0]
+        if self.on_collect is not None:
+            self.on_collect()
+        return rows, False
+
+
+def conn(port):
+    return Connection(10, "curl", socket.AF_INET, socket.SOCK_STREAM, "10.0.0.2", port, "1.1.1.1", 443, "ESTABLISHED")
+
+
+def write_config(path, **options):
+    path.write_text("[daemon]\n" + "".join(f"{key} = {value}\n" for key, value in options.items()))
+    return str(path)
+
+
+def test_load_config_defaults_file_and_overrides(tmp_path):
+    path = write_config(tmp_path / "monitor.ini", interval="5", cpu_budget="0.1", api_port="9110")
+    config = load_config(path, {"interval": 1.0, "backend": None})
+    assert config["interval"] == 1.0
+    assert config["cpu_budget"] == 0.1
+    assert config["api_port"] == 9110
+    assert config["backend"] == "auto"
+    assert load_config(None)["history"] is None
+
+
+def test_load_config_rejects_unknown_options(tmp_path):
+    with pytest.raises(ValueError, match="intervall"):
+        load_config(write_config(tmp_path / "monitor.ini", intervall="5"))
+
+
+def test_run_records_history_and_stops_with_a_final_flush(tmp_path):
+    backend = StubBackend([[conn(1)], [conn(1), conn(2)]])
+    daemon = Daemon(overrides={"backend": backend, "history": str(tmp_path / "history.db"), "interval": 0.01})
+    store = daemon.history
+    # the tick in progress still completes after SIGTERM
+    backend.on_collect = lambda: daemon.request_stop() if backend.calls == 2 else None
+    daemon.run()
+
+    assert daemon.history is None
+    assert [e["local_port"] for e in store.query(0, float("inf"))] == [1, 2]
+
+
+def test_reload_applies_the_new_config(tmp_path):
+    backend = StubBackend([[conn(1)]])
+    path = tmp_path / "monitor.ini"
+    write_config(path, interval="0.01")
+    daemon = Daemon(str(path), {"backend": backend})
+    assert daemon.history is None
+
+    reloads = []
+
+    def reload_once():
+        if not reloads:
+            write_config(path, interval="0.01", history=tmp_path / "history.db")
+            reloads.append(1)
+            daemon.request_reload()
+        else:
+            daemon.request_stop()
+
+    backend.on_collect = reload_once
+    daemon.run()
+
+    assert daemon.config["history"] == str(tmp_path / "history.db")
+    assert (tmp_path / "history.db").exists()
+
+
+def test_bad_config_on_reload_keeps_running_config(tmp_path):
+    path = tmp_path / "monitor.ini"
+    write_config(path, interval="3")
+    daemon = Daemon(str(path), {"backend": StubBackend([[]])})
+    path.write_text("[daemon]\ninterval = fast\n")
+    daemon.reload()
+    assert daemon.config["interval"] == 3.0
+
+
+def test_api_serves_connections_and_health():
+    daemon = Daemon(overrides={"backend": StubBackend([[conn(1), conn(2)]]), "api_port": 0})
+    try:
+        daemon.tick()
+        host, port = daemon.api.server_address[:2]
+        with urlopen(f"http://{host}:{port}/api/connections") as response:
+            body = json.load(response)
+        assert body["total"] == 2
+        assert {row["local"] for row in body["connections"]} == {"10.0.0.2:1", "10.0.0.2:2"}
+        with urlopen(f"http://{host}:{port}/healthz") as response:
+            assert json.load(response)["connections"] == 2
+    finally:
+        daemon.shutdown()
+
+
+def test_failed_reload_changes_nothing_and_closes_what_it_built(tmp_path):
+    path = tmp_path / "monitor.ini"
+    write_config(path, interval="3")
+    daemon = Daemon(str(path), {"backend": StubBackend([[]])})
+    listeners = daemon.diff.listeners
+    # the history store is built before the missing rules file fails
+    write_config(path, interval="1", history=tmp_path / "history.db", alerts=tmp_path / "missing.ini")
+    daemon.reload()
+    assert daemon.config["interval"] == 3.0
+    assert daemon.history is None
+    assert daemon.diff.listeners is listeners
+    daemon.shutdown()
+
+
+def test_apply_closes_replaced_enrichers():
+    daemon = Daemon(overrides={"backend": StubBackend([[]]), "resolve": True})
+    resolver = daemon.enrichment.enrichers[-1]
+    daemon.apply({**daemon.config, "resolve": False})
+    assert resolver not in daemon.enrichment.enrichers
+    assert resolver.executor._shutdown
+    daemon.shutdown()
@@ -0,0 +1,53 @@
+import socket
+
+from connection_monitor.collector import Connection, Snapshot
+from connection_monitor.diff import DiffEngine
+
+
+def conn(port, status="ESTABLISHED", pid=10):
+    return Connection(pid, "curl", socket.AF_INET, socket.SOCK_STREAM, "10.0.0.2", port, "1.1.1.1", 443, status)
+
+
+def test_first_update_opens_everything():
+    delta = DiffEngine().update(Snapshot([conn(1), conn(2)], 0.0))
+    assert len(delta.opened) == 2
+    assert not delta.closed
+    assert not delta.changed
+
+
+def test_opened_closed_changed():
+    engine = DiffEngine()
+    engine.update(Snapshot([conn(1), conn(2), conn(3)], 0.0))
+
+    delta = engine.update(Snapshot([conn(2, "CLOSE_WAIT"), conn(3), conn(4)], 1.0))
+
+    assert [c.laddr_port for c in delta.opened] == [4]
+    assert [c.laddr_port for c in delta.closed] == [1]
+    assert [(old.status, new.status) for old, new in delta.changed] == [("ESTABLISHED", "CLOSE_WAIT")]
+    assert delta.churn == 3
+
+
+def test_pid_is_part_of_the_key():
+    engine = DiffEngine()
+    engine.update(Snapshot([conn(1, pid=10)], 0.0))
+    delta = engine.update(Snapshot([conn(1, pid=11)], 1.0))
+    assert len(delta.opened) == 1
+    assert len(delta.closed) == 1
+    assert not engine.update(Snapshot([conn(1, pid=11)], 2.0))
+
+
+def test_initial_delta_after_reset():
+    engine = DiffEngine()
+    assert engine.update(Snapshot([conn(1)], 0.0)).initial
+    assert not engine.update(Snapshot([conn(1)], 1.0)).initial
+    engine.reset()
+    assert engine.update(Snapshot([conn(1)], 2.0)).initial
+
+
+def test_late_process_name_is_a_change():
+    engine = DiffEngine()
+    pending = conn(1)
+    pending.process = "(resolving)"
+    engine.update(Snapshot([pending], 0.0))
+    delta = engine.update(Snapshot([conn(1)], 1.0))
+    assert [(old.process, new.process) for old, new in delta.changed] == [("(resolving)", "curl")]
@@ -0,0 +1,72 @@
+import csv
+import gzip
+import json
+import socket
+
+import pytest
+
+from connection_monitor.collector import Connection, Snapshot
+from connection_monitor.diff import DiffEngine
+from connection_monitor.export import COLUMNS, Exporter, parse_rotation, split_suffixes
+
+
+def conn(port, status="ESTABLISHED"):
+    return Connection(10, "curl", socket.AF_INET, socket.SOCK_STREAM, "10.0.0.2", port, "1.1.1.1", 443, status)
+
+
+def export(exporter):
+    engine = DiffEngine()
+    engine.listeners.append(exporter.record)
+    engine.update(Snapshot([conn(1), conn(2)], 100.0))
+    engine.update(Snapshot([conn(1, "CLOSE_WAIT")], 110.0))
+    exporter.close()
+
+
+def test_ndjson_gzip_events_and_first_snapshot(tmp_path):
+    exporter = Exporter(str(tmp_path / "out.ndjson.gz"))
+    export(exporter)
+    assert exporter.compression == "gzip" and exporter.files == 1
+    assert exporter.path.endswith(".ndjson.gz")
+    with gzip.open(exporter.path, "rt") as f:
+        rows = [json.loads(line) for line in f]
+    assert [(r["ts"], r["kind"], r["local_port"]) for r in rows] == [
+        (100.0, "opened", 1),
+        (100.0, "opened", 2),
+        (100.0, "snapshot", 1),
+        (100.0, "snapshot", 2),
+        (110.0, "closed", 2),
+        (110.0, "changed", 1),
+    ]
+    assert exporter.stats()["written"] == 6
+
+
+def test_csv_rotates_by_size(tmp_path):
+    exporter = Exporter(str(tmp_path / "out.csv"), max_bytes=1, snapshot_every=None)
+    export(exporter)
+    assert exporter.files == 2
+    assert len(list(tmp_path.iterdir())) == 2
+    with open(exporter.path, newline="") as f:
+        header, *rows = list(csv.reader(f))
+    assert tuple(header) == COLUMNS
+    assert [row[1] for row in rows] == ["closed", "changed"]
+
+
+def test_parquet(tmp_path):
+    pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    exporter = Exporter(str(tmp_path / "out.parquet"), compression="zstd")
+    export(exporter)
+    table = pyarrow.parquet.read_table(exporter.path)
+    assert table.column("kind").to_pylist() == ["opened", "opened", "snapshot", "snapshot", "closed", "changed"]
+
+
+def test_options():
+    assert parse_rotation("100MB, 1h") == (100_000_000, 3600.0)
+    assert parse_rotation("512kb") == (512_000, None)
+    assert parse_rotation(None) == (None, None)
+    with pytest.raises(ValueError):
+        parse_rotation("100 lightyears")
+    assert split_suffixes("out/my.data.csv.gz") == ("out/my.data", ".csv.gz")
+    with pytest.raises(ValueError):
+        Exporter("out.xml", format="xml")
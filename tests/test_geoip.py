@@ -0,0 +1,93 @@
+import socket
+
+import pytest
+
+from connection_monitor.collector import Connection, Snapshot
+from connection_monitor.geoip import GeoEnricher, GeoInfo, RangeTable, compile_ranges, open_table
+
+RANGES = """range_start\trange_end\tAS_number\tcountry_code\tAS_description
+1.0.0.0\t1.0.0.255\t13335\tUS\tCLOUDFLARENET
+1.0.4.0\t1.0.7.255\t38803\tAU\tWPL-AS-AP Wirefreebroadband Pty Ltd
+8.8.8.0\t8.8.8.255\t15169\tUS\tGOOGLE
+9.9.9.0\t9.9.9.255\t19281\tNone\tQUAD9-AS-1
+10.0.0.0\t10.255.255.255\t0\tNone\tNot routed
+2001:4860::\t2001:4860:ffff:ffff:ffff:ffff:ffff:ffff\t15169\tUS\tGOOGLE
+"""
+
+
+@pytest.fixture()
+def table(tmp_path):
+    source = tmp_path / "ip2asn.tsv"
+    source.write_text(RANGES)
+    assert compile_ranges(str(source), str(tmp_path / "ip2asn.cmgeo")) == 5
+    table = RangeTable(str(tmp_path / "ip2asn.cmgeo"))
+    yield table
+    table.close()
+
+
+def info(found):
+    return (found.country, found.asn, found.as_org) if found else None
+
+
+def test_range_lookup(table):
+    assert info(table.lookup("1.0.0.1")) == ("US", 13335, "CLOUDFLARENET")
+    assert info(table.lookup("1.0.0.255")) == ("US", 13335, "CLOUDFLARENET")
+    assert info(table.lookup("1.0.4.0")) == ("AU", 38803, "WPL-AS-AP Wirefreebroadband Pty Ltd")
+    assert info(table.lookup("8.8.8.8")) == ("US", 15169, "GOOGLE")
+    assert info(table.lookup("2001:4860:4860::8888")) == ("US", 15169, "GOOGLE")
+    assert info(table.lookup("::ffff:8.8.8.8")) == ("US", 15169, "GOOGLE")
+    assert info(table.lookup("9.9.9.9")) == ("", 19281, "QUAD9-AS-1")  # ASN only, no country
+
+
+def test_addresses_outside_every_range(table):
+    assert table.lookup("0.255.255.255") is None  # before the first range
+    assert table.lookup("1.0.1.0") is None  # in a gap
+    assert table.lookup("11.0.0.1") is None  # after the last range
+    assert table.lookup("10.1.2.3") is None  # unrouted ranges are not compiled
+    assert table.lookup("2606:4700::1111") is None
+    assert table.lookup("not-an-ip") is None
+
+
+def test_open_table_compiles_csv_once(tmp_path):
+    source = tmp_path / "ip2asn.csv"
+    source.write_text(RANGES.replace("\t", ","))
+    first = open_table(str(source))
+    assert info(first.lookup("8.8.4.4")) is None
+    assert info(first.lookup("8.8.8.4")) == ("US", 15169, "GOOGLE")
+    compiled = tmp_path / "ip2asn.csv.cmgeo"
+    mtime = compiled.stat().st_mtime_ns
+    open_table(str(source)).close()
+    assert compiled.stat().st_mtime_ns == mtime
+    first.close()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "random.bin"
+    path.write_bytes(b"\x00" * 64)
+    with pytest.raises(ValueError):
+        RangeTable(str(path))
+
+
+class CountryTable:
+    def __init__(self):
+        self.lookups = 0
+
+    def lookup(self, ip):
+        self.lookups += 1
+        return GeoInfo("NL") if ip.startswith("1.") else None
+
+
+def test_enricher_merges_tables_and_caches_per_ip(table):
+    countries = CountryTable()
+    enricher = GeoEnricher([countries, table])
+    connections = [
+        Connection(10, "curl", socket.AF_INET, socket.SOCK_STREAM, "10.0.0.2", port, "1.0.0.1", 443, "ESTABLISHED")
+        for port in range(1, 101)
+    ]
+    assert enricher.apply(Snapshot(connections, 0.0)) == set()
+
+    conn = connections[0]
+    assert (conn.country, conn.asn_text, conn.as_org) == ("NL", "AS13335", "CLOUDFLARENET")
+    assert conn.as_row()["asn"] == 13335
+    assert countries.lookups == 1
+    assert enricher.stats()["hits"] == 99
@@ -0,0 +1,71 @@
+import socket
+
+import pytest
+
+from connection_monitor.collector import Connection, Snapshot
+from connection_monitor.diff import DiffEngine
+from connection_monitor.groups import GroupCounts, parse_dimensions
+from connection_monitor.query import ConnectionIndex, network_of, parse_query
+
+
+def conn(process, lport, rip, rport=443, status="ESTABLISHED"):
+    return Connection(1, process, socket.AF_INET, socket.SOCK_STREAM, "10.0.0.2", lport, rip, rport, status)
+
+
+def test_counts_follow_deltas():
+    diff = DiffEngine()
+    groups = GroupCounts(["process", "state"])
+    diff.listeners.append(groups.record)
+
+    diff.update(Snapshot([conn("curl", 1, "1.1.1.1"), conn("curl", 2, "1.1.1.1"), conn("ssh", 3, "8.8.8.8")], 0.0))
+    assert groups.top(5) == [(("curl", "ESTABLISHED"), 2), (("ssh", "ESTABLISHED"), 1)]
+
+    # one closes, one changes state, one opens
+    diff.update(Snapshot([conn("curl", 1, "1.1.1.1", status="TIME_WAIT"), conn("git", 4, "8.8.4.4")], 1.0))
+    assert dict(groups.counts) == {("curl", "TIME_WAIT"): 1, ("git", "ESTABLISHED"): 1}
+    assert set(groups.members) == set(groups.counts)
+
+    # a restarted diff starts the counts over
+    diff.reset()
+    diff.update(Snapshot([conn("ssh", 3, "8.8.8.8")], 2.0))
+    assert dict(groups.counts) == {("ssh", "ESTABLISHED"): 1}
+
+
+def test_seeded_snapshot_is_not_counted_twice():
+    diff = DiffEngine()
+    delta = diff.update(Snapshot([conn("curl", 1, "1.1.1.1")], 0.0))
+    groups = GroupCounts(["process"])
+    groups.reset(delta.snapshot, delta.snapshot)
+    groups.record(delta)
+    assert groups.counts[("curl",)] == 1
+
+
+def test_members_and_drill_down_query():
+    rows = [conn("curl", 1, "203.0.113.7"), conn("curl", 2, "203.0.113.9", 80), conn("ssh", 3, "198.51.100.4", 22)]
+    groups = GroupCounts(["process", "network", "port"])
+    groups.reset(rows)
+    group = ("curl", "203.0.113.0/24", 443)
+    assert groups.member_keys(group) == {rows[0].key}
+
+    args = groups.query_args(group)
+    assert args == {"process": "curl", "cidr": "203.0.113.0/24", "rport": "443"}
+    page = ConnectionIndex(rows).search(parse_query(args))
+    assert [row["local"] for row in page["connections"]] == ["10.0.0.2:1"]
+
+    # a single remote host is narrower than its network, whichever comes first
+    assert GroupCounts(["remote", "network"]).query_args(("1.1.1.1", "1.1.1.0/24")) == {"cidr": "1.1.1.1"}
+
+    body = groups.rows(1)
+    assert body["groups"] == 3 and len(body["rows"]) == 1
+
+
+def test_dimensions():
+    assert parse_dimensions("Process, state") == ("process", "state")
+    assert network_of("10.1.2.3", 8) == "10.0.0.0/8"
+    assert network_of("::ffff:10.1.2.3") == "10.1.2.0/24"
+    assert network_of("2001:db8:1:2::1") == "2001:db8:1::/48"
+    assert network_of("") == "none" and network_of("bogus") == "invalid"
+    assert GroupCounts(["network/16"]).group_of(conn("curl", 1, "172.16.5.4")) == ("172.16.0.0/16",)
+    for bad in ("", "colour", "network/40", "network/x"):
+        with pytest.raises(ValueError):
+            parse_dimensions(bad)
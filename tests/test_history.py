@@ -0,0 +1,169 @@
+import socket
+
+from connection_monitor.collector import Connection, Snapshot
+from connection_monitor.diff import DiffEngine
+from connection_monitor.history import HistoryStore, open_history, query_args
+
+
+def conn(port, remote="1.1.1.1", status="ESTABLISHED", pid=10, process="curl"):
+    return Connection(pid, process, socket.AF_INET, socket.SOCK_STREAM, "10.0.0.2", port, remote, 443, status)
+
+
+def make_store(tmp_path, **kwargs):
+    return HistoryStore(str(tmp_path / "history.db"), **kwargs)
+
+
+def test_events_are_recorded_from_deltas(tmp_path):
+    store = make_store(tmp_path)
+    engine = DiffEngine()
+    engine.listeners.append(store.record)
+    engine.update(Snapshot([conn(1), conn(2, "10.0.0.5", pid=20, process="ssh")], 100.0))
+    engine.update(Snapshot([conn(1, status="CLOSE_WAIT")], 110.0))
+    store.flush()
+
+    events = store.query(0, 200)
+    assert [(e["ts"], e["kind"], e["local_port"]) for e in events] == [
+        (100.0, "opened", 1),
+        (100.0, "opened", 2),
+        (110.0, "closed", 2),
+        (110.0, "changed", 1),
+    ]
+    assert events[-1]["status"] == "CLOSE_WAIT"
+    assert [e["local_port"] for e in store.query(0, 200, kind="opened", process="ssh")] == [2]
+    # still open when the window starts, then closed in it
+    assert [e["kind"] for e in store.query(105, 200, remote_ip="10.0.0.5")] == ["open", "closed"]
+    store.close()
+
+
+def test_talkers(tmp_path):
+    store = make_store(tmp_path)
+    engine = DiffEngine()
+    engine.listeners.append(store.record)
+    engine.update(Snapshot([conn(1, "10.0.0.5"), conn(2, "10.0.0.5", pid=20, process="ssh")], 100.0))
+    engine.update(Snapshot([], 150.0))
+    store.flush()
+
+    talkers = store.talkers("10.0.0.5", 0, 200)
+    assert [(t["process"], t["connections"], t["first_seen"], t["last_seen"]) for t in talkers] == [
+        ("curl", 1, 100.0, 150.0),
+        ("ssh", 1, 100.0, 150.0),
+    ]
+    # open during the window without an event in it
+    assert [t["process"] for t in store.talkers("10.0.0.5", 120, 140)] == ["curl", "ssh"]
+    assert store.talkers("10.0.0.5", 151, 200) == []
+    assert store.talkers("8.8.8.8", 0, 200) == []
+    store.close()
+
+
+def test_connections_spanning_the_window(tmp_path):
+    store = make_store(tmp_path)
+    engine = DiffEngine()
+    engine.listeners.append(store.record)
+    engine.update(Snapshot([conn(1, "10.0.0.5", process=None), conn(2)], 100.0))
+    # the process name arrives late; the connection stays open past the window
+    engine.update(Snapshot([conn(1, "10.0.0.5"), conn(2)], 105.0))
+    engine.update(Snapshot([conn(1, "10.0.0.5"), conn(3)], 200.0))
+    store.flush()
+
+    events = store.query(120, 180, remote_ip="10.0.0.5")
+    assert [(e["ts"], e["kind"], e["process"], e["local_port"]) for e in events] == [(100.0, "open", "curl", 1)]
+    assert [(e["kind"], e["local_port"]) for e in store.query(120, 250)] == [
+        ("open", 1),
+        ("open", 2),
+        ("opened", 3),
+        ("closed", 2),
+    ]
+    assert [e["kind"] for e in store.query(120, 250, kind="closed")] == ["closed"]
+    talkers = store.talkers("10.0.0.5", 120, 180)
+    assert [(t["process"], t["first_seen"], t["last_seen"]) for t in talkers] == [("curl", 100.0, None)]
+    store.close()
+
+
+def test_restarted_diff_closes_open_connections(tmp_path):
+    store = make_store(tmp_path)
+    engine = DiffEngine()
+    engine.listeners.append(store.record)
+    engine.update(Snapshot([conn(1), conn(2)], 100.0))
+    engine.update(Snapshot([conn(1), conn(2)], 110.0))
+    engine.reset()
+    engine.update(Snapshot([conn(1)], 300.0))
+    store.flush()
+
+    # connections reported again after the restart are new intervals; the old ones ended when last seen
+    assert [(e["ts"], e["local_port"]) for e in store.query(200, 400, kind="open")] == []
+    assert [(e["ts"], e["local_port"]) for e in store.query(105, 400, kind="open")] == [(100.0, 1), (100.0, 2)]
+    assert [t["last_seen"] for t in store.talkers("1.1.1.1", 0, 400)] == [None]
+    store.close()
+
+
+def test_snapshots_are_periodic(tmp_path):
+    store = make_store(tmp_path, snapshot_every=60)
+    engine = DiffEngine()
+    engine.listeners.append(store.record)
+    for ts in (100.0, 130.0, 170.0):
+        engine.update(Snapshot([conn(1)], ts, limited=True))
+    store.flush()
+
+    assert store.snapshots(0, 200) == [
+        {"ts": 100.0, "total": 1, "limited": True},
+        {"ts": 170.0, "total": 1, "limited": True},
+    ]
+    store.close()
+
+
+def test_compact_applies_retention(tmp_path):
+    store = make_store(tmp_path, retention=50)
+    engine = DiffEngine()
+    engine.listeners.append(store.record)
+    engine.update(Snapshot([conn(1)], 100.0))
+    engine.update(Snapshot([conn(2)], 200.0))
+    store.flush()
+
+    # the opened event and the snapshot row from t=100
+    assert store.compact(now=220.0) == 2
+    assert [(e["kind"], e["local_port"]) for e in store.query(0, 300)] == [("opened", 2), ("closed", 1)]
+    store.close()
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    store = make_store(tmp_path, max_pending=1, flush_interval=60)
+    # hold the writer so the queue cannot drain
+    with store._lock:
+        store.record(DiffEngine().update(Snapshot([conn(port) for port in range(1, 50)], 100.0)))
+        assert store.dropped > 0
+    store.close()
+
+
+def test_query_args_clamp_the_limit():
+    assert query_args({"end": "100"}) == {
+        "start": -3500.0,
+        "end": 100.0,
+        "remote_ip": None,
+        "remote_port": None,
+        "process": None,
+        "kind": None,
+        "limit": 1000,
+    }
+    assert query_args({"limit": "0"})["limit"] == 1
+    assert query_args({"limit": "-5"})["limit"] == 1
+    assert query_args({"limit": "99999"}, max_limit=500)["limit"] == 500
+
+
+def test_open_history(tmp_path):
+    assert open_history(None) is None
+    for days, retention in ((None, 30 * 86400), (2, 2 * 86400), (0, None)):
+        store = open_history(str(tmp_path / f"{days}.db"), days)
+        assert store.retention == retention
+        store.close()
+
+
+def test_close_leaves_a_busy_writer_its_connection(tmp_path):
+    store = make_store(tmp_path)
+    # hold the writer inside a commit so it cannot finish
+    with store._lock:
+        store.record(DiffEngine().update(Snapshot([conn(1)], 100.0)))
+        store.close(timeout=0.2)
+        assert store._writer.is_alive()
+        store._conn.execute("SELECT 1")  # still open
+    store._writer.join(5)
+    assert not store._writer.is_alive()
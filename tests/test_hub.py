@@ -0,0 +1,96 @@
+import socket
+
+from connection_monitor.collector import Connection, Snapshot
+from connection_monitor.hub import CollectorHub
+from connection_monitor.query import parse_query
+
+
+class FakeCollector:
+    def __init__(self):
+        self.connections = []
+
+    def collect(self):
+        return Snapshot(list(self.connections), 0.0)
+
+
+def conn(process, port):
+    return Connection(1, process, socket.AF_INET, socket.SOCK_STREAM, "10.0.0.2", port, "1.1.1.1", 443, "ESTABLISHED")
+
+
+def make_hub():
+    events = []
+    rooms = {}
+    hub = CollectorHub(
+        FakeCollector(),
+        lambda event, data, to: events.append((event, data, to)),
+        lambda sid, room: rooms.setdefault(room, set()).add(sid),
+        lambda sid, room: rooms.get(room, set()).discard(sid),
+        max_lag=2,
+    )
+    # drive ticks by hand instead of from the scheduler thread
+    hub._ensure_running = lambda: None
+    return hub, events, rooms
+
+
+def test_identical_subscriptions_share_a_channel():
+    hub, events, rooms = make_hub()
+    hub.collector.connections = [conn("nginx", 1), conn("curl", 2)]
+    first = hub.subscribe("a", filter_text="nginx", rate=0)
+    second = hub.subscribe("b", filter_text="NGINX ", rate=0)
+    other = hub.subscribe("c", rate=0)
+    assert first is second
+    assert first is not other
+
+    hub.tick()
+    snapshots = [(data["total"], to) for event, data, to in events if event == "connections_snapshot"]
+    assert snapshots == [(1, first.room), (2, other.room)]
+    assert rooms[first.room] == {"a", "b"}
+
+
+def test_slow_client_is_paused_then_resynced():
+    hub, events, rooms = make_hub()
+    channel = hub.subscribe("slow", rate=0)
+    hub.tick()
+    for _ in range(3):
+        hub.tick()
+    assert "slow" not in rooms[channel.room]
+    assert hub.dropped == 1
+
+    events.clear()
+    hub.ack("slow", channel.id, channel.version)
+    assert "slow" in rooms[channel.room]
+    assert [(event, to) for event, _, to in events] == [("connections_snapshot", "slow")]
+
+
+def test_last_unsubscribe_removes_channel():
+    hub, _, _ = make_hub()
+    hub.subscribe("a")
+    hub.unsubscribe("a")
+    assert hub.channels == {}
+    assert not hub.running
+
+
+def test_structured_query_channels_and_search():
+    hub, events, rooms = make_hub()
+    hub.collector.connections = [conn("nginx", 1), conn("curl", 2)]
+    first = hub.subscribe("a", rate=0, query=parse_query({"port": "2"}))
+    second = hub.subscribe("b", rate=0, query=parse_query({"port": "2-2"}))
+    assert first is second
+
+    hub.tick()
+    assert [data["total"] for event, data, to in events if event == "connections_snapshot"] == [1]
+    page = hub.search(parse_query({"process": "nginx"}))
+    assert [row["local"] for row in page["connections"]] == ["10.0.0.2:1"]
+
+
+def test_groupings_are_seeded_then_follow_ticks():
+    hub, events, rooms = make_hub()
+    hub.collector.connections = [conn("nginx", 1), conn("curl", 2)]
+    hub.tick()
+    groups = hub.groups(("process",))
+    assert groups.counts == {("nginx",): 1, ("curl",): 1}
+    assert hub.groups(("process",)) is groups
+
+    hub.collector.connections = [conn("nginx", 1), conn("nginx", 3)]
+    hub.tick()
+    assert groups.counts == {("nginx",): 2}
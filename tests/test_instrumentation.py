@@ -0,0 +1,67 @@
+import pstats
+
+import pytest
+from test_procnet import make_proc
+
+from connection_monitor.bandwidth import BandwidthTracker
+from connection_monitor.collector import ConnectionCollector
+from connection_monitor.instrumentation import Instruments, StageTimes, TickProfiler, open_profiler
+from connection_monitor.procnet import ProcNetBackend
+from connection_monitor.scheduler import Scheduler
+
+
+def test_stage_times_keep_pipeline_order_and_average():
+    stages = StageTimes(smoothing=0.5)
+    stages.add("render", 0.004)
+    stages.add("collect", 0.002)
+    stages.add("collect", 0.004)
+    assert stages.as_dict() == {"collect": 4.0, "render": 4.0}
+    assert stages.as_dict(average=True) == {"collect": 3.0, "render": 4.0}
+    with stages.time("diff"):
+        pass
+    assert list(stages.as_dict()) == ["collect", "diff", "render"]
+
+
+def test_instruments_report_scans_caches_and_usage(tmp_path):
+    collector = ConnectionCollector(ProcNetBackend(str(make_proc(tmp_path, {100: [1002, 1003], 200: [2002]}))))
+    instruments = Instruments(collector, [BandwidthTracker()])
+    snapshot = instruments.timed("collect", collector.collect)
+
+    stats = instruments.stats(caches=True)
+    # the fixture tables hold a listening socket besides the five reported connections
+    assert stats["scanned"]["sockets"] > len(snapshot)
+    assert stats["scanned"]["processes"] == 2
+    assert list(stats["stages_ms"]) == ["collect"]
+    assert stats["caches"]["inodes"]["scans"] == 1 and stats["caches"]["inodes"]["walked"] >= 2
+    assert "hit_rate" in stats["caches"]["process"] and "tracked" in stats["caches"]["BandwidthTracker"]
+    assert stats["rss_mb"] > 0
+    summary = instruments.summary()
+    assert summary.startswith("collect ") and "processes scanned" in summary and "RSS" in summary
+
+
+def test_profiler_writes_after_the_last_profiled_tick(tmp_path):
+    path = tmp_path / "ticks.prof"
+    profiler = TickProfiler(str(path), ticks=2)
+    scheduler = Scheduler(interval=0.01, min_interval=0.01, max_interval=0.01, profiler=profiler)
+
+    def tick():
+        sorted(range(1000), key=lambda n: -n)
+        if scheduler.ticks == 3:
+            scheduler.stop()
+
+    scheduler.run(tick)
+    assert not profiler.active and path.exists()
+    functions = {name for _, _, name in pstats.Stats(str(path)).stats}
+    assert "tick" in functions
+
+    # finishing again (e.g. on shutdown) does not rewrite the file
+    path.unlink()
+    profiler.finish()
+    assert not path.exists()
+
+
+def test_open_profiler():
+    assert open_profiler(None) is None
+    assert open_profiler("out.prof", "5").remaining == 5
+    with pytest.raises(ValueError):
+        TickProfiler("out.prof", ticks=0)
@@ -0,0 +1,102 @@
+import socket
+
+from connection_monitor.collector import Connection, Snapshot
+from connection_monitor.diff import DiffEngine
+from connection_monitor.metrics import ConnectionMetrics
+from connection_monitor.scheduler import Scheduler
+
+
+def conn(port, remote="1.1.1.1", status="ESTABLISHED", process="curl", remote_port=443):
+    return Connection(10, process, socket.AF_INET, socket.SOCK_STREAM, "10.0.0.2", port, remote, remote_port, status)
+
+
+def samples(text):
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+
+
+def engine_with_metrics(**kwargs):
+    engine = DiffEngine()
+    metrics = ConnectionMetrics(**kwargs)
+    engine.listeners.append(metrics.record)
+    return engine, metrics
+
+
+def test_counts_follow_deltas():
+    engine, metrics = engine_with_metrics()
+    engine.update(Snapshot([conn(1), conn(2, "1.1.1.9"), conn(3, "2001:db8::1", process="ssh", remote_port=22)], 0.0))
+    engine.update(Snapshot([conn(1, status="CLOSE_WAIT"), conn(3, "2001:db8::1", process="ssh", remote_port=22)], 1.0))
+
+    result = samples(metrics.render())
+    assert result["connection_monitor_connections"] == "2"
+    assert result["connection_monitor_connections_closed_total"] == "1"
+    assert result['connection_monitor_connections_by_state{state="CLOSE_WAIT"}'] == "1"
+    assert result['connection_monitor_connections_by_state{state="ESTABLISHED"}'] == "1"
+    assert result['connection_monitor_connections_by_process{process="ssh"}'] == "1"
+    assert result['connection_monitor_connections_by_remote_port{port="443"}'] == "1"
+    assert result['connection_monitor_connections_by_remote_network{network="1.1.1.0/24"}'] == "1"
+    assert result['connection_monitor_connections_by_remote_network{network="2001:db8::/48"}'] == "1"
+    engine.update(Snapshot([conn(4, "::ffff:1.1.1.7")], 2.0))
+    # IPv4-mapped addresses count towards the IPv4 network, as in the group-by views
+    assert samples(metrics.render())['connection_monitor_connections_by_remote_network{network="1.1.1.0/24"}'] == "1"
+    engine.update(Snapshot([], 3.0))
+    # labels whose count drops to zero disappear
+    assert not any(metrics.counts)
+    assert metrics.total == 0
+
+
+def test_initial_delta_restarts_the_gauges():
+    engine, metrics = engine_with_metrics()
+    engine.update(Snapshot([conn(1), conn(2)], 0.0))
+    engine.reset()
+    engine.update(Snapshot([conn(1), conn(2)], 1.0))
+    result = samples(metrics.render())
+    assert result["connection_monitor_connections"] == "2"
+    assert result["connection_monitor_connections_opened_total"] == "0"
+
+
+def test_cardinality_is_bounded():
+    engine, metrics = engine_with_metrics(max_series=3)
+    engine.update(Snapshot([conn(port, remote_port=port) for port in range(1, 11)], 0.0))
+    result = samples(metrics.render())
+    ports = {key: value for key, value in result.items() if "by_remote_port{" in key}
+    assert len(ports) == 3
+    assert result["connection_monitor_connections_by_remote_port_other"] == "7"
+
+
+def test_folded_series_cannot_clash_with_a_label():
+    engine, metrics = engine_with_metrics(max_series=1)
+    engine.update(Snapshot([conn(1, process="other"), conn(2, process="other"), conn(3, process="sshd")], 0.0))
+    result = samples(metrics.render())
+    assert result['connection_monitor_connections_by_process{process="other"}'] == "2"
+    assert result["connection_monitor_connections_by_process_other"] == "1"
+
+
+def test_collector_stats_and_escaping():
+    engine, metrics = engine_with_metrics()
+    engine.update(Snapshot([conn(1, process='we"ird\\name')], 0.0))
+    scheduler = Scheduler()
+    scheduler.ticks, scheduler.busy = 4, 0.5
+    cache = {"hits": 9, "misses": 1, "evictions": 0, "hit_rate": 0.9}
+    result = samples(metrics.render(scheduler, cache, {"hub": 2}))
+    assert result["connection_monitor_tick_duration_seconds_sum"] == "0.5"
+    assert result["connection_monitor_tick_duration_seconds_count"] == "4"
+    assert result["connection_monitor_process_cache_hit_ratio"] == "0.9"
+    assert result['connection_monitor_dropped_updates_total{source="hub"}'] == "2"
+    assert result['connection_monitor_connections_by_process{process="we\\"ird\\\\name"}'] == "1"
+
+
+def test_stale_gauges_are_left_out():
+    engine, metrics = engine_with_metrics()
+    assert "connection_monitor_last_update_timestamp_seconds" not in samples(metrics.render(max_age=10.0))
+    engine.update(Snapshot([conn(1)], 100.0))
+
+    result = samples(metrics.render(max_age=10.0, now=105.0))
+    assert result["connection_monitor_connections"] == "1"
+    assert result["connection_monitor_last_update_timestamp_seconds"] == "100.0"
+
+    result = samples(metrics.render(max_age=10.0, now=200.0))
+    assert "connection_monitor_connections" not in result
+    assert not any("by_state" in key for key in result)
+    # counters and the update time remain
+    assert result["connection_monitor_connections_opened_total"] == "0"
+    assert result["connection_monitor_last_update_timestamp_seconds"] == "100.0"
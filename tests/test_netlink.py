@@ -0,0 +1,80 @@
+import socket
+import struct
+
+import pytest
+
+from connection_monitor import netlink
+from connection_monitor.netlink import INET_DIAG_MSG, NLMSGHDR, NetlinkBackend, parse_messages
+
+
+def make_message(msg_type, payload=b""):
+    return NLMSGHDR.pack(NLMSGHDR.size + len(payload), msg_type, 0, 1, 0) + payload
+
+
+def make_record(state, sport, dport, src, dst, inode):
+    return INET_DIAG_MSG.pack(
+        socket.AF_INET,
+        state,
+        sport.to_bytes(2, "big"),
+        dport.to_bytes(2, "big"),
+        socket.inet_aton(src).ljust(16, b"\0"),
+        socket.inet_aton(dst).ljust(16, b"\0"),
+        1000,
+        inode,
+    )
+
+
+def test_parse_messages_until_done():
+    data = make_message(netlink.SOCK_DIAG_BY_FAMILY, make_record(1, 50000, 443, "10.0.0.2", "1.1.1.1", 77))
+    records, done = parse_messages(data)
+    assert not done
+    assert records[0][1] == 1
+    assert records[0][7] == 77
+
+    records, done = parse_messages(make_message(netlink.NLMSG_DONE, b"\0" * 4))
+    assert done
+    assert records == []
+
+
+def test_parse_messages_raises_on_error():
+    with pytest.raises(OSError):
+        parse_messages(make_message(netlink.NLMSG_ERROR, (-1).to_bytes(4, "little", signed=True)))
+
+
+def test_collect_skips_listen_and_falls_back(monkeypatch):
+    backend = NetlinkBackend()
+    records = {
+        socket.AF_INET: [
+            INET_DIAG_MSG.unpack(make_record(1, 50000, 443, "10.0.0.2", "1.1.1.1", 0)),
+            INET_DIAG_MSG.unpack(make_record(10, 22, 0, "0.0.0.0", "0.0.0.0", 0)),
+        ],
+        socket.AF_INET6: [],
+    }
+    monkeypatch.setattr(backend, "dump", lambda family: records[family])
+    connections, _ = backend.collect()
+    assert [(c.local, c.remote, c.status) for c in connections] == [("10.0.0.2:50000", "1.1.1.1:443", "ESTABLISHED")]
+
+    def refused(family):
+        raise PermissionError
+
+    monkeypatch.setattr(backend, "dump", refused)
+    monkeypatch.setattr(backend.fallback, "collect", lambda: ([], True))
+    assert backend.collect() == ([], True)
+    assert backend.failed
+
+
+def test_parse_messages_reads_tcp_info_counters():
+    info = bytes(120) + struct.pack("=QQII", 5000, 7000, 12, 15)
+    attribute = netlink.RTATTR.pack(netlink.RTATTR.size + len(info), netlink.INET_DIAG_INFO) + info
+    payload = make_record(1, 50000, 443, "10.0.0.2", "1.1.1.1", 77) + attribute
+    records, _ = parse_messages(make_message(netlink.SOCK_DIAG_BY_FAMILY, payload))
+    assert records[0][7] == 77
+    assert records[0][8:] == (5000, 7000, 12, 15)
+
+
+def test_collect_sets_counters(monkeypatch):
+    backend = NetlinkBackend()
+    record = INET_DIAG_MSG.unpack(make_record(1, 50000, 443, "10.0.0.2", "1.1.1.1", 0)) + (5000, 7000, 12, 15)
+    monkeypatch.setattr(backend, "dump", lambda family: [record] if family == socket.AF_INET else [])
+    connections, _ = backend.collect()
+    assert connections[0].counters == (5000, 7000, 12, 15)
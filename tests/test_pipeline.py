@@ -0,0 +1,105 @@
+import asyncio
+import socket
+import time
+
+from connection_monitor.collector import Connection, Snapshot
+from connection_monitor.diff import DiffEngine
+from connection_monitor.pipeline import Pipeline, ProcessEnricher, offer
+from connection_monitor.process_cache import ProcessInfo
+from connection_monitor.scheduler import Scheduler
+
+
+class FakeCollector:
+    def collect(self):
+        return Snapshot(
+            [
+                Connection(
+                    pid, None, socket.AF_INET, socket.SOCK_STREAM, "10.0.0.2", pid, "1.1.1.1", 443, "ESTABLISHED"
+                )
+                for pid in (7, 8)
+            ],
+            time.time(),
+        )
+
+
+class SlowEnricher:
+    """Names every pid after a delay, counting how often each is looked up."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.names = {}
+        self.lookups = []
+
+    def apply(self, snapshot):
+        missing = set()
+        for conn in snapshot:
+            conn.process = self.names.get(conn.pid, "(resolving)")
+            if conn.pid not in self.names:
+                missing.add(conn.pid)
+        return missing
+
+    async def resolve(self, keys):
+        self.lookups.extend(keys)
+        await asyncio.sleep(self.delay)
+        self.names.update((pid, f"proc{pid}") for pid in keys)
+
+
+def run_pipeline(enricher, until):
+    emitted = []
+    scheduler = Scheduler(interval=0.02, min_interval=0.02, max_interval=0.02, adaptive=False)
+
+    def emit(snapshot):
+        emitted.append((time.monotonic(), sorted(conn.process for conn in snapshot)))
+        if until(emitted):
+            scheduler.stop()
+
+    diff = DiffEngine()
+    pipeline = Pipeline(FakeCollector(), diff, emit, [enricher], scheduler)
+    started = time.monotonic()
+    asyncio.run(asyncio.wait_for(pipeline.run(), 5))
+    return started, emitted, diff
+
+
+def test_offer_drops_the_oldest_item():
+    async def check():
+        queue = asyncio.Queue(1)
+        assert not offer(queue, 1)
+        assert offer(queue, 2)
+        return queue.get_nowait()
+
+    assert asyncio.run(check()) == 2
+
+
+def test_slow_enrichment_does_not_delay_snapshots():
+    enricher = SlowEnricher(delay=0.3)
+    started, emitted, diff = run_pipeline(enricher, lambda emitted: emitted[-1][1] == ["proc7", "proc8"])
+
+    first_at, first_names = emitted[0]
+    assert first_names == ["(resolving)", "(resolving)"]
+    assert first_at - started < 0.25
+    # several ticks went by while the lookup was outstanding, but each pid was looked up once
+    assert len(emitted) > 3
+    assert sorted(enricher.lookups) == [7, 8]
+    assert sorted(conn.process for conn in diff.current.values()) == ["proc7", "proc8"]
+
+
+def test_process_enricher_uses_the_cache_and_negative_caches_failures():
+    class Cache:
+        def __init__(self):
+            self.entries = {7: ProcessInfo(7, 1.0, "nginx")}
+
+        def peek(self, pid):
+            return self.entries.get(pid)
+
+        def lookup(self, pid):
+            return None
+
+    enricher = ProcessEnricher(Cache())
+    snapshot = FakeCollector().collect()
+    assert enricher.apply(snapshot) == {8}
+    assert [conn.process for conn in snapshot] == ["nginx", None]
+
+    asyncio.run(enricher.resolve({8}))
+    snapshot = FakeCollector().collect()
+    assert enricher.apply(snapshot) == set()
+    assert [conn.process for conn in snapshot] == ["nginx", "Unknown"]
@@ -0,0 +1,69 @@
+import psutil
+
+from connection_monitor.process_cache import ProcessCache
+
+
+class FakeProcess:
+    create_times = {}
+    loads = 0
+
+    def __init__(self, pid):
+        if pid not in self.create_times:
+            raise psutil.NoSuchProcess(pid)
+        self.pid = pid
+
+    def create_time(self):
+        return self.create_times[self.pid]
+
+    def as_dict(self, attrs, ad_value):
+        FakeProcess.loads += 1
+        return {"name": f"proc{self.pid}-{self.create_time()}", "exe": "/bin/x", "cmdline": ["x"], "username": "root"}
+
+
+def setup_fake(monkeypatch, create_times):
+    FakeProcess.create_times = create_times
+    FakeProcess.loads = 0
+    monkeypatch.setattr(psutil, "Process", FakeProcess)
+
+
+def test_lookup_is_memoised_within_a_tick(monkeypatch):
+    setup_fake(monkeypatch, {10: 1.0})
+    cache = ProcessCache()
+    cache.begin_tick()
+    for _ in range(1000):
+        assert cache.name(10) == "proc10-1.0"
+    assert FakeProcess.loads == 1
+    assert cache.stats()["hits"] == 999
+
+
+def test_pid_reuse_reloads_entry(monkeypatch):
+    setup_fake(monkeypatch, {10: 1.0})
+    cache = ProcessCache()
+    cache.begin_tick()
+    assert cache.name(10) == "proc10-1.0"
+    FakeProcess.create_times[10] = 2.0
+    cache.begin_tick()
+    assert cache.name(10) == "proc10-2.0"
+    assert FakeProcess.loads == 2
+
+
+def test_lru_eviction_and_missing_process(monkeypatch):
+    setup_fake(monkeypatch, {1: 1.0, 2: 1.0, 3: 1.0})
+    cache = ProcessCache(maxsize=2)
+    cache.begin_tick()
+    for pid in (1, 2, 3):
+        cache.lookup(pid)
+    assert len(cache) == 2
+    assert cache.evictions == 1
+    assert cache.name(99) == "Unknown"
+
+
+def test_observe_invalidates_reused_pid(monkeypatch):
+    setup_fake(monkeypatch, {5: 1.0})
+    cache = ProcessCache()
+    cache.begin_tick()
+    cache.lookup(5)
+    cache.observe(5, 1.0)
+    assert len(cache) == 1
+    cache.observe(5, 9.0)
+    assert len(cache) == 0
@@ -0,0 +1,59 @@
+import os
+import shutil
+import socket
+from pathlib import Path
+
+from connection_monitor.procnet import ProcNetBackend, decode_addresses
+
+FIXTURES = Path(__file__).parent / "fixtures" / "proc"
+
+
+def make_proc(tmp_path, sockets):
+    root = tmp_path / "proc"
+    shutil.copytree(FIXTURES, root)
+    for pid, inodes in sockets.items():
+        fd_dir = root / str(pid) / "fd"
+        fd_dir.mkdir(parents=True)
+        os.symlink("/dev/null", fd_dir / "0")
+        for fd, inode in enumerate(inodes, start=3):
+            os.symlink(f"socket:[{inode}]", fd_dir / str(fd))
+    return root
+
+
+def test_decode_addresses():
+    assert decode_addresses(["0100007F", "22D8B85D"], socket.AF_INET) == ["127.0.0.1", "93.184.216.34"]
+    assert decode_addresses(["00000000000000000000000001000000"], socket.AF_INET6) == ["::1"]
+
+
+def test_collect_from_fixture(tmp_path):
+    backend = ProcNetBackend(str(make_proc(tmp_path, {100: [1002, 1003], 200: [2002]})))
+
+    connections, limited = backend.collect()
+
+    assert not limited
+    rows = [(c.pid, c.proto, c.local, c.remote, c.status) for c in connections]
+    assert rows == [
+        (100, "tcp", "10.0.0.2:50000", "93.184.216.34:443", "ESTABLISHED"),
+        (100, "tcp", "10.0.0.2:50001", "93.184.216.34:443", "SYN_SENT"),
+        (None, "tcp", "10.0.0.2:50002", "192.168.1.1:80", "TIME_WAIT"),
+        (200, "tcp", "::1:8080", "::1:54321", "ESTABLISHED"),
+        (None, "tcp", "::ffff:10.0.0.2:50003", "::ffff:93.184.216.34:443", "CLOSE_WAIT"),
+    ]
+
+
+def test_inode_map_only_rescans_for_new_inodes(tmp_path):
+    root = make_proc(tmp_path, {100: [1002, 1003], 200: [2002, 2003]})
+    backend = ProcNetBackend(str(root))
+
+    backend.collect()
+    backend.collect()
+    assert backend.inodes.scans == 1
+
+    with open(root / "net" / "tcp", "a") as f:
+        f.write("   4: 0200000A:C354 22D8B85D:01BB 01 00000000:00000000 00:00000000 00000000  1000        0 1004 1\n")
+    (root / "300" / "fd").mkdir(parents=True)
+    os.symlink("socket:[1004]", root / "300" / "fd" / "3")
+
+    connections, _ = backend.collect()
+    assert backend.inodes.scans == 2
+    assert [c.pid for c in connections if c.laddr_port == 50004] == [300]
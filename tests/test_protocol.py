@@ -0,0 +1,87 @@
+import socket
+
+import pytest
+
+from connection_monitor.collector import Connection, Snapshot
+from connection_monitor.diff import DiffEngine
+from connection_monitor.protocol import ConnectionStream, pack, unpack
+
+
+def conn(port, status="ESTABLISHED"):
+    return Connection(10, "curl", socket.AF_INET, socket.SOCK_STREAM, "10.0.0.2", port, "1.1.1.1", 443, status)
+
+
+def apply(rows, patch):
+    for row in patch["added"]:
+        rows[row["id"]] = row
+    for row_id in patch["removed"]:
+        del rows[row_id]
+    for row in patch["updated"]:
+        rows[row["id"]] = row
+    rates = patch["rates"]
+    for i, row_id in enumerate(rates["id"]):
+        rows[row_id].update({column: rates[column][i] for column in rates if column != "id"})
+
+
+def test_patches_replay_to_the_snapshot():
+    engine = DiffEngine()
+    stream = ConnectionStream()
+    first = stream.update(engine.update(Snapshot([conn(1), conn(2)], 0.0)))
+    client = {}
+    apply(client, first)
+
+    patch = stream.update(engine.update(Snapshot([conn(2, "CLOSE_WAIT"), conn(3)], 1.0)))
+    assert patch["base"] == first["version"]
+    assert len(patch["removed"]) == 1
+    apply(client, patch)
+
+    snapshot = stream.snapshot()
+    assert snapshot["version"] == patch["version"]
+    assert sorted(client.values(), key=lambda row: row["id"]) == snapshot["rows"]
+
+
+def test_reset_keeps_version_monotonic():
+    stream = ConnectionStream()
+    stream.update(DiffEngine().update(Snapshot([conn(1)], 0.0)))
+    stream.reset()
+    assert stream.snapshot()["total"] == 0
+    assert stream.update(DiffEngine().update(Snapshot([conn(1)], 0.0)))["version"] == 2
+
+
+def test_initial_delta_starts_the_stream_over():
+    engine = DiffEngine()
+    stream = ConnectionStream()
+    client = {}
+    apply(client, stream.update(engine.update(Snapshot([conn(1), conn(2)], 0.0))))
+
+    engine.reset()
+    patch = stream.update(engine.update(Snapshot([conn(2), conn(3)], 1.0)))
+    assert len(patch["removed"]) == 2 and len(patch["added"]) == 2
+    apply(client, patch)
+    assert sorted(client.values(), key=lambda row: row["id"]) == stream.snapshot()["rows"]
+    assert stream.snapshot()["total"] == 2
+
+
+def test_columnar_encoding():
+    stream = ConnectionStream("columnar")
+    patch = stream.update(DiffEngine().update(Snapshot([conn(1), conn(2)], 0.0)))
+    assert patch["added"]["local"] == ["10.0.0.2:1", "10.0.0.2:2"]
+    assert unpack(pack(patch, "columnar"), "columnar") == patch
+
+
+def test_unknown_encoding():
+    with pytest.raises(ValueError):
+        ConnectionStream("xml")
+
+
+def test_rates_travel_separately_from_row_changes():
+    engine = DiffEngine()
+    stream = ConnectionStream()
+    stream.update(engine.update(Snapshot([conn(1), conn(2)], 0.0)))
+    busy = conn(1)
+    busy.rx_rate = 2048.0
+    patch = stream.update(engine.update(Snapshot([busy, conn(2)], 1.0)))
+    assert patch["updated"] == []
+    assert patch["rates"]["id"] == [1]
+    assert patch["rates"]["rx_rate"] == [2048]
+    assert stream.snapshot()["rows"][0]["rx_rate"] == 2048
@@ -0,0 +1,86 @@
+import socket
+
+import pytest
+
+from connection_monitor.collector import Connection
+from connection_monitor.query import ConnectionIndex, Query, parse_query
+
+
+def conn(pid, process, lport, rip, rport, status="ESTABLISHED"):
+    return Connection(pid, process, socket.AF_INET, socket.SOCK_STREAM, "10.0.0.2", lport, rip, rport, status)
+
+
+ROWS = [
+    conn(1, "nginx", 443, "203.0.113.7", 51000),
+    conn(1, "nginx", 443, "203.0.113.9", 51001),
+    conn(2, "curl", 40000, "1.1.1.1", 443),
+    conn(2, "curl", 40001, "1.1.1.1", 443, "TIME_WAIT"),
+    conn(3, "ssh", 40002, "198.51.100.4", 22),
+]
+
+
+def search(**args):
+    return ConnectionIndex(ROWS).search(parse_query(args))
+
+
+def locals_of(page):
+    return [row["local"] for row in page["connections"]]
+
+
+def test_filters_use_the_indexes():
+    index = ConnectionIndex(ROWS)
+    positions, used = index.candidates(Query(pid=2, state="time_wait"))
+    assert (positions, used) == ([3], 2)
+    assert [c.laddr_port for c in index.select(Query(pid=2, state="time_wait"))] == [40001]
+
+    assert search(process="NGINX")["total"] == 2
+    assert search(cidr="203.0.113.0/24")["total"] == 2
+    assert search(cidr="1.1.1.1", state="ESTABLISHED")["total"] == 1
+    assert search(port="20-22")["total"] == 1
+    assert search(port="443", q="curl")["total"] == 2
+
+
+def test_sort_and_cursor_pagination():
+    first = search(sort="-local", limit="2")
+    assert locals_of(first) == ["10.0.0.2:40002", "10.0.0.2:40001"]
+    assert first["total"] == 5
+    second = search(sort="-local", limit="2", cursor=first["next_cursor"])
+    assert locals_of(second) == ["10.0.0.2:40000", "10.0.0.2:443"]
+    third = search(sort="-local", limit="2", cursor=second["next_cursor"])
+    # equal sort values continue in identity order
+    assert [row["remote"] for row in second["connections"] + third["connections"]][1:] == [
+        "203.0.113.9:51001",
+        "203.0.113.7:51000",
+    ]
+    assert third["next_cursor"] is None
+
+
+def test_cursor_survives_rows_changing():
+    index = ConnectionIndex(ROWS)
+    first = index.search(Query(sort="pid", limit=2))
+    # a row before the cursor closes between requests; paging carries on from the same place
+    second = ConnectionIndex(ROWS[1:]).search(Query(sort="pid", limit=2, cursor=first["next_cursor"]))
+    assert [row["pid"] for row in first["connections"] + second["connections"]] == ["1", "1", "2", "2"]
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        {"sort": "bogus"},
+        {"pid": "x"},
+        {"port": "70000"},
+        {"cidr": "10.0.0.0/33"},
+        {"limit": "0"},
+        {"cursor": "%%%"},
+        # payloads of the wrong shape, e.g. from a socket client
+        "state:LISTEN",
+        ["pid"],
+        {"sort": 3},
+        {"process": ["nginx"]},
+        {"pid": [1]},
+        {"limit": [5]},
+    ],
+)
+def test_parse_query_rejects_bad_input(args):
+    with pytest.raises(ValueError):
+        parse_query(args)
@@ -0,0 +1,103 @@
+import asyncio
+import socket
+import threading
+import time
+
+from connection_monitor.collector import Connection, Snapshot
+from connection_monitor.pipeline import Enrichment
+from connection_monitor.resolver import RateLimiter, ReverseResolver
+
+
+class StubResolver:
+    """Local stand-in for DNS: a fixed PTR table, counting queries."""
+
+    def __init__(self, records, ttl=None, delay=0.0):
+        self.records = records
+        self.ttl = ttl
+        self.delay = delay
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def __call__(self, ip):
+        with self.lock:
+            self.queries.append(ip)
+        time.sleep(self.delay)
+        return self.records.get(ip), self.ttl
+
+
+def conn(port, remote):
+    return Connection(10, "curl", socket.AF_INET, socket.SOCK_STREAM, "10.0.0.2", port, remote, 443, "ESTABLISHED")
+
+
+def test_concurrent_lookups_for_one_address_share_a_query():
+    stub = StubResolver({"151.101.1.1": "cdn.example"}, delay=0.05)
+    resolver = ReverseResolver(stub, rate=1000)
+    snapshot = Snapshot([conn(port, "151.101.1.1") for port in range(1, 5001)], 0.0)
+
+    missing = resolver.apply(snapshot)
+    assert missing == {"151.101.1.1"}
+
+    async def lookups():
+        return await asyncio.gather(*(resolver.reverse("151.101.1.1") for _ in range(50)))
+
+    assert set(asyncio.run(lookups())) == {"cdn.example"}
+    assert stub.queries == ["151.101.1.1"]
+
+    resolver.apply(snapshot)
+    assert {c.hostname for c in snapshot} == {"cdn.example"}
+    assert snapshot.connections[0].remote_name == "cdn.example:443"
+
+
+def test_positive_cache_respects_ttl():
+    stub = StubResolver({"1.1.1.1": "one.one.one.one"}, ttl=0.05)
+    resolver = ReverseResolver(stub, min_ttl=0, rate=1000)
+    assert asyncio.run(resolver.reverse("1.1.1.1")) == "one.one.one.one"
+    assert resolver.cached("1.1.1.1") == (True, "one.one.one.one")
+    time.sleep(0.06)
+    assert resolver.cached("1.1.1.1") == (False, None)
+
+
+def test_failures_are_negatively_cached():
+    stub = StubResolver({})
+    resolver = ReverseResolver(stub, negative_ttl=60, rate=1000)
+    assert asyncio.run(resolver.reverse("192.0.2.1")) is None
+    assert resolver.cached("192.0.2.1") == (True, None)
+    assert asyncio.run(resolver.reverse("192.0.2.1")) is None
+    assert stub.queries == ["192.0.2.1"]
+    assert resolver.stats()["failures"] == 1
+
+
+def test_lookup_errors_count_as_failures():
+    def broken(ip):
+        raise RuntimeError("resolver exploded")
+
+    resolver = ReverseResolver(broken, rate=1000)
+    assert asyncio.run(resolver.reverse("192.0.2.1")) is None
+    assert resolver.cached("192.0.2.1") == (True, None)
+
+
+def test_rate_limiter_spaces_out_tokens():
+    limiter = RateLimiter(rate=10, burst=2)
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == 0
+    assert 0.09 < limiter.reserve() <= 0.1
+    assert 0.19 < limiter.reserve() <= 0.2
+
+
+def test_enrichment_fills_hostnames_on_a_later_snapshot():
+    stub = StubResolver({"1.1.1.1": "one.one.one.one"})
+    enrichment = Enrichment([ReverseResolver(stub, rate=1000)])
+    enrichment.start()
+    try:
+        first = enrichment.apply(Snapshot([conn(1, "1.1.1.1")], 0.0))
+        assert first.connections[0].hostname is None
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            later = enrichment.apply(Snapshot([conn(1, "1.1.1.1")], 1.0))
+            if later.connections[0].hostname:
+                break
+            time.sleep(0.01)
+        assert later.connections[0].hostname == "one.one.one.one"
+        assert stub.queries == ["1.1.1.1"]
+    finally:
+        enrichment.stop()
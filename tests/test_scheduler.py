@@ -0,0 +1,69 @@
+import socket
+import threading
+
+import pytest
+
+from connection_monitor.collector import Connection, Snapshot
+from connection_monitor.diff import Delta
+from connection_monitor.scheduler import Scheduler
+
+
+def delta(churn):
+    conn = Connection(1, "x", socket.AF_INET, socket.SOCK_STREAM, "10.0.0.1", 1, "10.0.0.2", 2, "ESTABLISHED")
+    return Delta(Snapshot([], 0.0), [conn] * churn, [], [])
+
+
+def test_backs_off_when_idle_and_speeds_up_under_churn():
+    scheduler = Scheduler(interval=2.0, min_interval=0.5, max_interval=4.0, busy_churn=10)
+    assert scheduler.next_interval(0, 0.0) == 3.0
+    scheduler.interval = 3.0
+    assert scheduler.next_interval(0, 0.0) == 4.0
+    scheduler.interval = 4.0
+    assert scheduler.next_interval(100, 0.0) == 2.0
+    scheduler.interval = 0.5
+    assert scheduler.next_interval(100, 0.0) == 0.5
+    assert scheduler.next_interval(1, 0.0) == 1.25
+
+
+def test_cpu_budget_stretches_interval():
+    scheduler = Scheduler(interval=1.0, adaptive=False, cpu_budget=0.1)
+    assert scheduler.next_interval(0, 0.5) == pytest.approx(5.0)
+    assert scheduler.next_interval(0, 0.01) == 1.0
+
+
+def test_run_records_ticks_until_stopped():
+    scheduler = Scheduler(interval=0.01, min_interval=0.01, max_interval=0.01)
+
+    def tick():
+        if scheduler.ticks == 2:
+            scheduler.stop()
+        return delta(1)
+
+    thread = threading.Thread(target=scheduler.run, args=(tick,))
+    thread.start()
+    thread.join(2)
+    assert not thread.is_alive()
+    assert scheduler.ticks == 3
+    assert scheduler.stats()["churn"] == 1
+
+
+def test_invalid_budget():
+    with pytest.raises(ValueError):
+        Scheduler(cpu_budget=2)
+
+
+def test_ticks_without_a_delta_adapt_on_reported_churn():
+    scheduler = Scheduler(interval=0.01, min_interval=0.01, max_interval=0.04, busy_churn=10)
+    intervals = []
+
+    def tick():
+        intervals.append(scheduler.interval)
+        if scheduler.ticks == 0:
+            scheduler.report(delta(0))
+        elif scheduler.ticks == 2:
+            scheduler.stop()
+
+    scheduler.run(tick)
+    # backs off on the reported idle delta, then keeps the period while none is reported
+    assert intervals == [0.01, 0.015, 0.015]
+    assert scheduler.stats()["churn"] == 0
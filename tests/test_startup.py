@@ -0,0 +1,41 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# Modules the console path must not import: the other interfaces' toolkits and
+# the heavy standard library/optional modules only some features need
+HEAVY = ("flask", "flask_socketio", "wx", "asyncio", "urllib.request", "pyarrow")
+
+
+def run(code):
+    return subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+
+
+def test_console_path_imports_nothing_heavy():
+    result = run(
+        "import sys, main\n"
+        "available = [name for name in main.INTERFACES if main.interface_available(name)]\n"
+        "main.load_interface('console')\n"
+        f"print([name for name in {HEAVY!r} if name in sys.modules])\n"
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_console_monitor_starts_without_asyncio():
+    # the enrichment loop (and asyncio) only starts once a lookup is needed
+    result = run(
+        "import sys\n"
+        "from connection_monitor.console_monitor import ConsoleNetworkMonitor\n"
+        "monitor = ConsoleNetworkMonitor()\n"
+        "print('asyncio' in sys.modules, monitor.enrichment.loop)\n"
+    )
+    assert result.stdout.strip() == "False None"
+
+
+def test_interface_option():
+    result = subprocess.run(
+        [sys.executable, "main.py", "--interface", "gopher"], cwd=ROOT, capture_output=True, text=True
+    )
+    assert result.returncode == 2 and "console, web, wx" in result.stdout